@@ -2,13 +2,32 @@
 Система аналізу топ-постів та генерації рекомендацій
 """
 
+import asyncio
+import hashlib
+import json
 import logging
+import os
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from database import db
 
 logger = logging.getLogger(__name__)
 
+# Ліміт часу на AI-аналіз текстів під час генерації рекомендацій (с)
+RECOMMENDATION_AI_TIMEOUT = float(os.getenv("RECOMMENDATION_AI_TIMEOUT", "120"))
+
+# Максимум областей (користувач/сторінка), що аналізуються одночасно
+RECOMMENDATION_SCOPE_CONCURRENCY = int(os.getenv("RECOMMENDATION_SCOPE_CONCURRENCY", "3"))
+
+# Корзини довжини тексту для гістограми: ширина (символів) та кількість (остання - "і довше")
+LENGTH_BUCKET_SIZE = 100
+LENGTH_BUCKET_COUNT = 10
+
+# Згладжування середнього ER слоту: кількість "віртуальних" публікацій із загальним середнім,
+# щоб слот з однією вдалою публікацією не перемагав слот із сотнею стабільних
+ENGAGEMENT_PRIOR_WEIGHT = 3
+
 class AnalyticsRecommender:
     """Клас для аналізу патернів успішних постів та генерації рекомендацій"""
     
@@ -19,8 +38,48 @@ class AnalyticsRecommender:
         """
         self.min_engagement_threshold = min_engagement_threshold
     
+    def _top_posts_columns(self, metric: str) -> str:
+        """SQL-колонки топ-поста з агрегованою аналітикою (спільні для всіх запитів)"""
+        # Використовуємо AVG для engagement_rate, SUM для інших
+        aggregate = 'AVG' if metric == 'engagement_rate' else 'SUM'
+
+        return f"""
+                p.id,
+                p.content,
+                p.link,
+                p.image_urls,
+                COALESCE(pub.published_at, p.published_at) as published_at,
+                p.is_ai_generated,
+                {aggregate}(a.{metric}) as metric_value,
+                AVG(a.engagement_rate) as avg_engagement_rate,
+                SUM(a.likes) as total_likes,
+                SUM(a.comments) as total_comments,
+                SUM(a.shares) as total_shares,
+                SUM(a.impressions) as total_impressions,
+                AVG(a.hour_of_day) as hour_of_day,
+                AVG(a.day_of_week) as day_of_week,
+                AVG(a.text_length) as text_length,
+                MAX(a.has_link) as has_link,
+                MAX(a.has_images) as has_images,
+                AVG(a.image_count) as image_count"""
+
+    def _validate_metric(self, metric: str) -> str:
+        valid_metrics = ['engagement_rate', 'likes', 'comments', 'shares', 'impressions']
+        return metric if metric in valid_metrics else 'engagement_rate'
+
+    def _parse_post_row(self, row) -> Dict:
+        post = dict(row)
+        # Парсимо image_urls якщо є
+        if post.get('image_urls'):
+            try:
+                post['image_urls'] = json.loads(post['image_urls'])
+            except (TypeError, ValueError):
+                post['image_urls'] = []
+        return post
+
     def get_top_posts(self, period_days: int = 7, limit: int = 10, 
-                      metric: str = 'engagement_rate') -> List[Dict]:
+                      metric: str = 'engagement_rate', user_id: Optional[int] = None,
+                      page_id: Optional[str] = None) -> List[Dict]:
         """
         Отримує топ-пости за вказаний період
         
@@ -28,6 +87,8 @@ class AnalyticsRecommender:
             period_days: кількість днів для аналізу (за замовчуванням 7)
             limit: кількість постів для вибірки (за замовчуванням 10)
             metric: метрика для сортування ('engagement_rate', 'likes', 'comments', 'shares')
+            user_id: лише пости користувача (None - усі пости)
+            page_id: лише публікації на сторінці (None - усі сторінки)
         
         Returns:
             List[Dict]: список топ-постів з повною аналітикою
@@ -39,70 +100,394 @@ class AnalyticsRecommender:
         start_date = datetime.now() - timedelta(days=period_days)
         
         # Валідація метрики
-        valid_metrics = ['engagement_rate', 'likes', 'comments', 'shares', 'impressions']
-        if metric not in valid_metrics:
-            metric = 'engagement_rate'
-        
-        # Використовуємо AVG для engagement_rate, SUM для інших
-        aggregate = 'AVG' if metric == 'engagement_rate' else 'SUM'
+        metric = self._validate_metric(metric)
+
+        filters = ""
+        params = [start_date]
+        if user_id is not None:
+            filters += " AND p.user_id = ?"
+            params.append(user_id)
+        if page_id is not None:
+            filters += " AND pub.page_id = ?"
+            params.append(page_id)
+        params.append(limit)
         
         query = f"""
-            SELECT
-                p.id,
-                p.content,
-                p.link,
-                p.image_urls,
-                COALESCE(pub.published_at, p.published_at) as published_at,
-                p.is_ai_generated,
-                {aggregate}(a.{metric}) as metric_value,
-                AVG(a.engagement_rate) as avg_engagement_rate,
-                SUM(a.likes) as total_likes,
-                SUM(a.comments) as total_comments,
-                SUM(a.shares) as total_shares,
-                SUM(a.impressions) as total_impressions,
-                AVG(a.hour_of_day) as hour_of_day,
-                AVG(a.day_of_week) as day_of_week,
-                AVG(a.text_length) as text_length,
-                MAX(a.has_link) as has_link,
-                MAX(a.has_images) as has_images,
-                AVG(a.image_count) as image_count
+            SELECT {self._top_posts_columns(metric)}
             FROM posts p
             JOIN publications pub ON p.id = pub.post_id
             JOIN analytics a ON pub.id = a.publication_id
             WHERE pub.status = 'published'
-            AND pub.published_at >= ?
+            AND pub.published_at >= ?{filters}
             GROUP BY p.id
             HAVING metric_value > 0
                 OR (total_likes + total_comments + total_shares) > 0
-            ORDER BY metric_value DESC
+            ORDER BY metric_value DESC, p.id
             LIMIT ?
         """
 
-        cursor.execute(query, (start_date, limit))
+        cursor.execute(query, params)
         
-        posts = []
-        for row in cursor.fetchall():
-            post = dict(row)
-            # Парсимо image_urls якщо є
-            if post.get('image_urls'):
-                import json
-                try:
-                    post['image_urls'] = json.loads(post['image_urls'])
-                except:
-                    post['image_urls'] = []
-            posts.append(post)
+        posts = [self._parse_post_row(row) for row in cursor.fetchall()]
         
         conn.close()
         
         logger.info(f"Знайдено {len(posts)} топ-постів за останні {period_days} днів")
         return posts
+
+    def get_top_posts_by_scope(self, period_days: int = 7, limit: int = 10,
+                               metric: str = 'engagement_rate', by_page: bool = False) -> Dict[tuple, List[Dict]]:
+        """
+        Топ-пости одразу для всіх користувачів (або всіх сторінок користувачів) одним запитом
+
+        Агрегація аналітики та ранжування виконуються в SQLite:
+        ROW_NUMBER() OVER (PARTITION BY user_id[, page_id]) відбирає
+        топ-N постів у кожній області замість окремого сканування на користувача.
+
+        Args:
+            period_days: кількість днів для аналізу
+            limit: кількість топ-постів в кожній області
+            metric: метрика для сортування
+            by_page: групувати також за сторінкою (інакше - по всіх сторінках користувача)
+
+        Returns:
+            Dict[tuple, List[Dict]]: {(user_id, page_id або None): топ-пости}
+        """
+        start_date = datetime.now() - timedelta(days=period_days)
+        metric = self._validate_metric(metric)
+
+        page_column = "pub.page_id" if by_page else "NULL"
+        page_group = ", pub.page_id" if by_page else ""
+
+        query = f"""
+            WITH post_metrics AS (
+                SELECT
+                    p.user_id as scope_user_id,
+                    {page_column} as scope_page_id,
+                    {self._top_posts_columns(metric)}
+                FROM posts p
+                JOIN publications pub ON p.id = pub.post_id
+                JOIN analytics a ON pub.id = a.publication_id
+                WHERE pub.status = 'published'
+                AND pub.published_at >= ?
+                AND p.user_id IS NOT NULL
+                GROUP BY p.user_id{page_group}, p.id
+                HAVING metric_value > 0
+                    OR (total_likes + total_comments + total_shares) > 0
+            ),
+            ranked AS (
+                SELECT *, ROW_NUMBER() OVER (
+                    PARTITION BY scope_user_id, scope_page_id
+                    ORDER BY metric_value DESC, id
+                ) as scope_rank
+                FROM post_metrics
+            )
+            SELECT * FROM ranked
+            WHERE scope_rank <= ?
+            ORDER BY scope_user_id, scope_page_id, scope_rank
+        """
+
+        conn = db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(query, (start_date, limit))
+
+        scopes: Dict[tuple, List[Dict]] = {}
+        for row in cursor.fetchall():
+            post = self._parse_post_row(row)
+            scope = (post.pop('scope_user_id'), post.pop('scope_page_id'))
+            post.pop('scope_rank')
+            scopes.setdefault(scope, []).append(post)
+
+        conn.close()
+
+        logger.info(f"Топ-пости для {len(scopes)} {'сторінок' if by_page else 'користувачів'} за один запит")
+        return scopes
+
+    # Водяний знак вхідних даних: будь-яка нова, змінена чи видалена аналітика періоду змінює його
+    _WATERMARK_COLUMNS = """
+        COUNT(*) as rows_count,
+        MAX(a.id) as max_id,
+        MAX(a.updated_at) as max_updated_at,
+        TOTAL(a.engagement_rate) as engagement_total"""
+
+    @staticmethod
+    def _format_watermark(row) -> str:
+        return f"{row['rows_count']}:{row['max_id']}:{row['max_updated_at']}:{row['engagement_total']:.6f}"
+
+    def get_data_watermark(self, period_days: int = 7, user_id: Optional[int] = None,
+                           page_id: Optional[str] = None) -> str:
+        """
+        Водяний знак аналітики періоду для області - один агрегат без сортування та групування по постах
+
+        Args:
+            period_days: кількість днів для аналізу
+            user_id: лише пости користувача (None - усі пости)
+            page_id: лише публікації на сторінці (None - усі сторінки)
+        """
+        filters = ""
+        params = [datetime.now() - timedelta(days=period_days)]
+        if user_id is not None:
+            filters += " AND p.user_id = ?"
+            params.append(user_id)
+        if page_id is not None:
+            filters += " AND pub.page_id = ?"
+            params.append(page_id)
+
+        conn = db.get_connection()
+        row = conn.execute(f"""
+            SELECT {self._WATERMARK_COLUMNS}
+            FROM posts p
+            JOIN publications pub ON p.id = pub.post_id
+            JOIN analytics a ON pub.id = a.publication_id
+            WHERE pub.status = 'published'
+            AND pub.published_at >= ?{filters}
+        """, params).fetchone()
+        conn.close()
+
+        return self._format_watermark(row)
+
+    def get_data_watermarks_by_scope(self, period_days: int = 7, by_page: bool = False) -> Dict[tuple, str]:
+        """
+        Водяні знаки всіх областей одним запитом (ті ж області, що й get_top_posts_by_scope)
+
+        Returns:
+            Dict[tuple, str]: {(user_id, page_id або None): водяний знак}
+        """
+        page_column = "pub.page_id" if by_page else "NULL"
+        page_group = ", pub.page_id" if by_page else ""
+
+        conn = db.get_connection()
+        rows = conn.execute(f"""
+            SELECT p.user_id as scope_user_id, {page_column} as scope_page_id, {self._WATERMARK_COLUMNS}
+            FROM posts p
+            JOIN publications pub ON p.id = pub.post_id
+            JOIN analytics a ON pub.id = a.publication_id
+            WHERE pub.status = 'published'
+            AND pub.published_at >= ?
+            AND p.user_id IS NOT NULL
+            GROUP BY p.user_id{page_group}
+        """, (datetime.now() - timedelta(days=period_days),)).fetchall()
+        conn.close()
+
+        return {(row['scope_user_id'], row['scope_page_id']): self._format_watermark(row) for row in rows}
+
+    def _get_data_fingerprint(self, period_days: int, limit: int, user_id: Optional[int],
+                              page_id: Optional[str], watermark: str) -> str:
+        """Відбиток запуску: параметри аналізу, область та водяний знак аналітики"""
+        payload = json.dumps([period_days, limit, user_id, page_id, watermark])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _find_reusable(self, data_fingerprint: str, use_ai: bool,
+                       user_id: Optional[int], page_id: Optional[str]) -> Optional[Dict]:
+        """Остання рекомендація області, якщо вона побудована на тих самих даних"""
+        previous = db.get_latest_recommendation(user_id, page_id, fallback=False)
+        if not previous or previous.get('data_fingerprint') != data_fingerprint:
+            return None
+        # Попередній запуск без AI-інсайтів (таймаут, помилка) повторюємо, якщо AI потрібен
+        if use_ai and previous['analyzed_posts_count'] >= 3 and not previous['recommendations'].get('ai_insights'):
+            return None
+        return previous
+
+    def _reused_result(self, previous: Dict, period_days: int,
+                       user_id: Optional[int], page_id: Optional[str]) -> Dict:
+        logger.info(f"Аналітика не змінилася - використано рекомендацію #{previous['id']}")
+        return {
+            'success': True,
+            'reused': True,
+            'recommendation_id': previous['id'],
+            'patterns': previous['patterns'],
+            'recommendations': previous['recommendations'],
+            'ai_insights': previous['recommendations'].get('ai_insights'),
+            'period_days': period_days,
+            'analyzed_count': previous['analyzed_posts_count'],
+            'user_id': user_id,
+            'page_id': page_id
+        }
+
+    def get_engagement_stats(self, period_days: int = 7, user_id: Optional[int] = None,
+                             page_id: Optional[str] = None, conn=None) -> Dict:
+        """
+        Статистика engagement по всій аналітиці періоду (а не лише топ-постах)
+
+        Один прохід GROUP BY у SQLite згортає всі публікації періоду в куб
+        (день тижня, година, корзина довжини, зображення, посилання) -> кількість
+        та сума engagement_rate. З куба (не більше кількох тисяч рядків) будуються
+        теплова карта година×день, гістограма довжин та приріст ER від зображень
+        і посилань.
+
+        Args:
+            period_days: кількість днів для аналізу
+            user_id: лише пости користувача (None - усі пости)
+            page_id: лише публікації на сторінці (None - усі сторінки)
+            conn: відкрите з'єднання (не закривається)
+
+        Returns:
+            Dict: кількість публікацій, середній ER, heatmap, hours, days, length_buckets,
+                  image_lift та link_lift (відносний приріст ER, None - немає з чим порівняти)
+        """
+        own_conn = conn is None
+        if own_conn:
+            conn = db.get_connection()
+
+        filters = ""
+        params = []
+        if user_id is not None:
+            filters += " AND p.user_id = ?"
+            params.append(user_id)
+        if page_id is not None:
+            filters += " AND pub.page_id = ?"
+            params.append(page_id)
+
+        try:
+            rows = self._query_engagement_cube(conn, period_days, filters=filters, params=params)
+        finally:
+            if own_conn:
+                conn.close()
+
+        return self._summarize_engagement_cube(rows)
+
+    def get_engagement_stats_by_scope(self, period_days: int = 7, by_page: bool = False) -> Dict[tuple, Dict]:
+        """
+        Статистика engagement одразу для всіх областей (ті ж області, що й get_top_posts_by_scope)
+
+        Один прохід GROUP BY з областю в ключі групування замість окремого
+        сканування аналітики періоду для кожного користувача чи сторінки.
+
+        Returns:
+            Dict[tuple, Dict]: {(user_id, page_id або None): статистика як у get_engagement_stats}
+        """
+        page_column = "pub.page_id" if by_page else "NULL"
+
+        conn = db.get_connection()
+        try:
+            rows = self._query_engagement_cube(
+                conn, period_days,
+                scope_columns=f"p.user_id as scope_user_id, {page_column} as scope_page_id,",
+                filters=" AND p.user_id IS NOT NULL"
+            )
+        finally:
+            conn.close()
+
+        cubes: Dict[tuple, List] = {}
+        for row in rows:
+            cubes.setdefault((row['scope_user_id'], row['scope_page_id']), []).append(row)
+
+        return {scope: self._summarize_engagement_cube(scope_rows) for scope, scope_rows in cubes.items()}
+
+    def _query_engagement_cube(self, conn, period_days: int, scope_columns: str = "",
+                               filters: str = "", params: Optional[List] = None) -> List:
+        """
+        Куб (область, день тижня, година, корзина довжини, зображення, посилання) ->
+        кількість публікацій, сума ER, сума та максимум довжини тексту
+
+        Args:
+            scope_columns: колонки області "... as scope_user_id, ... as scope_page_id," (порожньо - без областей)
+            filters: додаткові умови WHERE
+            params: параметри додаткових умов
+        """
+        scope_group = "scope_user_id, scope_page_id, " if scope_columns else ""
+        start_date = datetime.now() - timedelta(days=period_days)
+
+        # Година/день беремо з аналітики, а для старих записів - з часу публікації (0 = понеділок)
+        return conn.execute(f"""
+            SELECT {scope_group}day_of_week, hour_of_day, length_bucket, has_images, has_link,
+                   COUNT(*) as count,
+                   SUM(engagement_rate) as engagement_sum,
+                   SUM(text_length) as length_sum,
+                   MAX(text_length) as max_length
+            FROM (
+                SELECT {scope_columns}
+                       COALESCE(a.day_of_week, (CAST(strftime('%w', pub.published_at) AS INTEGER) + 6) % 7) as day_of_week,
+                       COALESCE(a.hour_of_day, CAST(strftime('%H', pub.published_at) AS INTEGER)) as hour_of_day,
+                       MIN(COALESCE(a.text_length, 0) / ?, ?) as length_bucket,
+                       COALESCE(a.has_images, 0) != 0 as has_images,
+                       COALESCE(a.has_link, 0) != 0 as has_link,
+                       COALESCE(a.engagement_rate, 0) as engagement_rate,
+                       COALESCE(a.text_length, 0) as text_length
+                FROM publications pub
+                JOIN posts p ON p.id = pub.post_id
+                JOIN analytics a ON a.publication_id = pub.id
+                WHERE pub.status = 'published'
+                AND pub.published_at >= ?{filters}
+            )
+            GROUP BY {scope_group}day_of_week, hour_of_day, length_bucket, has_images, has_link
+        """, [LENGTH_BUCKET_SIZE, LENGTH_BUCKET_COUNT - 1, start_date, *(params or [])]).fetchall()
+
+    def _summarize_engagement_cube(self, rows: List) -> Dict:
+        """Згортає рядки куба в теплову карту, години, дні, гістограму довжин та приріст ER"""
+        # Згортка куба: [кількість, сума ER]
+        total = [0, 0.0]
+        slots, hours, days, buckets = {}, {}, {}, {}
+        images = {True: [0, 0.0], False: [0, 0.0]}
+        links = {True: [0, 0.0], False: [0, 0.0]}
+
+        def add(acc, count, engagement_sum):
+            acc[0] += count
+            acc[1] += engagement_sum
+
+        for row in rows:
+            count, engagement_sum = row['count'], row['engagement_sum'] or 0.0
+            add(total, count, engagement_sum)
+            add(images[bool(row['has_images'])], count, engagement_sum)
+            add(links[bool(row['has_link'])], count, engagement_sum)
+
+            bucket = buckets.setdefault(row['length_bucket'], [0, 0.0, 0, 0])
+            add(bucket, count, engagement_sum)
+            bucket[2] += row['length_sum'] or 0
+            bucket[3] = max(bucket[3], row['max_length'] or 0)
+
+            day, hour = row['day_of_week'], row['hour_of_day']
+            if day is None or hour is None:
+                continue
+            add(slots.setdefault((int(day), int(hour)), [0, 0.0]), count, engagement_sum)
+            add(hours.setdefault(int(hour), [0, 0.0]), count, engagement_sum)
+            add(days.setdefault(int(day), [0, 0.0]), count, engagement_sum)
+
+        mean = total[1] / total[0] if total[0] else 0.0
+
+        def summarize(acc):
+            return {
+                'count': acc[0],
+                'avg_engagement_rate': round(acc[1] / acc[0], 4),
+                'score': (acc[1] + ENGAGEMENT_PRIOR_WEIGHT * mean) / (acc[0] + ENGAGEMENT_PRIOR_WEIGHT)
+            }
+
+        def lift(groups):
+            with_, without = groups[True], groups[False]
+            if not with_[0] or not without[0] or not without[1]:
+                return None
+            return round((with_[1] / with_[0]) / (without[1] / without[0]) - 1, 3)
+
+        length_buckets = []
+        for index, acc in sorted(buckets.items()):
+            low = index * LENGTH_BUCKET_SIZE
+            high = acc[3] if index == LENGTH_BUCKET_COUNT - 1 else low + LENGTH_BUCKET_SIZE - 1
+            length_buckets.append({
+                'min': low, 'max': high, 'avg_length': int(acc[2] / acc[0]), **summarize(acc)
+            })
+
+        return {
+            'publications_count': total[0],
+            'avg_engagement_rate': round(mean, 4),
+            'heatmap': [{'day': day, 'hour': hour, **summarize(acc)} for (day, hour), acc in sorted(slots.items())],
+            'hours': [{'hour': hour, **summarize(acc)} for hour, acc in sorted(hours.items())],
+            'days': [{'day': day, **summarize(acc)} for day, acc in sorted(days.items())],
+            'length_buckets': length_buckets,
+            'image_lift': lift(images),
+            'link_lift': lift(links)
+        }
     
-    def analyze_patterns(self, top_posts: List[Dict], lang: str = 'uk') -> Dict:
+    def analyze_patterns(self, top_posts: List[Dict], lang: str = 'uk',
+                         stats: Optional[Dict] = None) -> Dict:
         """
         Аналізує патерни успішних постів
         
         Args:
             top_posts: список топ-постів
+            lang: мова назв днів
+            stats: статистика всієї аналітики періоду (get_engagement_stats) - якщо є,
+                   час, довжина, зображення та посилання обираються за середнім ER,
+                   а не за частотою серед топ-постів
         
         Returns:
             Dict: виявлені патерни
@@ -170,9 +555,49 @@ class AnalyticsRecommender:
             'images_percentage': round(images_percentage, 1),
             'links_percentage': round(links_percentage, 1)
         }
+
+        if stats and stats.get('publications_count'):
+            self._apply_engagement_stats(patterns, stats, lang)
         
         logger.info(f"Патерни проаналізовано: {patterns}")
         return patterns
+
+    def _apply_engagement_stats(self, patterns: Dict, stats: Dict, lang: str):
+        """Уточнює патерни за статистикою всієї аналітики періоду"""
+        def best(items, n):
+            return sorted(items, key=lambda item: item['score'], reverse=True)[:n]
+
+        if stats['hours']:
+            patterns['best_posting_hours'] = [item['hour'] for item in best(stats['hours'], 3)]
+        if stats['days']:
+            patterns['best_days'] = [self._get_day_name(item['day'], lang) for item in best(stats['days'], 3)]
+
+        if stats['length_buckets']:
+            bucket = best(stats['length_buckets'], 1)[0]
+            patterns['optimal_text_length'] = {
+                'min': bucket['min'],
+                'max': max(bucket['max'], bucket['min']),
+                'avg': bucket['avg_length']
+            }
+
+        if stats['image_lift'] is not None:
+            patterns['use_images'] = stats['image_lift'] > 0
+        if stats['link_lift'] is not None:
+            patterns['use_links'] = stats['link_lift'] > 0
+
+        patterns.update({
+            'analyzed_publications_count': stats['publications_count'],
+            'image_lift': stats['image_lift'],
+            'link_lift': stats['link_lift'],
+            'heatmap': [
+                {key: item[key] for key in ('day', 'hour', 'count', 'avg_engagement_rate')}
+                for item in stats['heatmap']
+            ],
+            'length_buckets': [
+                {key: item[key] for key in ('min', 'max', 'count', 'avg_engagement_rate')}
+                for item in stats['length_buckets']
+            ]
+        })
     
     def generate_recommendations(self, patterns: Dict, lang: str = 'uk') -> Dict:
         """
@@ -251,7 +676,9 @@ class AnalyticsRecommender:
         return recommendations
     
     def save_recommendations(self, recommendations: Dict, patterns: Dict, 
-                            period_days: int = 7) -> bool:
+                            period_days: int = 7, input_fingerprint: Optional[str] = None,
+                            user_id: Optional[int] = None, page_id: Optional[str] = None,
+                            data_fingerprint: Optional[str] = None) -> bool:
         """
         Зберігає рекомендації в базу даних
         
@@ -259,6 +686,10 @@ class AnalyticsRecommender:
             recommendations: згенеровані рекомендації
             patterns: виявлені патерни
             period_days: період аналізу
+            input_fingerprint: відбиток набору проаналізованих постів
+            user_id: користувач, для якого побудовано рекомендації (None - загальні)
+            page_id: сторінка користувача (None - усі сторінки)
+            data_fingerprint: відбиток запуску з водяним знаком аналітики
         
         Returns:
             bool: успішність збереження
@@ -277,7 +708,11 @@ class AnalyticsRecommender:
                 analyzed_posts_count=patterns['analyzed_posts_count'],
                 recommendations=recommendations,
                 patterns=patterns,
-                status='completed'
+                status='completed',
+                input_fingerprint=input_fingerprint,
+                user_id=user_id,
+                page_id=page_id,
+                data_fingerprint=data_fingerprint
             )
             
             logger.info(f"✓ Рекомендації збережено в БД (ID: {recommendation_id})")
@@ -288,6 +723,11 @@ class AnalyticsRecommender:
             logger.error(f"Помилка збереження рекомендацій: {str(e)}")
             return False
     
+    def _get_input_fingerprint(self, top_posts: List[Dict], lang: str) -> str:
+        """Відбиток набору проаналізованих постів (ID постів та мова аналізу)"""
+        post_ids = sorted(post['id'] for post in top_posts)
+        return hashlib.sha256(json.dumps([lang, post_ids]).encode('utf-8')).hexdigest()
+
     def _get_day_name(self, day_index: int, lang: str = 'uk') -> str:
         """Конвертує номер дня в назву"""
         if lang == 'en':
@@ -358,22 +798,80 @@ class AnalyticsRecommender:
             'links_percentage': 0.0
         }
     
+    def _detect_lang(self, top_posts: List[Dict]) -> str:
+        """Визначає мову постів за першими трьома текстами"""
+        sample_text = ' '.join([p.get('content', '')[:100] for p in top_posts[:3]])
+        # Check for common English words
+        en_indicators = ['the', 'and', 'for', 'with', 'our', 'your', 'this', 'that', 'are', 'was', 'were', 'have', 'has', 'been']
+        return 'en' if any(f' {word} ' in f' {sample_text.lower()} ' for word in en_indicators) else 'uk'
+
+    def _analyze_and_recommend(self, top_posts: List[Dict], lang: str,
+                               stats: Optional[Dict] = None) -> tuple:
+        """Патерни та базові рекомендації (CPU-робота, виконується поза event loop)"""
+        patterns = self.analyze_patterns(top_posts, lang, stats)
+        recommendations = self.generate_recommendations(patterns, lang)
+        return patterns, recommendations
+
     def get_full_analysis(self, period_days: int = 7, limit: int = 10, use_ai: bool = True) -> Dict:
         """
+        Синхронна обгортка над get_full_analysis_async (для скриптів та CLI)
+
+        Не викликати з event loop - там використовуйте get_full_analysis_async.
+        """
+        return asyncio.run(self.get_full_analysis_async(period_days, limit, use_ai))
+
+    async def get_full_analysis_async(self, period_days: int = 7, limit: int = 10, use_ai: bool = True,
+                                      ai_timeout: Optional[float] = None, user_id: Optional[int] = None,
+                                      page_id: Optional[str] = None,
+                                      top_posts: Optional[List[Dict]] = None,
+                                      data_watermark: Optional[str] = None,
+                                      engagement_stats: Optional[Dict] = None) -> Dict:
+        """
         Виконує повний цикл аналізу та генерації рекомендацій
-        
+
+        Читання/запис БД та обчислення патернів виконуються в потоках,
+        AI-аналіз очікується асинхронно з обмеженням часу - event loop
+        сервера не блокується.
+
+        Запуск інкрементальний: якщо водяний знак аналітики області не змінився
+        з попереднього запуску, повертається збережена рекомендація без
+        сканування постів; якщо змінились лише метрики тих самих постів -
+        перераховується статистика, а AI-аналіз береться з попереднього запуску.
+
         Args:
             period_days: період для аналізу
             limit: кількість топ-постів
             use_ai: використовувати AI для глибокого аналізу текстів
-        
+            ai_timeout: ліміт часу на AI-аналіз у секундах (за замовчуванням RECOMMENDATION_AI_TIMEOUT)
+            user_id: аналізувати лише пости користувача (None - усі пости)
+            page_id: аналізувати лише публікації на сторінці (None - усі сторінки)
+            top_posts: вже відібрані топ-пости області (з get_top_posts_by_scope)
+            data_watermark: вже обчислений водяний знак області (з get_data_watermarks_by_scope)
+            engagement_stats: вже обчислена статистика області (з get_engagement_stats_by_scope)
+
         Returns:
             Dict: повний аналіз з рекомендаціями
         """
+        if ai_timeout is None:
+            ai_timeout = RECOMMENDATION_AI_TIMEOUT
+
         logger.info(f"Початок аналізу топ-постів за {period_days} днів...")
+
+        # Крок 0: чи змінилась аналітика з попереднього запуску
+        if data_watermark is None:
+            data_watermark = await asyncio.to_thread(self.get_data_watermark, period_days, user_id, page_id)
+        data_fingerprint = self._get_data_fingerprint(period_days, limit, user_id, page_id, data_watermark)
+
+        previous = await asyncio.to_thread(self._find_reusable, data_fingerprint, use_ai, user_id, page_id)
+        if previous:
+            return self._reused_result(previous, period_days, user_id, page_id)
         
         # Крок 1: Отримати топ-пости
-        top_posts = self.get_top_posts(period_days=period_days, limit=limit)
+        if top_posts is None:
+            top_posts = await asyncio.to_thread(
+                self.get_top_posts, period_days=period_days, limit=limit,
+                user_id=user_id, page_id=page_id
+            )
         
         if not top_posts:
             logger.warning("Недостатньо даних для аналізу")
@@ -384,25 +882,35 @@ class AnalyticsRecommender:
             }
         
         # Auto-detect language from posts
-        sample_text = ' '.join([p.get('content', '')[:100] for p in top_posts[:3]])
-        # Check for common English words
-        en_indicators = ['the', 'and', 'for', 'with', 'our', 'your', 'this', 'that', 'are', 'was', 'were', 'have', 'has', 'been']
-        lang = 'en' if any(f' {word} ' in f' {sample_text.lower()} ' for word in en_indicators) else 'uk'
+        lang = self._detect_lang(top_posts)
 
-        # Крок 2: Аналізувати патерни з мовою
-        patterns = self.analyze_patterns(top_posts, lang)
+        # Кроки 2-3: Патерни (за всією аналітикою періоду) та базові рекомендації з мовою
+        stats = engagement_stats
+        if stats is None:
+            stats = await asyncio.to_thread(
+                self.get_engagement_stats, period_days=period_days, user_id=user_id, page_id=page_id
+            )
+        patterns, recommendations = await asyncio.to_thread(self._analyze_and_recommend, top_posts, lang, stats)
 
-        # Крок 3: Генерувати базові рекомендації з мовою
-        recommendations = self.generate_recommendations(patterns, lang)
+        # Відбиток набору постів - якщо він не змінився, AI-аналіз не повторюємо
+        input_fingerprint = self._get_input_fingerprint(top_posts, lang)
 
         # Крок 4: AI-аналіз текстів (якщо ввімкнено і достатньо постів)
         ai_insights = None
-        if use_ai and len(top_posts) >= 3:
+        previous = None
+        if use_ai:
+            previous = await asyncio.to_thread(db.get_recommendation_by_fingerprint, input_fingerprint)
+
+        if previous and previous['recommendations'].get('ai_insights'):
+            ai_insights = previous['recommendations']['ai_insights']
+            recommendations['ai_insights'] = ai_insights
+            logger.info(f"Набір постів не змінився - використано AI-аналіз рекомендації #{previous['id']}")
+        elif use_ai and len(top_posts) >= 3:
             try:
-                from text_generator import analyze_successful_posts_sync
+                from text_generator import analyze_top_posts
 
                 logger.info("Запуск AI-аналізу текстів постів...")
-                ai_result = analyze_successful_posts_sync(top_posts, lang=lang)
+                ai_result = await analyze_top_posts(top_posts, lang=lang, timeout=ai_timeout)
 
                 if ai_result.get('success'):
                     ai_insights = ai_result.get('analysis', {})
@@ -415,7 +923,10 @@ class AnalyticsRecommender:
                 logger.error(f"Помилка AI-аналізу: {str(e)}")
         
         # Крок 5: Зберегти результати
-        self.save_recommendations(recommendations, patterns, period_days)
+        await asyncio.to_thread(
+            self.save_recommendations, recommendations, patterns, period_days, input_fingerprint,
+            user_id, page_id, data_fingerprint
+        )
         
         logger.info("Аналіз завершено успішно")
         
@@ -426,7 +937,106 @@ class AnalyticsRecommender:
             'recommendations': recommendations,
             'ai_insights': ai_insights,
             'period_days': period_days,
-            'analyzed_count': len(top_posts)
+            'analyzed_count': len(top_posts),
+            'user_id': user_id,
+            'page_id': page_id
+        }
+
+    async def generate_scoped_recommendations_async(self, period_days: int = 7, limit: int = 10,
+                                                    use_ai: bool = True, by_page: bool = True,
+                                                    progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """
+        Генерує рекомендації для кожного користувача та (опційно) кожної його сторінки
+
+        Спершу одним агрегатом обчислюються водяні знаки аналітики всіх
+        областей: області, дані яких не змінились, отримують збережену
+        рекомендацію без подальшої роботи. Для решти топ-пости відбираються
+        запитами з віконними функціями, а статистика engagement - одним
+        GROUP BY (по користувачах і по сторінках), і області аналізуються паралельно
+        (не більше RECOMMENDATION_SCOPE_CONCURRENCY одночасно).
+
+        Args:
+            period_days: період для аналізу
+            limit: кількість топ-постів в кожній області
+            use_ai: використовувати AI для аналізу текстів
+            by_page: будувати також рекомендації для окремих сторінок
+            progress: callback(оброблено, всього)
+
+        Returns:
+            Dict: кількість областей та результати по кожній
+        """
+        watermarks = await asyncio.to_thread(self.get_data_watermarks_by_scope, period_days)
+        if by_page:
+            watermarks.update(await asyncio.to_thread(self.get_data_watermarks_by_scope, period_days, True))
+
+        def split_scopes():
+            reused, stale = {}, set()
+            for (user_id, page_id), watermark in watermarks.items():
+                fingerprint = self._get_data_fingerprint(period_days, limit, user_id, page_id, watermark)
+                previous = self._find_reusable(fingerprint, use_ai, user_id, page_id)
+                if previous:
+                    reused[(user_id, page_id)] = previous
+                else:
+                    stale.add((user_id, page_id))
+            return reused, stale
+
+        reused, stale = await asyncio.to_thread(split_scopes)
+
+        # Топ-пости та статистика engagement - лише якщо є області зі зміненими даними,
+        # по одному груповому проходу на рівень (користувачі, сторінки)
+        scopes, scope_stats = {}, {}
+        for level_by_page in (False, True):
+            if any((page_id is not None) == level_by_page for _, page_id in stale):
+                scopes.update(await asyncio.to_thread(
+                    self.get_top_posts_by_scope, period_days=period_days, limit=limit, by_page=level_by_page
+                ))
+                scope_stats.update(await asyncio.to_thread(
+                    self.get_engagement_stats_by_scope, period_days=period_days, by_page=level_by_page
+                ))
+        scopes = {scope: top_posts for scope, top_posts in scopes.items() if scope in stale}
+
+        semaphore = asyncio.Semaphore(RECOMMENDATION_SCOPE_CONCURRENCY)
+        done = len(reused)
+
+        async def analyze_scope(scope: tuple, top_posts: List[Dict]) -> Dict:
+            nonlocal done
+            user_id, page_id = scope
+            async with semaphore:
+                try:
+                    result = await self.get_full_analysis_async(
+                        period_days=period_days, limit=limit, use_ai=use_ai,
+                        user_id=user_id, page_id=page_id, top_posts=top_posts,
+                        data_watermark=watermarks[scope],
+                        engagement_stats=scope_stats.get(scope) or self._summarize_engagement_cube([])
+                    )
+                    outcome = {'success': result['success'], 'analyzed_count': result.get('analyzed_count', 0)}
+                except Exception as e:
+                    logger.error(f"Помилка рекомендацій для користувача {user_id}, сторінки {page_id}: {str(e)}")
+                    outcome = {'success': False, 'error': str(e)}
+
+            done += 1
+            if progress:
+                progress(done, len(reused) + len(scopes))
+            return {'user_id': user_id, 'page_id': page_id, **outcome}
+
+        results = [
+            {'user_id': user_id, 'page_id': page_id, 'success': True, 'reused': True,
+             'analyzed_count': previous['analyzed_posts_count']}
+            for (user_id, page_id), previous in reused.items()
+        ]
+        results += await asyncio.gather(*(
+            analyze_scope(scope, top_posts) for scope, top_posts in scopes.items()
+        ))
+
+        completed = sum(1 for result in results if result['success'])
+        logger.info(f"Рекомендації по областях: {completed} з {len(results)} (без змін: {len(reused)})")
+
+        return {
+            'success': True,
+            'scopes_count': len(results),
+            'completed': completed,
+            'reused': len(reused),
+            'results': results
         }
 
 
@@ -455,5 +1065,213 @@ def test_recommender():
         print(f"\n✗ {result['message']}")
 
 
+async def test_event_loop_responsiveness(period_days: int = 30, limit: int = 10, posts: int = 200,
+                                         llm_latency_ms: float = 2000, tick_interval: float = 0.05,
+                                         max_lag_ms: float = 250) -> Dict:
+    """
+    Перевіряє, що генерація рекомендацій не блокує event loop
+
+    Тимчасова БД заповнюється posts опублікованими постами з аналітикою,
+    AI-аналіз виконує локальний StubProvider із затримкою llm_latency_ms.
+    Поки виконується get_full_analysis_async, паралельно працюють:
+    - таймер, що кожні tick_interval секунд вимірює затримку event loop;
+    - "API-запити": читання постів і останньої рекомендації з тієї ж БД.
+
+    Raises:
+        AssertionError: аналіз не вдався, AI не викликався, event loop
+            затримувався понад max_lag_ms або обслужено замало запитів
+
+    Returns:
+        Dict: тривалість аналізу, кількість тіків і запитів, максимальні затримки (мс)
+    """
+    import random
+    import tempfile
+    import text_generator
+    from database import Database
+    from llm_client import LLMClient, StubProvider
+
+    global db
+    random.seed(42)
+    now = datetime.now()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = Database(os.path.join(tmp_dir, "loop_check.sqlite"))
+        conn = database.get_connection()
+        for post_id in range(1, posts + 1):
+            published_at = now - timedelta(minutes=random.randint(60, period_days * 24 * 60 - 60))
+            conn.execute("INSERT INTO posts (id, content, status) VALUES (?, ?, 'published')",
+                         (post_id, f"Пост {post_id}: " + "текст " * random.randint(5, 150)))
+            conn.execute(
+                "INSERT INTO publications (id, post_id, page_id, page_name, status, published_at) "
+                "VALUES (?, ?, 'loop_page', 'Loop', 'published', ?)",
+                (post_id, post_id, published_at)
+            )
+            conn.execute(
+                "INSERT INTO analytics (publication_id, likes, impressions, engagement_rate, hour_of_day, day_of_week) "
+                "VALUES (?, ?, 1000, ?, ?, ?)",
+                (post_id, random.randint(1, 200), 0.02 + random.random() * 0.2, published_at.hour, published_at.weekday())
+            )
+        conn.commit()
+        conn.close()
+
+        llm = LLMClient([StubProvider(latency_ms=llm_latency_ms)], max_retries=1)
+        saved_db, saved_llm = db, text_generator.llm_client
+        db, text_generator.llm_client = database, llm
+
+        ticks = 0
+        requests_served = 0
+        max_lag = 0.0
+        max_request = 0.0
+        done = asyncio.Event()
+
+        async def measure_loop():
+            nonlocal ticks, max_lag
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(tick_interval)
+                max_lag = max(max_lag, time.perf_counter() - start - tick_interval)
+                ticks += 1
+
+        async def serve_requests():
+            nonlocal requests_served, max_request
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.to_thread(database.get_all_posts, limit=20)
+                await asyncio.to_thread(database.get_latest_recommendation)
+                max_request = max(max_request, time.perf_counter() - start)
+                requests_served += 1
+                await asyncio.sleep(tick_interval)
+
+        workers = [asyncio.create_task(measure_loop()), asyncio.create_task(serve_requests())]
+        start = time.perf_counter()
+        try:
+            result = await recommender.get_full_analysis_async(period_days=period_days, limit=limit)
+        finally:
+            done.set()
+            await asyncio.gather(*workers)
+            db, text_generator.llm_client = saved_db, saved_llm
+        elapsed = time.perf_counter() - start
+
+    report = {
+        'analysis_success': result['success'],
+        'analysis_seconds': round(elapsed, 2),
+        'llm_calls': llm.get_stats()[llm.providers[0].name]['requests'],
+        'loop_ticks': ticks,
+        'requests_served': requests_served,
+        'max_loop_lag_ms': round(max_lag * 1000, 1),
+        'max_request_ms': round(max_request * 1000, 1)
+    }
+
+    print("="*70)
+    print("Тест чутливості event loop під час генерації рекомендацій")
+    print("="*70)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+
+    # Вільний event loop встигає щонайменше половину тіків за час аналізу
+    min_ticks = int(elapsed / tick_interval / 2)
+    assert report['analysis_success'], f"Аналіз не вдався: {result.get('message')}"
+    assert report['llm_calls'] >= 1, "AI-аналіз не викликав провайдера"
+    assert ticks >= min_ticks, f"Event loop зробив {ticks} тіків замість щонайменше {min_ticks}"
+    assert report['max_loop_lag_ms'] < max_lag_ms, \
+        f"Затримка event loop {report['max_loop_lag_ms']} мс перевищує {max_lag_ms} мс"
+    assert requests_served >= min_ticks // 2, f"Обслужено лише {requests_served} API-запитів"
+
+    print(f"\n✓ Максимальна затримка event loop: {report['max_loop_lag_ms']} мс")
+    return report
+
+
+def benchmark_pattern_analysis(rows: int = 100000, period_days: int = 90) -> Dict:
+    """
+    Порівнює аналіз патернів по всій аналітиці періоду: GROUP BY у SQLite
+    (get_engagement_stats) проти вибірки всіх рядків і підрахунку списками
+    та словниками в Python (як analyze_patterns по топ-постах)
+
+    Args:
+        rows: кількість публікацій з аналітикою у тимчасовій БД
+        period_days: період, за який розподілені публікації
+
+    Returns:
+        Dict: час обох варіантів у мілісекундах
+    """
+    import random
+    import tempfile
+    from database import Database
+
+    random.seed(42)
+    now = datetime.now()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = Database(os.path.join(tmp_dir, "bench.sqlite"))
+        conn = database.get_connection()
+
+        published = [now - timedelta(minutes=random.randint(0, period_days * 24 * 60 - 1)) for _ in range(rows)]
+        conn.executemany(
+            "INSERT INTO posts (id, content, status) VALUES (?, 'bench', 'published')",
+            ((i,) for i in range(1, rows + 1))
+        )
+        conn.executemany(
+            "INSERT INTO publications (id, post_id, page_id, page_name, status, published_at) "
+            "VALUES (?, ?, 'bench_page', 'Bench', 'published', ?)",
+            ((i, i, published[i - 1]) for i in range(1, rows + 1))
+        )
+        conn.executemany(
+            "INSERT INTO analytics (publication_id, likes, impressions, engagement_rate, text_length, "
+            "has_link, has_images, image_count, hour_of_day, day_of_week) VALUES (?, ?, 1000, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                (i, random.randint(0, 200), random.random() * 0.2, random.randint(20, 1500),
+                 random.random() < 0.3, images > 0, images, published[i - 1].hour, published[i - 1].weekday())
+                for i in range(1, rows + 1)
+                for images in (random.randint(0, 3),)
+            )
+        )
+        conn.commit()
+
+        # Python: усі рядки в пам'ять, далі лічильники по годинах/днях/довжинах
+        start = time.perf_counter()
+        fetched = [dict(row) for row in conn.execute("""
+            SELECT a.engagement_rate, a.text_length, a.has_link, a.has_images, a.hour_of_day, a.day_of_week
+            FROM publications pub JOIN analytics a ON a.publication_id = pub.id
+            WHERE pub.status = 'published' AND pub.published_at >= ?
+        """, (now - timedelta(days=period_days),))]
+        hour_sums, day_sums, length_sums = {}, {}, {}
+        for row in fetched:
+            for acc, key in ((hour_sums, row['hour_of_day']), (day_sums, row['day_of_week']),
+                             (length_sums, min(row['text_length'] // LENGTH_BUCKET_SIZE, LENGTH_BUCKET_COUNT - 1))):
+                count, total = acc.get(key, (0, 0.0))
+                acc[key] = (count + 1, total + row['engagement_rate'])
+        with_images = [row['engagement_rate'] for row in fetched if row['has_images']]
+        with_links = [row['engagement_rate'] for row in fetched if row['has_link']]
+        python_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        stats = recommender.get_engagement_stats(period_days=period_days, conn=conn)
+        sql_ms = (time.perf_counter() - start) * 1000
+
+        conn.close()
+
+    result = {
+        'rows': rows,
+        'analyzed_publications': stats['publications_count'],
+        'python_ms': round(python_ms, 1),
+        'sql_group_by_ms': round(sql_ms, 1),
+        'speedup': round(python_ms / sql_ms, 1) if sql_ms else None
+    }
+
+    print(f"Публікацій з аналітикою:     {result['analyzed_publications']} з {rows}")
+    print(f"Python (рядки + лічильники): {result['python_ms']} мс")
+    print(f"SQLite GROUP BY:             {result['sql_group_by_ms']} мс")
+    print(f"Прискорення:                 x{result['speedup']}")
+
+    return result
+
+
 if __name__ == "__main__":
-    test_recommender()
\ No newline at end of file
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "loop-check":
+        asyncio.run(test_event_loop_responsiveness())
+    elif len(sys.argv) > 1 and sys.argv[1] == "bench-patterns":
+        benchmark_pattern_analysis(int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
+    else:
+        test_recommender()
\ No newline at end of file
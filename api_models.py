@@ -11,7 +11,7 @@ class PostCreate(BaseModel):
     link: Optional[str] = None
     is_ai_generated: bool = False
     ai_prompt: Optional[str] = None
-    scheduled_time: Optional[str] = None
+    scheduled_time: Optional[str] = None  # ISO-час або "auto" - найкращий вільний слот сторінок
     page_ids: List[str]
     image_urls: Optional[List[str]] = []
 
@@ -28,6 +28,17 @@ class AIGenerateRequest(BaseModel):
     max_length: int = 500
     use_recommendations: bool = True
     lang: str = 'uk'
+    fresh: bool = False  # Не брати відповідь з кешу - новий варіант тексту
+
+
+class AIGenerateBatchRequest(BaseModel):
+    prompts: List[str] = []  # Окремий промпт для кожної чернетки
+    topic: Optional[str] = None  # Або одна тема ...
+    variants: int = 5  # ... з кількома варіантами тексту
+    min_length: int = 100
+    max_length: int = 500
+    use_recommendations: bool = True
+    lang: str = 'uk'
 
 
 class TemplateCreate(BaseModel):
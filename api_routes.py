@@ -3,10 +3,12 @@ API маршрути для FastAPI сервера
 """
 
 from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Header
-from fastapi.responses import RedirectResponse, Response
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from datetime import datetime
 import logging
 import asyncio
+import json
+import time
 import os
 import shutil
 import uuid
@@ -17,9 +19,13 @@ from database import db
 from facebook_config import fb_config
 from facebook_manager import FacebookManager
 from facebook_analytics import get_post_analytics
-from text_generator import generate_post_text
+from text_generator import generate_post_text, stream_post_text
+from background_jobs import job_manager
+from page_tokens import page_token_registry, is_invalid_token_error
+from auto_scheduler import auto_scheduler
+from response_cache import cached_json_response
 from api_models import (
-    PostCreate, PostUpdate, AIGenerateRequest,
+    PostCreate, PostUpdate, AIGenerateRequest, AIGenerateBatchRequest,
     TemplateCreate, TokenUpdate, PageAdd, UserLogin, FacebookAppCredentials
 )
 from auth_google import GoogleOAuth, JWTHandler
@@ -31,6 +37,18 @@ logger = logging.getLogger(__name__)
 # Тимчасове сховище для OAuth state
 oauth_states = {}
 
+# Максимум одночасних запитів до Facebook при публікації/видаленні на кількох сторінках
+PAGE_FANOUT_CONCURRENCY = int(os.getenv("PAGE_FANOUT_CONCURRENCY", "5"))
+
+# Паралельна генерація шаблонів: максимум одночасних викликів AI та ліміт часу на виклик (с)
+TEMPLATE_GENERATION_CONCURRENCY = int(os.getenv("TEMPLATE_GENERATION_CONCURRENCY", "3"))
+TEMPLATE_GENERATION_TIMEOUT = float(os.getenv("TEMPLATE_GENERATION_TIMEOUT", "60"))
+
+# Пакетна генерація чернеток: максимум чернеток у запиті, одночасних викликів AI та ліміт часу (с)
+BATCH_GENERATION_MAX_ITEMS = int(os.getenv("BATCH_GENERATION_MAX_ITEMS", "50"))
+BATCH_GENERATION_CONCURRENCY = int(os.getenv("BATCH_GENERATION_CONCURRENCY", "4"))
+BATCH_GENERATION_TIMEOUT = float(os.getenv("BATCH_GENERATION_TIMEOUT", "90"))
+
 # Директорія для завантажень
 UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -85,6 +103,18 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> int:
         )
 
 
+async def get_optional_user(authorization: Optional[str] = Header(None)) -> Optional[int]:
+    """
+    Dependency для эндпоинтов, доступных и без авторизации
+
+    Returns:
+        Optional[int]: user_id или None, если заголовок Authorization не передан
+    """
+    if not authorization:
+        return None
+    return await get_current_user(authorization)
+
+
 # ==================== АВТОРИЗАЦИЯ ====================
 
 @router.get("/auth/google/login")
@@ -319,21 +349,8 @@ async def refresh_facebook_pages(user_id: int = Depends(get_current_user)):
         # Отримуємо свіжий список сторінок з Facebook
         pages = await FacebookOAuth.get_user_pages(token_info['token'])
 
-        # Видаляємо старі сторінки користувача
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM user_facebook_pages WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
-
-        # Зберігаємо нові сторінки
-        for page in pages:
-            db.add_user_facebook_page(
-                user_id=user_id,
-                page_id=page['id'],
-                page_name=page['name'],
-                access_token=page['access_token']
-            )
+        # Замінюємо старі сторінки користувача новими
+        db.replace_user_facebook_pages(user_id, pages)
 
         logger.info(f"✓ Оновлено список сторінок для користувача {user_id}: {len(pages)} сторінок")
 
@@ -406,16 +423,46 @@ async def delete_image(filename: str):
 # ==================== ПОСТИ ====================
 
 @router.get("/posts")
-async def get_posts(limit: int = 50, offset: int = 0, user_id: int = Depends(get_current_user)):
-    """Отримує список постів користувача"""
+async def get_posts(limit: int = 50, offset: int = 0, user_id: int = Depends(get_current_user),
+                    if_none_match: Optional[str] = Header(None),
+                    if_modified_since: Optional[str] = Header(None)):
+    """Отримує список постів користувача (з ETag: 304, поки пости не змінились)"""
     try:
-        posts = db.get_all_posts(limit=limit, offset=offset, user_id=user_id)
-        return {"success": True, "posts": posts}
+        def build():
+            posts = db.get_all_posts(limit=limit, offset=offset, user_id=user_id)
+            return {"success": True, "posts": posts}
+
+        return await cached_json_response(
+            "posts", {"limit": limit, "offset": offset}, ['posts'], user_id, build,
+            if_none_match, if_modified_since
+        )
     except Exception as e:
         logger.error(f"Помилка отримання постів: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/posts/search")
+async def search_posts(q: str, limit: int = 20, offset: int = 0, include_templates: bool = False,
+                       user_id: int = Depends(get_current_user)):
+    """Повнотекстовий пошук по постах користувача (та шаблонах)"""
+    try:
+        limit = max(1, min(limit, 100))
+
+        posts = await asyncio.to_thread(
+            db.search_posts, q, user_id=user_id, limit=limit, offset=offset
+        )
+
+        result = {"success": True, "query": q, "posts": posts, "count": len(posts)}
+
+        if include_templates:
+            result["templates"] = await asyncio.to_thread(db.search_templates, q, limit=limit)
+
+        return result
+    except Exception as e:
+        logger.error(f"Помилка пошуку: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/posts/{post_id}")
 async def get_post(post_id: int, user_id: int = Depends(get_current_user)):
     """Отримує деталі поста"""
@@ -428,14 +475,8 @@ async def get_post(post_id: int, user_id: int = Depends(get_current_user)):
         if post.get('user_id') != user_id:
             raise HTTPException(status_code=403, detail="Доступ заборонено")
 
-        # Отримуємо публікації
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM publications WHERE post_id = ?", (post_id,))
-        publications = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-
-        post['publications'] = publications
+        # Отримуємо публікації (з архіву, якщо пост заархівовано)
+        post['publications'] = db.get_publications_by_post(post_id)
 
         # Отримуємо аналітику якщо опубліковано
         if post['status'] == 'published':
@@ -450,42 +491,75 @@ async def get_post(post_id: int, user_id: int = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/posts")
-async def create_post(data: PostCreate, user_id: int = Depends(get_current_user)):
-    """Створює новий пост"""
-    try:
-        # Парсимо час якщо є
-        scheduled_time = None
-        if data.scheduled_time:
-            scheduled_time = datetime.fromisoformat(data.scheduled_time.replace('Z', '+00:00'))
+def _create_post_with_publications(data: PostCreate, pages: list, user_id: int,
+                                   scheduled_time: Optional[datetime]) -> int:
+    """
+    Створює пост з URLs зображень та user_id, публікації на сторінках користувача
+    та одразу встановлює статус (scheduled, якщо є час публікації, інакше draft)
+    """
+    post_id = db.create_post(
+        content=data.content,
+        link=data.link,
+        is_ai_generated=data.is_ai_generated,
+        ai_prompt=data.ai_prompt,
+        scheduled_time=scheduled_time,
+        image_urls=data.image_urls,
+        user_id=user_id
+    )
 
-        # Створюємо пост з URLs зображень та user_id
-        post_id = db.create_post(
-            content=data.content,
-            link=data.link,
-            is_ai_generated=data.is_ai_generated,
-            ai_prompt=data.ai_prompt,
-            scheduled_time=scheduled_time,
-            image_urls=data.image_urls,
-            user_id=user_id
-        )
+    for page in pages:
+        db.add_publication(post_id, page['page_id'], page['page_name'], user_id)
 
-        # Получаем страницы пользователя из БД
-        user_pages = db.get_user_facebook_pages(user_id)
+    # Статус до виходу з блокування автопланування: зайнятими слотами вважаються лише scheduled-пости
+    db.update_post_status(post_id, 'scheduled' if scheduled_time else 'draft')
+
+    return post_id
 
-        # Додаємо публікації для кожної сторінки користувача
-        for page_id in data.page_ids:
-            page = next((p for p in user_pages if p['page_id'] == page_id), None)
-            if page:
-                db.add_publication(post_id, page['page_id'], page['page_name'], user_id)
 
-        # Встановлюємо статус
-        if scheduled_time:
-            db.update_post_status(post_id, 'scheduled')
+def _create_auto_scheduled_post(data: PostCreate, pages: list, user_id: int) -> tuple:
+    """Підбирає найкращий вільний слот і створює запланований пост під одним блокуванням"""
+    with auto_scheduler.lock:
+        scheduled_time = auto_scheduler.next_slot(user_id, [page['page_id'] for page in pages])
+        post_id = _create_post_with_publications(data, pages, user_id, scheduled_time)
+    return post_id, scheduled_time
+
+
+@router.post("/posts")
+async def create_post(data: PostCreate, user_id: int = Depends(get_current_user)):
+    """
+    Створює новий пост
+
+    scheduled_time = "auto" - час публікації обирається автоматично:
+    найближчий вільний слот з високим engagement на вибраних сторінках.
+    """
+    try:
+        # Сторінки користувача, на які публікується пост
+        pages = []
+        for page_id in data.page_ids:
+            page = page_token_registry.get_entry(page_id, user_id)
+            if page and page['user_id'] == user_id:
+                pages.append(page)
+
+        auto_schedule = data.scheduled_time == 'auto'
+        if auto_schedule:
+            if not pages:
+                raise HTTPException(status_code=400, detail="Для автоматичного планування оберіть сторінку")
+            post_id, scheduled_time = await asyncio.to_thread(_create_auto_scheduled_post, data, pages, user_id)
         else:
-            db.update_post_status(post_id, 'draft')
+            # Парсимо час якщо є
+            scheduled_time = None
+            if data.scheduled_time:
+                scheduled_time = datetime.fromisoformat(data.scheduled_time.replace('Z', '+00:00'))
+            post_id = _create_post_with_publications(data, pages, user_id, scheduled_time)
 
-        return {"success": True, "post_id": post_id}
+        return {
+            "success": True,
+            "post_id": post_id,
+            "scheduled_time": scheduled_time.isoformat() if scheduled_time else None,
+            "auto_scheduled": auto_schedule
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Помилка створення поста: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -538,9 +612,40 @@ async def update_post(post_id: int, data: PostUpdate, user_id: int = Depends(get
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _delete_publication_from_facebook(pub: dict, page_token: Optional[str],
+                                           semaphore: asyncio.Semaphore) -> dict:
+    """Видаляє одну публікацію з Facebook (для паралельного видалення)"""
+    result = {"page": pub['page_name'], "facebook_post_id": pub['facebook_post_id'], "success": False}
+
+    if not page_token:
+        logger.warning(f"⚠ Токен для сторінки {pub['page_id']} не знайдено")
+        result["error"] = "Токен не знайдено"
+        result["skipped"] = True
+        return result
+
+    async with semaphore:
+        try:
+            fb_manager = FacebookManager(page_token)
+
+            # Видаляємо пост з Facebook (requests - в окремому потоці)
+            success = await asyncio.to_thread(fb_manager.delete_post, pub['facebook_post_id'], page_token)
+
+            if success:
+                result["success"] = True
+                logger.info(f"✓ Пост {pub['facebook_post_id']} видалено з Facebook (сторінка: {pub['page_name']})")
+            else:
+                result["error"] = "Facebook відхилив видалення"
+                logger.warning(f"✗ Не вдалося видалити пост {pub['facebook_post_id']} з Facebook")
+        except Exception as e:
+            result["error"] = str(e)
+            logger.error(f"✗ Помилка видалення поста {pub['facebook_post_id']} з Facebook: {str(e)}")
+
+    return result
+
+
 @router.delete("/posts/{post_id}")
 async def delete_post(post_id: int, user_id: int = Depends(get_current_user)):
-    """Видаляє пост з бази даних та з Facebook"""
+    """Видаляє пост з бази даних та з Facebook (з усіх сторінок паралельно)"""
     try:
         # Отримуємо інформацію про пост та його публікації
         post = db.get_post_by_id(post_id)
@@ -552,49 +657,21 @@ async def delete_post(post_id: int, user_id: int = Depends(get_current_user)):
             raise HTTPException(status_code=403, detail="Доступ заборонено")
 
         # Отримуємо всі публікації поста
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM publications WHERE post_id = ?
-        """, (post_id,))
-        publications = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        publications = db.get_publications_by_post(post_id)
 
-        # Получаем страницы пользователя из БД
-        user_pages = db.get_user_facebook_pages(user_id)
+        # Токени сторінок користувача
+        page_tokens = page_token_registry.get_user_tokens(user_id)
 
-        # Видаляємо пости з Facebook для кожної публікації
-        deleted_count = 0
-        failed_count = 0
+        # Видаляємо пости з Facebook для всіх публікацій одночасно
+        semaphore = asyncio.Semaphore(PAGE_FANOUT_CONCURRENCY)
+        results = await asyncio.gather(*(
+            _delete_publication_from_facebook(pub, page_tokens.get(pub['page_id']), semaphore)
+            for pub in publications
+            if pub['facebook_post_id'] and pub['status'] == 'published'
+        ))
 
-        for pub in publications:
-            if pub['facebook_post_id'] and pub['status'] == 'published':
-                # Знаходимо токен сторінки пользователя
-                page_token = None
-                for page in user_pages:
-                    if page['page_id'] == pub['page_id']:
-                        page_token = page['access_token']
-                        break
-
-                if page_token:
-                    try:
-                        # Создаем временный токен для удаления
-                        fb_manager = FacebookManager(page_token)
-
-                        # Видаляємо пост з Facebook
-                        success = fb_manager.delete_post(pub['facebook_post_id'], page_token)
-
-                        if success:
-                            deleted_count += 1
-                            logger.info(f"✓ Пост {pub['facebook_post_id']} видалено з Facebook (сторінка: {pub['page_name']})")
-                        else:
-                            failed_count += 1
-                            logger.warning(f"✗ Не вдалося видалити пост {pub['facebook_post_id']} з Facebook")
-                    except Exception as e:
-                        failed_count += 1
-                        logger.error(f"✗ Помилка видалення поста {pub['facebook_post_id']} з Facebook: {str(e)}")
-                else:
-                    logger.warning(f"⚠ Токен для сторінки {pub['page_id']} не знайдено")
+        deleted_count = sum(1 for r in results if r['success'])
+        failed_count = sum(1 for r in results if not r['success'] and not r.get('skipped'))
 
         # Видаляємо пост з бази даних (CASCADE видалить всі пов'язані записи)
         db.delete_post(post_id)
@@ -612,7 +689,8 @@ async def delete_post(post_id: int, user_id: int = Depends(get_current_user)):
             "success": True,
             "message": message,
             "deleted_from_facebook": deleted_count,
-            "failed_deletions": failed_count
+            "failed_deletions": failed_count,
+            "results": results
         }
     except HTTPException:
         raise
@@ -621,9 +699,68 @@ async def delete_post(post_id: int, user_id: int = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _publish_to_page(post: dict, pub: dict, page_token: Optional[str], image_paths: list,
+                           semaphore: asyncio.Semaphore) -> dict:
+    """Публікує пост на одну сторінку та збирає початкову аналітику (для паралельної публікації)"""
+    if not page_token:
+        _, error = page_token_registry.resolve(pub['page_id'], post.get('user_id'))
+        return {"page": pub['page_name'], "success": False, "error": error}
+
+    async with semaphore:
+        fb_manager = FacebookManager(page_token)
+
+        try:
+            if image_paths:
+                # Публікуємо з зображеннями (локальні файли)
+                result = await asyncio.to_thread(
+                    fb_manager.publish_post_with_images,
+                    page_id=pub['page_id'],
+                    page_token=page_token,
+                    message=post['content'],
+                    image_paths=image_paths,
+                    link=post.get('link')
+                )
+            else:
+                # Публікуємо без зображень
+                result = await asyncio.to_thread(
+                    fb_manager.publish_post,
+                    page_id=pub['page_id'],
+                    page_token=page_token,
+                    message=post['content'],
+                    link=post.get('link')
+                )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        if not result['success']:
+            if is_invalid_token_error(result.get('error')):
+                await asyncio.to_thread(page_token_registry.mark_invalid, pub['page_id'], post.get('user_id'))
+            await asyncio.to_thread(db.update_publication_status, pub['id'], 'failed',
+                                    error_message=result.get('error'))
+            return {"page": pub['page_name'], "success": False, "error": result.get('error')}
+
+        await asyncio.to_thread(db.update_publication_status, pub['id'], 'published', result['post_id'])
+
+        # Збираємо початкову аналітику
+        try:
+            initial_analytics = await asyncio.to_thread(
+                get_post_analytics,
+                post_id=result['post_id'],
+                page_token=page_token
+            )
+
+            if initial_analytics.get('success'):
+                await asyncio.to_thread(db.save_analytics, pub['id'], initial_analytics)
+                logger.info(f"Початкова аналітика збережена для поста {result['post_id']}")
+        except Exception as e:
+            logger.warning(f"Не вдалося зібрати початкову аналітику: {str(e)}")
+
+    return {"page": pub['page_name'], "success": True, "post_id": result['post_id']}
+
+
 @router.post("/posts/{post_id}/publish")
 async def publish_post_now(post_id: int, user_id: int = Depends(get_current_user)):
-    """Публікує пост негайно"""
+    """Публікує пост негайно (на всі сторінки паралельно)"""
     try:
         post = db.get_post_by_id(post_id)
         if not post:
@@ -646,87 +783,30 @@ async def publish_post_now(post_id: int, user_id: int = Depends(get_current_user
         if not publications:
             raise HTTPException(status_code=400, detail="Немає сторінок для публікації")
 
-        # Получаем страницы пользователя
-        user_pages = db.get_user_facebook_pages(user_id)
-
-        results = []
-
-        # Перевіряємо чи є зображення
-        image_urls = post.get('image_urls', [])
-        has_images = image_urls and len(image_urls) > 0
-
-        for pub in publications:
-            # Находим токен страницы пользователя
-            page_token = None
-            for page in user_pages:
-                if page['page_id'] == pub['page_id']:
-                    page_token = page['access_token']
-                    break
-
-            if not page_token:
-                results.append({"page": pub['page_name'], "success": False, "error": "Токен не знайдено"})
-                continue
-
-            fb_manager = FacebookManager(page_token)
+        # Токени сторінок користувача
+        page_tokens = page_token_registry.get_user_tokens(user_id)
 
-            # Конвертуємо URLs в локальні шляхи
-            if has_images:
-                image_paths = []
-                for url in image_urls:
-                    if url.startswith('/uploads/'):
-                        # Конвертуємо відносний URL в локальний шлях
-                        local_path = url.replace('/uploads/', 'uploads/')
-                        image_paths.append(local_path)
-                    else:
-                        # Якщо це повний URL, пропускаємо
-                        logger.warning(f"Пропускаємо не-локальний URL: {url}")
-
-                # Публікуємо з зображеннями (локальні файли)
-                result = await asyncio.to_thread(
-                    fb_manager.publish_post_with_images,
-                    page_id=pub['page_id'],
-                    page_token=page_token,
-                    message=post['content'],
-                    image_paths=image_paths,
-                    link=post.get('link')
-                )
+        # Конвертуємо URLs зображень в локальні шляхи
+        image_paths = []
+        for url in post.get('image_urls') or []:
+            if url.startswith('/uploads/'):
+                # Конвертуємо відносний URL в локальний шлях
+                image_paths.append(url.replace('/uploads/', 'uploads/'))
             else:
-                # Публікуємо без зображень
-                result = await asyncio.to_thread(
-                    fb_manager.publish_post,
-                    page_id=pub['page_id'],
-                    page_token=page_token,
-                    message=post['content'],
-                    link=post.get('link')
-                )
+                # Якщо це повний URL, пропускаємо
+                logger.warning(f"Пропускаємо не-локальний URL: {url}")
 
-
-            if result['success']:
-                db.update_publication_status(pub['id'], 'published', result['post_id'])
-
-                # Збираємо початкову аналітику
-                try:
-                    initial_analytics = await asyncio.to_thread(
-                        get_post_analytics,
-                        post_id=result['post_id'],
-                        page_token=page_token
-                    )
-
-                    if initial_analytics.get('success'):
-                        db.save_analytics(pub['id'], initial_analytics)
-                        logger.info(f"Початкова аналітика збережена для поста {result['post_id']}")
-                except Exception as e:
-                    logger.warning(f"Не вдалося зібрати початкову аналітику: {str(e)}")
-
-                results.append({"page": pub['page_name'], "success": True, "post_id": result['post_id']})
-            else:
-                db.update_publication_status(pub['id'], 'failed', error_message=result.get('error'))
-                results.append({"page": pub['page_name'], "success": False, "error": result.get('error')})
+        # Публікуємо на всі сторінки одночасно (не більше PAGE_FANOUT_CONCURRENCY запитів)
+        semaphore = asyncio.Semaphore(PAGE_FANOUT_CONCURRENCY)
+        results = await asyncio.gather(*(
+            _publish_to_page(post, pub, page_tokens.get(pub['page_id']), image_paths, semaphore)
+            for pub in publications
+        ))
 
         # Оновлюємо статус поста
         db.update_post_status(post_id, 'published')
 
-        return {"success": True, "results": results}
+        return {"success": True, "results": list(results)}
     except HTTPException:
         raise
     except Exception as e:
@@ -736,25 +816,33 @@ async def publish_post_now(post_id: int, user_id: int = Depends(get_current_user
 
 # ==================== AI ГЕНЕРАЦІЯ ====================
 
+def _prepare_generation_prompt(data: AIGenerateRequest) -> tuple:
+    """Визначає мову та адаптує промпт для генерації"""
+    # Визначаємо мову промпту
+    lang = data.lang if hasattr(data, 'lang') else 'uk'
+
+    # Адаптуємо промпт для мови
+    prompt = data.prompt
+    if lang == 'en' and not any(word in prompt.lower() for word in ['write', 'create', 'generate']):
+        # Якщо мова англійська, але промпт не містить англійських слів - додаємо вказівку
+        prompt = f"Write in English: {prompt}"
+
+    return prompt, lang
+
+
 @router.post("/generate")
 async def generate_text(data: AIGenerateRequest):
     """Генерує текст за допомогою AI з урахуванням рекомендацій"""
     try:
-        # Визначаємо мову промпту
-        lang = data.lang if hasattr(data, 'lang') else 'uk'
-
-        # Адаптуємо промпт для мови
-        prompt = data.prompt
-        if lang == 'en' and not any(word in prompt.lower() for word in ['write', 'create', 'generate']):
-            # Якщо мова англійська, але промпт не містить англійських слів - додаємо вказівку
-            prompt = f"Write in English: {prompt}"
+        prompt, lang = _prepare_generation_prompt(data)
 
         text = await generate_post_text(
             prompt=prompt,
             min_length=data.min_length,
             max_length=data.max_length,
             use_recommendations=data.use_recommendations,
-            lang=lang
+            lang=lang,
+            fresh=data.fresh
         )
         return {"success": True, "text": text}
     except Exception as e:
@@ -762,6 +850,171 @@ async def generate_text(data: AIGenerateRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _generate_batch_item(index: int, prompt: str, data: AIGenerateBatchRequest,
+                               fresh: bool, semaphore: asyncio.Semaphore) -> dict:
+    """Генерує текст однієї чернетки пакету (з обмеженням часу)"""
+    item = {'index': index, 'prompt': prompt, 'status': 'failed', 'post_id': None, 'content': None, 'error': None}
+
+    async with semaphore:
+        try:
+            text = await asyncio.wait_for(
+                generate_post_text(
+                    prompt=prompt,
+                    min_length=data.min_length,
+                    max_length=data.max_length,
+                    use_recommendations=data.use_recommendations,
+                    lang=data.lang,
+                    fresh=fresh,
+                    raise_errors=True
+                ),
+                timeout=BATCH_GENERATION_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            item['error'] = 'Перевищено час генерації'
+            return item
+        except Exception as e:
+            item['error'] = str(e)
+            return item
+
+    # Невалідний текст відкинув би всю транзакцію create_posts
+    if len(text) > 5000:
+        item['error'] = 'Згенерований текст занадто довгий (макс. 5000 символів)'
+        return item
+
+    item['content'] = text
+    return item
+
+
+@router.post("/generate/batch")
+async def generate_batch(data: AIGenerateBatchRequest, user_id: int = Depends(get_current_user)):
+    """
+    Пакетна генерація чернеток
+
+    Приймає список промптів або одну тему з кількістю варіантів. Тексти
+    генеруються паралельно (не більше BATCH_GENERATION_CONCURRENCY одночасно),
+    успішні зберігаються як чернетки однією транзакцією. Для кожного елемента
+    повертається статус: created або failed з описом помилки.
+    """
+    try:
+        # Формуємо промпти: варіанти однієї теми генеруються без кешу, щоб тексти відрізнялись
+        if data.prompts:
+            prompts = [p.strip() for p in data.prompts]
+            fresh = False
+        elif data.topic and data.topic.strip():
+            prompts = [data.topic.strip()] * data.variants
+            fresh = True
+        else:
+            raise HTTPException(status_code=400, detail="Вкажіть prompts або topic")
+
+        if not prompts or any(not p for p in prompts):
+            raise HTTPException(status_code=400, detail="Промпти не можуть бути порожніми")
+        if len(prompts) > BATCH_GENERATION_MAX_ITEMS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Максимум {BATCH_GENERATION_MAX_ITEMS} чернеток за один запит"
+            )
+
+        semaphore = asyncio.Semaphore(BATCH_GENERATION_CONCURRENCY)
+        items = []
+        for index, raw_prompt in enumerate(prompts):
+            prompt, lang = _prepare_generation_prompt(
+                AIGenerateRequest(prompt=raw_prompt, lang=data.lang)
+            )
+            items.append(_generate_batch_item(index, prompt, data, fresh, semaphore))
+
+        items = list(await asyncio.gather(*items))
+
+        # Зберігаємо всі успішні чернетки однією транзакцією
+        generated = [item for item in items if item['content']]
+        if generated:
+            post_ids = await asyncio.to_thread(db.create_posts, [
+                {
+                    'content': item['content'],
+                    'is_ai_generated': True,
+                    'ai_prompt': item['prompt']
+                }
+                for item in generated
+            ], user_id=user_id)
+
+            for item, post_id in zip(generated, post_ids):
+                item['post_id'] = post_id
+                item['status'] = 'created'
+
+        created = len(generated)
+        logger.info(f"Пакетна генерація: створено {created} з {len(items)} чернеток")
+
+        return {
+            "success": created > 0,
+            "created": created,
+            "failed": len(items) - created,
+            "items": items
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Помилка пакетної генерації: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/generate/stream")
+async def generate_text_stream(data: AIGenerateRequest):
+    """
+    Потокова генерація тексту (Server-Sent Events)
+
+    Події: {"token": "..."} для кожної частини тексту, в кінці
+    {"done": true, "text": "...", "ttft_ms": ...} або {"error": "..."}.
+    """
+    prompt, lang = _prepare_generation_prompt(data)
+
+    async def events():
+        start = time.perf_counter()
+        ttft_ms = None
+        parts = []
+
+        try:
+            async for chunk in stream_post_text(
+                prompt=prompt,
+                min_length=data.min_length,
+                max_length=data.max_length,
+                use_recommendations=data.use_recommendations,
+                lang=lang,
+                fresh=data.fresh
+            ):
+                if ttft_ms is None:
+                    ttft_ms = round((time.perf_counter() - start) * 1000)
+                parts.append(chunk)
+                yield f"data: {json.dumps({'token': chunk}, ensure_ascii=False)}\n\n"
+
+            text = ''.join(parts).strip()
+            yield f"data: {json.dumps({'done': True, 'text': text, 'ttft_ms': ttft_ms}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            logger.error(f"Помилка потокової генерації: {str(e)}")
+            yield f"data: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/generate/cache-stats")
+async def get_generation_cache_stats():
+    """Статистика кешу відповідей AI (влучання, промахи, кількість записів) та провайдерів"""
+    try:
+        from llm_client import llm_client
+
+        cache_stats = await asyncio.to_thread(llm_client.get_cache_stats)
+        return {
+            "success": True,
+            "cache": cache_stats,
+            "providers": llm_client.get_stats()
+        }
+    except Exception as e:
+        logger.error(f"Помилка отримання статистики кешу: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ==================== СТОРІНКИ ====================
 
 @router.post("/config/token")
@@ -770,8 +1023,7 @@ async def update_access_token(data: TokenUpdate):
     try:
         # Якщо передані app_id і app_secret - зберігаємо
         if data.app_id and data.app_secret:
-            fb_config.config['app_id'] = data.app_id
-            fb_config.config['app_secret'] = data.app_secret
+            fb_config.update(app_id=data.app_id, app_secret=data.app_secret)
 
         # Зберігаємо токен (автоматично обмінюємо на long-lived якщо є app credentials)
         fb_config.set_credentials(
@@ -808,6 +1060,45 @@ async def get_token_info():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/config/tokens/status")
+async def get_tokens_status():
+    """Стан токенів сторінок у реєстрі та підсумок останньої фонової перевірки"""
+    try:
+        from scheduler import token_refresh_service
+
+        return {
+            "success": True,
+            "registry": await asyncio.to_thread(page_token_registry.get_stats),
+            "last_check": token_refresh_service.last_run
+        }
+    except Exception as e:
+        logger.error(f"Помилка отримання стану токенів: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/config/tokens/refresh")
+async def refresh_tokens_now(user_id: Optional[int] = Depends(get_optional_user)):
+    """
+    Позачергове оновлення та перевірка токенів
+
+    Виконується у фоні - повертає job_id, результат доступний через /jobs/{job_id}.
+    """
+    try:
+        from scheduler import token_refresh_service
+
+        job, deduplicated = job_manager.submit(
+            kind='tokens_refresh',
+            key='tokens:refresh',
+            run=lambda job: token_refresh_service.run_once(),
+            user_id=user_id
+        )
+
+        return _job_response(job, deduplicated)
+    except Exception as e:
+        logger.error(f"Помилка запуску оновлення токенів: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/pages")
 async def get_pages(user_id: int = Depends(get_current_user)):
     """Отримує список сторінок користувача"""
@@ -842,14 +1133,7 @@ async def remove_page(page_id: str, user_id: int = Depends(get_current_user)):
     """Видаляє сторінку"""
     try:
         # Удаляем страницу из БД для текущего пользователя
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            DELETE FROM user_facebook_pages
-            WHERE user_id = ? AND page_id = ?
-        """, (user_id, page_id))
-        conn.commit()
-        conn.close()
+        db.remove_user_facebook_page(user_id, page_id)
 
         logger.info(f"Користувач {user_id} видалив сторінку {page_id}")
         return {"success": True, "message": "Сторінку видалено"}
@@ -872,10 +1156,9 @@ async def refresh_pages():
         if not pages:
             raise HTTPException(status_code=500, detail="Не вдалося отримати сторінки")
 
-        # Оновлюємо конфігурацію
-        fb_config.config["pages"] = []
-        for page in pages:
-            fb_config.add_page(page['id'], page['name'], page['access_token'])
+        # Оновлюємо конфігурацію (один запис файлу на весь список)
+        fb_config.replace_pages(pages)
+        page_token_registry.invalidate()
 
         return {"success": True, "pages": pages}
     except HTTPException:
@@ -909,17 +1192,10 @@ async def collect_analytics(user_id: int = Depends(get_current_user)):
         success_count = 0
         error_count = 0
 
-        # Получаем страницы пользователя
-        user_pages = db.get_user_facebook_pages(user_id)
-
         for pub in publications:
             try:
-                # Находим токен страницы пользователя
-                page_token = None
-                for page in user_pages:
-                    if page['page_id'] == pub['page_id']:
-                        page_token = page['access_token']
-                        break
+                # Токен страницы пользователя из реестра
+                page_token = page_token_registry.get_token(pub['page_id'], user_id)
 
                 if not page_token:
                     error_count += 1
@@ -979,28 +1255,21 @@ async def collect_post_analytics(post_id: int, user_id: int = Depends(get_curren
         if not publications:
             raise HTTPException(status_code=400, detail="Немає опублікованих публікацій")
 
-        # Получаем страницы пользователя
-        user_pages = db.get_user_facebook_pages(user_id)
-
         success_count = 0
         error_count = 0
         results = []
 
         for pub in publications:
             try:
-                # Находим токен страницы пользователя
-                page_token = None
-                for page in user_pages:
-                    if page['page_id'] == pub['page_id']:
-                        page_token = page['access_token']
-                        break
+                # Токен страницы пользователя из реестра
+                page_token, token_error = page_token_registry.resolve(pub['page_id'], user_id)
 
                 if not page_token:
                     error_count += 1
                     results.append({
                         "publication_id": pub['id'],
                         "success": False,
-                        "error": "Не знайдено токен"
+                        "error": token_error
                     })
                     continue
 
@@ -1089,16 +1358,102 @@ async def get_post_analytics_data(post_id: int, user_id: int = Depends(get_curre
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _collect_publications_analytics(job, publications: list, empty_message: str) -> dict:
+    """
+    Збирає аналітику для списку публікацій у фоновій задачі
+
+    Args:
+        job: фонова задача для звітування про прогрес
+        publications: публікації (id, facebook_post_id, page_id)
+        empty_message: повідомлення, якщо публікацій немає
+    """
+    if not publications:
+        return {
+            "success": True,
+            "message": empty_message,
+            "collected": 0,
+            "errors": 0,
+            "total": 0
+        }
+
+    logger.info(f"Оновлення аналітики для {len(publications)} публікацій")
+    job.update(progress=0, total=len(publications), message="Оновлення аналітики...")
+
+    success_count = 0
+    error_count = 0
+
+    for i, pub in enumerate(publications, 1):
+        try:
+            page_token = page_token_registry.get_token(pub['page_id'], pub.get('user_id'))
+            if not page_token:
+                error_count += 1
+                continue
+
+            analytics = await asyncio.to_thread(
+                get_post_analytics,
+                post_id=pub['facebook_post_id'],
+                page_token=page_token
+            )
+
+            if analytics.get('success'):
+                await asyncio.to_thread(db.save_analytics, pub['id'], analytics)
+                success_count += 1
+                logger.debug(
+                    f"✓ Публікація {pub['id']}: "
+                    f"👍{analytics.get('likes', 0)} "
+                    f"💬{analytics.get('comments', 0)} "
+                    f"🔄{analytics.get('shares', 0)}"
+                )
+
+                # Затримка між запитами
+                await asyncio.sleep(0.5)
+            else:
+                error_count += 1
+                logger.warning(f"Не вдалося отримати аналітику для {pub['id']}: {analytics.get('error')}")
+
+        except Exception as e:
+            logger.error(f"Помилка для публікації {pub['id']}: {str(e)}")
+            error_count += 1
+        finally:
+            job.update(progress=i, message=f"Оброблено {i}/{len(publications)}, помилок: {error_count}")
+
+    message = f"Оновлено аналітику для {success_count} з {len(publications)} публікацій"
+    logger.info(f"✓ {message}. Помилок: {error_count}")
+
+    return {
+        "success": True,
+        "message": message,
+        "collected": success_count,
+        "errors": error_count,
+        "total": len(publications)
+    }
+
+
+def _job_response(job, deduplicated: bool) -> dict:
+    """Відповідь на запуск фонової задачі"""
+    return {
+        "success": True,
+        "job_id": job.id,
+        "status": job.status,
+        "deduplicated": deduplicated,
+        "message": "Задача вже виконується" if deduplicated else "Задачу запущено"
+    }
+
+
 @router.post("/analytics/refresh-all")
-async def refresh_all_analytics():
-    """Оновлює аналітику для всіх опублікованих постів (без обмеження за датою)"""
+async def refresh_all_analytics(user_id: Optional[int] = Depends(get_optional_user)):
+    """
+    Оновлює аналітику для всіх опублікованих постів (без обмеження за датою)
+
+    Виконується у фоні - повертає job_id, прогрес доступний через /jobs/{job_id}.
+    """
     try:
         conn = db.get_connection()
         cursor = conn.cursor()
 
         # ВИПРАВЛЕНИЙ ЗАПИТ - без фільтра по датах, сортування по pub.published_at
         cursor.execute("""
-            SELECT DISTINCT pub.id, pub.facebook_post_id, pub.page_id, p.id as post_id
+            SELECT DISTINCT pub.id, pub.facebook_post_id, pub.page_id, pub.user_id, p.id as post_id
             FROM publications pub
             JOIN posts p ON pub.post_id = p.id
             WHERE pub.status = 'published'
@@ -1111,68 +1466,16 @@ async def refresh_all_analytics():
         publications = [dict(row) for row in cursor.fetchall()]
         conn.close()
 
-        if not publications:
-            return {
-                "success": True,
-                "message": "Немає опублікованих постів для оновлення",
-                "collected": 0,
-                "errors": 0,
-                "total": 0
-            }
-
-        logger.info(f"Оновлення аналітики для {len(publications)} публікацій")
-
-        success_count = 0
-        error_count = 0
-
-        for i, pub in enumerate(publications, 1):
-            try:
-                # Показуємо прогрес кожні 10 постів
-                if i % 10 == 0:
-                    logger.info(f"Оброблено {i}/{len(publications)}...")
-
-                page_token = fb_config.get_page_token(pub['page_id'])
-                if not page_token:
-                    logger.warning(f"Немає токена для сторінки {pub['page_id']}")
-                    error_count += 1
-                    continue
-
-                analytics = await asyncio.to_thread(
-                    get_post_analytics,
-                    post_id=pub['facebook_post_id'],
-                    page_token=page_token
-                )
-
-                if analytics.get('success'):
-                    db.save_analytics(pub['id'], analytics)
-                    success_count += 1
-                    logger.debug(
-                        f"✓ Публікація {pub['id']}: "
-                        f"👍{analytics.get('likes', 0)} "
-                        f"💬{analytics.get('comments', 0)} "
-                        f"🔄{analytics.get('shares', 0)}"
-                    )
-
-                    # Затримка між запитами
-                    await asyncio.sleep(0.5)
-                else:
-                    error_count += 1
-                    logger.warning(f"Не вдалося отримати аналітику для {pub['id']}: {analytics.get('error')}")
-
-            except Exception as e:
-                logger.error(f"Помилка для публікації {pub['id']}: {str(e)}")
-                error_count += 1
-
-        message = f"Оновлено аналітику для {success_count} з {len(publications)} публікацій"
-        logger.info(f"✓ {message}. Помилок: {error_count}")
+        job, deduplicated = job_manager.submit(
+            kind='analytics_refresh_all',
+            key='analytics:refresh-all',
+            run=lambda job: _collect_publications_analytics(
+                job, publications, "Немає опублікованих постів для оновлення"
+            ),
+            user_id=user_id
+        )
 
-        return {
-            "success": True,
-            "message": message,
-            "collected": success_count,
-            "errors": error_count,
-            "total": len(publications)
-        }
+        return _job_response(job, deduplicated)
 
     except Exception as e:
         logger.error(f"Помилка оновлення аналітики: {str(e)}")
@@ -1180,15 +1483,19 @@ async def refresh_all_analytics():
 
 
 @router.post("/analytics/collect-recent")
-async def collect_recent_analytics():
-    """Оновлює аналітику тільки для свіжих постів (за останні 7 днів)"""
+async def collect_recent_analytics(user_id: Optional[int] = Depends(get_optional_user)):
+    """
+    Оновлює аналітику тільки для свіжих постів (за останні 7 днів)
+
+    Виконується у фоні - повертає job_id, прогрес доступний через /jobs/{job_id}.
+    """
     try:
         conn = db.get_connection()
         cursor = conn.cursor()
 
         # Запит тільки для свіжих постів
         cursor.execute("""
-            SELECT DISTINCT pub.id, pub.facebook_post_id, pub.page_id, p.id as post_id
+            SELECT DISTINCT pub.id, pub.facebook_post_id, pub.page_id, pub.user_id, p.id as post_id
             FROM publications pub
             JOIN posts p ON pub.post_id = p.id
             WHERE pub.status = 'published'
@@ -1201,119 +1508,93 @@ async def collect_recent_analytics():
         publications = [dict(row) for row in cursor.fetchall()]
         conn.close()
 
-        if not publications:
-            return {
-                "success": True,
-                "message": "Немає свіжих постів за останні 7 днів",
-                "collected": 0,
-                "errors": 0,
-                "total": 0
-            }
-
-        logger.info(f"Оновлення аналітики для {len(publications)} свіжих публікацій")
-
-        success_count = 0
-        error_count = 0
-
-        for pub in publications:
-            try:
-                page_token = fb_config.get_page_token(pub['page_id'])
-                if not page_token:
-                    error_count += 1
-                    continue
-
-                analytics = await asyncio.to_thread(
-                    get_post_analytics,
-                    post_id=pub['facebook_post_id'],
-                    page_token=page_token
-                )
-
-                if analytics.get('success'):
-                    db.save_analytics(pub['id'], analytics)
-                    success_count += 1
-                    await asyncio.sleep(0.5)
-                else:
-                    error_count += 1
-
-            except Exception as e:
-                logger.error(f"Помилка: {str(e)}")
-                error_count += 1
-
-        message = f"Оновлено {success_count} свіжих публікацій"
+        job, deduplicated = job_manager.submit(
+            kind='analytics_collect_recent',
+            key='analytics:collect-recent',
+            run=lambda job: _collect_publications_analytics(
+                job, publications, "Немає свіжих постів за останні 7 днів"
+            ),
+            user_id=user_id
+        )
 
-        return {
-            "success": True,
-            "message": message,
-            "collected": success_count,
-            "errors": error_count,
-            "total": len(publications)
-        }
+        return _job_response(job, deduplicated)
 
     except Exception as e:
         logger.error(f"Помилка оновлення: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.get("/analytics/summary")
-async def get_analytics_summary(user_id: int = Depends(get_current_user)):
-    """Отримує зведену аналітику користувача"""
-    try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-
-        # Загальна статистика
-        cursor.execute("""
-            SELECT
-                COUNT(DISTINCT p.id) as total_posts,
-                COALESCE(SUM(a.likes), 0) as total_likes,
-                COALESCE(SUM(a.comments), 0) as total_comments,
-                COALESCE(SUM(a.shares), 0) as total_shares,
-                COALESCE(SUM(a.impressions), 0) as total_impressions,
-                COALESCE(AVG(a.engagement_rate), 0) as avg_engagement_rate
-            FROM posts p
-            JOIN publications pub ON p.id = pub.post_id
-            LEFT JOIN analytics a ON pub.id = a.publication_id
-            WHERE p.status = 'published'
-            AND p.user_id = ?
-        """, (user_id,))
-
-        summary = dict(cursor.fetchone())
+def _build_analytics_summary(user_id: int) -> dict:
+    """Зведена аналітика користувача: загальні показники та найкращі пости"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    # Загальна статистика
+    cursor.execute("""
+        SELECT
+            COUNT(DISTINCT p.id) as total_posts,
+            COALESCE(SUM(a.likes), 0) as total_likes,
+            COALESCE(SUM(a.comments), 0) as total_comments,
+            COALESCE(SUM(a.shares), 0) as total_shares,
+            COALESCE(SUM(a.impressions), 0) as total_impressions,
+            COALESCE(AVG(a.engagement_rate), 0) as avg_engagement_rate
+        FROM posts p
+        JOIN publications pub ON p.id = pub.post_id
+        LEFT JOIN analytics a ON pub.id = a.publication_id
+        WHERE p.status = 'published'
+        AND p.user_id = ?
+    """, (user_id,))
+
+    summary = dict(cursor.fetchone())
+
+    # Найкращі пости з усіма необхідними полями (використовуємо published_at з publications)
+    cursor.execute("""
+        SELECT
+            p.id,
+            p.content,
+            COALESCE(pub.published_at, p.published_at) as published_at,
+            p.is_ai_generated,
+            p.image_urls,
+            COALESCE(SUM(a.likes), 0) as total_likes,
+            COALESCE(SUM(a.comments), 0) as total_comments,
+            COALESCE(SUM(a.shares), 0) as total_shares,
+            COALESCE(SUM(a.impressions), 0) as total_impressions,
+            COALESCE(AVG(a.engagement_rate), 0) as avg_engagement_rate
+        FROM posts p
+        JOIN publications pub ON p.id = pub.post_id
+        LEFT JOIN analytics a ON pub.id = a.publication_id
+        WHERE pub.status = 'published'
+        AND p.user_id = ?
+        GROUP BY p.id
+        HAVING (total_likes + total_comments + total_shares) > 0
+        ORDER BY avg_engagement_rate DESC, total_likes DESC
+        LIMIT 10
+    """, (user_id,))
+
+    best_posts = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+
+    logger.info(f"Analytics summary: {summary}")
+
+    return {
+        "success": True,
+        "summary": summary,
+        "best_posts": best_posts
+    }
 
-        # Найкращі пости з усіма необхідними полями (використовуємо published_at з publications)
-        cursor.execute("""
-            SELECT
-                p.id,
-                p.content,
-                COALESCE(pub.published_at, p.published_at) as published_at,
-                p.is_ai_generated,
-                p.image_urls,
-                COALESCE(SUM(a.likes), 0) as total_likes,
-                COALESCE(SUM(a.comments), 0) as total_comments,
-                COALESCE(SUM(a.shares), 0) as total_shares,
-                COALESCE(SUM(a.impressions), 0) as total_impressions,
-                COALESCE(AVG(a.engagement_rate), 0) as avg_engagement_rate
-            FROM posts p
-            JOIN publications pub ON p.id = pub.post_id
-            LEFT JOIN analytics a ON pub.id = a.publication_id
-            WHERE pub.status = 'published'
-            AND p.user_id = ?
-            GROUP BY p.id
-            HAVING (total_likes + total_comments + total_shares) > 0
-            ORDER BY avg_engagement_rate DESC, total_likes DESC
-            LIMIT 10
-        """, (user_id,))
-
-        best_posts = [dict(row) for row in cursor.fetchall()]
 
-        conn.close()
-
-        logger.info(f"Analytics summary: {summary}")
-
-        return {
-            "success": True,
-            "summary": summary,
-            "best_posts": best_posts
-        }
+@router.get("/analytics/summary")
+async def get_analytics_summary(user_id: int = Depends(get_current_user),
+                                if_none_match: Optional[str] = Header(None),
+                                if_modified_since: Optional[str] = Header(None)):
+    """Отримує зведену аналітику користувача (з ETag: 304, поки пости та аналітика не змінились)"""
+    try:
+        return await cached_json_response(
+            "analytics_summary", {}, ['posts', 'analytics'], user_id,
+            lambda: _build_analytics_summary(user_id),
+            if_none_match, if_modified_since
+        )
     except Exception as e:
         logger.error(f"Помилка отримання аналітики: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1322,10 +1603,19 @@ async def get_analytics_summary(user_id: int = Depends(get_current_user)):
 # ==================== РЕКОМЕНДАЦІЇ ====================
 
 @router.get("/recommendations/latest")
-async def get_latest_recommendation():
-    """Отримує останню актуальну рекомендацію"""
+async def get_latest_recommendation(page_id: Optional[str] = None,
+                                    user_id: Optional[int] = Depends(get_optional_user)):
+    """
+    Отримує останню актуальну рекомендацію
+
+    Для авторизованого користувача - рекомендацію його сторінки (page_id)
+    або всіх його постів; якщо такої ще немає - загальну.
+    """
     try:
-        recommendation = db.get_latest_recommendation()
+        recommendation = db.get_latest_recommendation(
+            user_id=user_id,
+            page_id=page_id if user_id else None
+        )
 
         if not recommendation:
             return {
@@ -1344,59 +1634,190 @@ async def get_latest_recommendation():
 
 
 @router.get("/recommendations/history")
-async def get_recommendations_history(limit: int = 10):
-    """Отримує історію рекомендацій"""
+async def get_recommendations_history(limit: int = 10, page_id: Optional[str] = None,
+                                      user_id: Optional[int] = Depends(get_optional_user),
+                                      if_none_match: Optional[str] = Header(None),
+                                      if_modified_since: Optional[str] = Header(None)):
+    """Отримує історію рекомендацій (користувача/сторінки для авторизованого, інакше загальних)"""
     try:
-        recommendations = db.get_recommendations_history(limit=limit)
+        page_id = page_id if user_id else None
 
-        return {
-            "success": True,
-            "recommendations": recommendations,
-            "count": len(recommendations)
-        }
+        def build():
+            recommendations = db.get_recommendations_history(
+                limit=limit,
+                user_id=user_id,
+                page_id=page_id
+            )
+
+            return {
+                "success": True,
+                "recommendations": recommendations,
+                "count": len(recommendations)
+            }
+
+        # Загальні рекомендації (user_id NULL) мають версію користувача 0
+        return await cached_json_response(
+            "recommendations_history", {"limit": limit, "page_id": page_id}, ['recommendations'],
+            user_id or 0, build, if_none_match, if_modified_since
+        )
     except Exception as e:
         logger.error(f"Помилка отримання історії рекомендацій: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/recommendations/generate")
-async def generate_recommendations(period_days: int = 7, limit: int = 10):
-    """Ручний запуск генерації рекомендацій"""
-    try:
-        from analytics_recommender import recommender
+async def _generate_recommendations_job(job, period_days: int, limit: int, per_user: bool = False) -> dict:
+    """Фонова генерація рекомендацій"""
+    from analytics_recommender import recommender
 
-        logger.info(f"Запуск генерації рекомендацій за {period_days} днів...")
+    logger.info(f"Запуск генерації рекомендацій за {period_days} днів...")
 
-        # Виконуємо повний аналіз
-        result = await asyncio.to_thread(
-            recommender.get_full_analysis,
+    if per_user:
+        job.update(message="Генерація рекомендацій для користувачів та сторінок...")
+        scoped = await recommender.generate_scoped_recommendations_async(
             period_days=period_days,
             limit=limit,
-            use_ai=True
+            use_ai=True,
+            progress=lambda done, total: job.update(progress=done, total=total)
         )
+        return {
+            "success": scoped['completed'] > 0,
+            "message": f"Рекомендації згенеровано для {scoped['completed']} з {scoped['scopes_count']} користувачів/сторінок "
+                       f"(без змін у даних: {scoped['reused']})",
+            "scopes": scoped['results']
+        }
 
-        if result['success']:
-            return {
-                "success": True,
-                "message": f"Рекомендації згенеровано на основі {result['analyzed_count']} постів",
-                "recommendations": result['recommendations'],
-                "patterns": result['patterns'],
-                "analyzed_count": result['analyzed_count']
-            }
-        else:
-            return {
-                "success": False,
-                "message": result.get('message', 'Помилка генерації рекомендацій')
-            }
+    job.update(message="Аналіз постів та генерація AI-рекомендацій...")
+
+    # Виконуємо повний аналіз
+    result = await recommender.get_full_analysis_async(
+        period_days=period_days,
+        limit=limit,
+        use_ai=True
+    )
+
+    if result.get('reused'):
+        return {
+            "success": True,
+            "message": f"Аналітика не змінилася - актуальна рекомендація #{result['recommendation_id']}",
+            "recommendations": result['recommendations'],
+            "patterns": result['patterns'],
+            "analyzed_count": result['analyzed_count'],
+            "reused": True
+        }
+
+    if result['success']:
+        return {
+            "success": True,
+            "message": f"Рекомендації згенеровано на основі {result['analyzed_count']} постів",
+            "recommendations": result['recommendations'],
+            "patterns": result['patterns'],
+            "analyzed_count": result['analyzed_count']
+        }
+
+    return {
+        "success": False,
+        "message": result.get('message', 'Помилка генерації рекомендацій')
+    }
+
+
+@router.post("/recommendations/generate")
+async def generate_recommendations(period_days: int = 7, limit: int = 10, per_user: bool = False,
+                                   user_id: Optional[int] = Depends(get_optional_user)):
+    """
+    Ручний запуск генерації рекомендацій
+
+    Виконується у фоні - повертає job_id, результат доступний через /jobs/{job_id}.
+    per_user=true - окремі рекомендації для кожного користувача та його сторінок.
+    """
+    try:
+        job, deduplicated = job_manager.submit(
+            kind='recommendations_generate',
+            key=f'recommendations:generate:{period_days}:{limit}:{"per_user" if per_user else "global"}',
+            run=lambda job: _generate_recommendations_job(job, period_days, limit, per_user),
+            user_id=user_id
+        )
+
+        return _job_response(job, deduplicated)
 
     except Exception as e:
         logger.error(f"Помилка генерації рекомендацій: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ==================== ФОНОВІ ЗАДАЧІ ====================
+
+def _get_job_for_user(job_id: str, user_id: Optional[int]):
+    """Задача за ID; чужа задача користувача не розкривається (404)"""
+    job = job_manager.get(job_id)
+    if not job or not job.can_access(user_id):
+        raise HTTPException(status_code=404, detail="Задачу не знайдено")
+    return job
+
+
+@router.get("/jobs")
+async def list_jobs(active_only: bool = False, user_id: Optional[int] = Depends(get_optional_user)):
+    """Список фонових задач (системні та задачі поточного користувача)"""
+    jobs = job_manager.list(active_only=active_only, user_id=user_id)
+    return {"success": True, "jobs": jobs, "count": len(jobs)}
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, user_id: Optional[int] = Depends(get_optional_user)):
+    """Стан фонової задачі (для опитування)"""
+    job = _get_job_for_user(job_id, user_id)
+    return {"success": True, "job": job.to_dict()}
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, token: str = None, authorization: Optional[str] = Header(None)):
+    """
+    Прогрес фонової задачі через Server-Sent Events
+
+    EventSource не надсилає заголовків, тому JWT можна передати параметром token.
+    """
+    if not authorization and token:
+        authorization = f"Bearer {token}"
+    _get_job_for_user(job_id, await get_optional_user(authorization))
+
+    return StreamingResponse(
+        job_manager.stream(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str, user_id: int = Depends(get_current_user)):
+    """Скасовує фонову задачу (лише авторизований користувач, що має до неї доступ)"""
+    job = _get_job_for_user(job_id, user_id)
+
+    if not job_manager.cancel(job_id):
+        return {"success": False, "message": "Задача вже завершена", "job": job.to_dict()}
+
+    return {"success": True, "message": "Задачу скасовано", "job": job.to_dict()}
+
+
+@router.get("/admin/timers")
+async def get_timers():
+    """Фонові задачі спільного таймера: розклад, час наступного та останнього запуску"""
+    try:
+        from timer_service import timer_service
+
+        return {
+            "success": True,
+            "running": timer_service.is_running,
+            "timers": timer_service.get_jobs()
+        }
+    except Exception as e:
+        logger.error(f"Помилка отримання стану таймерів: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/analytics/top-posts")
-async def get_top_posts(days: int = 7, limit: int = 10, metric: str = 'engagement_rate'):
-    """Отримує топ-пости за період"""
+async def get_top_posts(days: int = 7, limit: int = 10, metric: str = 'engagement_rate',
+                        if_none_match: Optional[str] = Header(None),
+                        if_modified_since: Optional[str] = Header(None)):
+    """Отримує топ-пости за період (з ETag: 304, поки аналітика не змінилась)"""
     try:
         from analytics_recommender import recommender
 
@@ -1405,34 +1826,88 @@ async def get_top_posts(days: int = 7, limit: int = 10, metric: str = 'engagemen
         if metric not in valid_metrics:
             metric = 'engagement_rate'
 
-        # Отримуємо топ-пости
-        top_posts = await asyncio.to_thread(
-            recommender.get_top_posts,
-            period_days=days,
-            limit=limit,
-            metric=metric
+        def build():
+            # Отримуємо топ-пости
+            top_posts = recommender.get_top_posts(
+                period_days=days,
+                limit=limit,
+                metric=metric
+            )
+
+            return {
+                "success": True,
+                "posts": top_posts,
+                "count": len(top_posts),
+                "period_days": days,
+                "metric": metric
+            }
+
+        # Вікно періоду зсувається з часом - година входить у ключ, щоб старі пости вибували з топу
+        window_start = datetime.now().replace(minute=0, second=0, microsecond=0)
+        params = {"days": days, "limit": limit, "metric": metric, "window": window_start.isoformat()}
+        return await cached_json_response(
+            "top_posts", params, ['posts', 'analytics'], None, build,
+            if_none_match, if_modified_since, window_start=window_start
         )
+    except Exception as e:
+        logger.error(f"Помилка отримання топ-постів: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/heatmap")
+async def get_engagement_heatmap(page_id: Optional[str] = None, user_id: int = Depends(get_current_user)):
+    """
+    Теплова карта engagement: 7 днів тижня (0 = понеділок) × 24 години
+
+    Дані беруться з таблиці engagement_heatmap, яку підтримують тригери аналітики,
+    тож відповідь будується з не більш ніж 168 слотів без сканування публікацій.
+    """
+    try:
+        cells = db.get_engagement_heatmap(user_id, page_id)
+
+        heatmap = [[None] * 24 for _ in range(7)]
+        slots = []
+        for cell in cells:
+            count = cell['posts_count']
+            mean = cell['engagement_sum'] / count
+            variance = max(cell['engagement_sq_sum'] / count - mean * mean, 0.0)
+            slot = {
+                "count": count,
+                "avg_engagement_rate": round(mean, 4),
+                "stddev": round(variance ** 0.5, 4)
+            }
+            heatmap[cell['day_of_week']][cell['hour_of_day']] = slot
+            slots.append({"day_of_week": cell['day_of_week'], "hour_of_day": cell['hour_of_day'], **slot})
+
+        best_slots = sorted(slots, key=lambda slot: slot['avg_engagement_rate'], reverse=True)[:5]
 
         return {
             "success": True,
-            "posts": top_posts,
-            "count": len(top_posts),
-            "period_days": days,
-            "metric": metric
+            "page_id": page_id,
+            "heatmap": heatmap,
+            "best_slots": best_slots,
+            "total_posts": sum(slot['count'] for slot in slots)
         }
     except Exception as e:
-        logger.error(f"Помилка отримання топ-постів: {str(e)}")
+        logger.error(f"Помилка отримання теплової карти: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ==================== ШАБЛОНИ ====================
 
 @router.get("/templates")
-async def get_templates():
-    """Отримує всі шаблони"""
+async def get_templates(if_none_match: Optional[str] = Header(None),
+                        if_modified_since: Optional[str] = Header(None)):
+    """Отримує всі шаблони (з ETag: 304, поки шаблони не змінились)"""
     try:
-        templates = db.get_templates()
-        return {"success": True, "templates": templates}
+        def build():
+            templates = db.get_templates()
+            return {"success": True, "templates": templates}
+
+        return await cached_json_response(
+            "templates", {}, ['templates'], None, build,
+            if_none_match, if_modified_since
+        )
     except Exception as e:
         logger.error(f"Помилка отримання шаблонів: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1466,9 +1941,36 @@ async def delete_template(template_id: int):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _generate_template_draft(topic: str, rec_data: dict, semaphore: asyncio.Semaphore) -> dict:
+    """Генерує чернетку для однієї теми шаблону (з обмеженням часу)"""
+    prompt = f"Створи шаблон поста на тему: {topic}"
+
+    async with semaphore:
+        try:
+            content = await asyncio.wait_for(
+                generate_post_text(
+                    prompt=prompt,
+                    min_length=rec_data['text_length']['min'],
+                    max_length=rec_data['text_length']['max'],
+                    use_recommendations=True,
+                    raise_errors=True
+                ),
+                timeout=TEMPLATE_GENERATION_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Генерація шаблону на тему '{topic}' перевищила {TEMPLATE_GENERATION_TIMEOUT} с")
+            return {'topic': topic, 'prompt': prompt, 'content': None, 'error': 'Перевищено час генерації'}
+        except Exception as e:
+            # Помилка однієї теми не скасовує шаблони інших
+            logger.warning(f"Помилка генерації шаблону на тему '{topic}': {str(e)}")
+            return {'topic': topic, 'prompt': prompt, 'content': None, 'error': str(e)}
+
+    return {'topic': topic, 'prompt': prompt, 'content': content, 'error': None}
+
+
 @router.post("/templates/generate-from-recommendations")
 async def generate_templates_from_recommendations():
-    """Авто-генерація шаблонів на основі рекомендацій"""
+    """Авто-генерація шаблонів на основі рекомендацій (теми генеруються паралельно)"""
     try:
         # Отримуємо останні рекомендації
         recommendation = db.get_latest_recommendation()
@@ -1487,34 +1989,32 @@ async def generate_templates_from_recommendations():
         if not topics:
             topics = ['Мотивація', 'Поради', 'Новини']
 
-        templates_created = []
-
-        for i, topic in enumerate(topics[:3], 1):
-            # Генеруємо текст шаблону з урахуванням рекомендацій
-            from text_generator import generate_post_text
+        # Генеруємо тексти для всіх тем одночасно
+        semaphore = asyncio.Semaphore(TEMPLATE_GENERATION_CONCURRENCY)
+        drafts = await asyncio.gather(*(
+            _generate_template_draft(topic, rec_data, semaphore) for topic in topics[:3]
+        ))
 
-            prompt = f"Створи шаблон поста на тему: {topic}"
-            content = await generate_post_text(
-                prompt=prompt,
-                min_length=rec_data['text_length']['min'],
-                max_length=rec_data['text_length']['max'],
-                use_recommendations=True
-            )
+        templates_created = []
 
-            # Створюємо шаблон як AI промпт
-            template_name = f"AI Шаблон: {topic}"
+        for draft in drafts:
+            # Створюємо шаблон як AI промпт, згенерований текст зберігаємо поруч
+            template_name = f"AI Шаблон: {draft['topic']}"
             template_id = db.create_template(
                 name=template_name,
-                content=prompt,
+                content=draft['prompt'],
                 is_ai_prompt=True,
                 based_on_recommendations=True,
-                recommendation_id=rec_id
+                recommendation_id=rec_id,
+                generated_content=draft['content']
             )
 
             templates_created.append({
                 'id': template_id,
                 'name': template_name,
-                'topic': topic
+                'topic': draft['topic'],
+                'generated_content': draft['content'],
+                'error': draft['error']
             })
 
             logger.info(f"Створено шаблон #{template_id}: {template_name}")
@@ -15,7 +15,10 @@ from dotenv import load_dotenv
 # Загружаем переменные окружения из .env
 load_dotenv()
 
-from scheduler import post_scheduler, analytics_collector
+from scheduler import (
+    post_scheduler, analytics_collector, recommendations_scheduler, archive_job, token_refresh_service
+)
+from timer_service import timer_service
 from api_routes import router
 
 logging.basicConfig(level=logging.INFO)
@@ -31,20 +34,30 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Запуск системи...")
-    logger.info("📅 Запуск планувальника постів...")
-    asyncio.create_task(post_scheduler.start())
+    logger.info("📅 Планувальник постів (перевірка щохвилини)")
+    post_scheduler.register(timer_service)
+
+    logger.info("📊 Збирач аналітики (інтервал: 30 хв)")
+    analytics_collector.register(timer_service)
+
+    logger.info(f"💡 Генерація рекомендацій ({recommendations_scheduler.schedule.describe()})")
+    recommendations_scheduler.register(timer_service)
+
+    logger.info("🔑 Завчасне оновлення токенів Facebook")
+    token_refresh_service.register(timer_service)
 
-    logger.info("📊 Запуск збирача аналітики (інтервал: 30 хв)...")
-    asyncio.create_task(analytics_collector.start())
+    if archive_job.older_than_days > 0:
+        logger.info(f"🗄️ Архівація (пости старші за {archive_job.older_than_days} днів)")
+        archive_job.register(timer_service)
 
+    asyncio.create_task(timer_service.start())
     logger.info("✅ Система готова до роботи")
 
     yield
 
     # Shutdown
     logger.info("🛑 Зупинка системи...")
-    post_scheduler.stop()
-    analytics_collector.stop()
+    timer_service.stop()
     logger.info("✅ Систему зупинено")
 
 
@@ -3,10 +3,12 @@ Facebook OAuth авторизація
 """
 
 import os
+import json
 import httpx
-from typing import Dict
+from typing import Dict, List, Optional
 from fastapi import HTTPException
 import logging
+from facebook_config import GRAPH_API_URL
 
 logger = logging.getLogger(__name__)
 
@@ -62,7 +64,7 @@ class FacebookOAuth:
         Returns:
             str: short-lived access token
         """
-        url = "https://graph.facebook.com/v18.0/oauth/access_token"
+        url = f"{GRAPH_API_URL}/oauth/access_token"
         params = {
             'client_id': FACEBOOK_APP_ID,
             'client_secret': FACEBOOK_APP_SECRET,
@@ -91,7 +93,7 @@ class FacebookOAuth:
         Returns:
             dict: {"token": "...", "expires_in": 5184000}
         """
-        url = "https://graph.facebook.com/v18.0/oauth/access_token"
+        url = f"{GRAPH_API_URL}/oauth/access_token"
         params = {
             'grant_type': 'fb_exchange_token',
             'client_id': FACEBOOK_APP_ID,
@@ -123,7 +125,7 @@ class FacebookOAuth:
         Returns:
             list: список сторінок з токенами
         """
-        url = "https://graph.facebook.com/v18.0/me/accounts"
+        url = f"{GRAPH_API_URL}/me/accounts"
 
         async with httpx.AsyncClient() as client:
             response = await client.get(
@@ -137,3 +139,62 @@ class FacebookOAuth:
 
             data = response.json()
             return data.get('data', [])
+
+    @staticmethod
+    def get_app_access_token() -> Optional[str]:
+        """Токен додатку (app_id|app_secret) для debug_token або None, якщо додаток не налаштовано"""
+        if not FACEBOOK_APP_ID or not FACEBOOK_APP_SECRET:
+            return None
+        return f"{FACEBOOK_APP_ID}|{FACEBOOK_APP_SECRET}"
+
+    @staticmethod
+    async def debug_tokens(tokens: List[str], batch_size: int = 50) -> Dict[str, Dict]:
+        """
+        Перевіряє токени через debug_token пакетами Graph API batch (до 50 у запиті)
+
+        Args:
+            tokens: токени користувачів або сторінок
+            batch_size: кількість токенів в одному batch-запиті (максимум 50)
+
+        Returns:
+            dict: {токен: data з debug_token (is_valid, expires_at, type, ...)};
+                токени, які не вдалося перевірити, відсутні у результаті
+        """
+        app_token = FacebookOAuth.get_app_access_token()
+        if not app_token:
+            logger.warning("FACEBOOK_APP_ID/FACEBOOK_APP_SECRET не налаштовано - перевірка токенів неможлива")
+            return {}
+
+        from urllib.parse import urlencode
+
+        batch_size = min(batch_size, 50)
+        results = {}
+
+        async with httpx.AsyncClient(timeout=30) as client:
+            for start in range(0, len(tokens), batch_size):
+                chunk = tokens[start:start + batch_size]
+                batch = [
+                    {"method": "GET", "relative_url": f"debug_token?{urlencode({'input_token': token})}"}
+                    for token in chunk
+                ]
+
+                try:
+                    response = await client.post(
+                        f"{GRAPH_API_URL}/",
+                        data={'access_token': app_token, 'batch': json.dumps(batch)}
+                    )
+                    response.raise_for_status()
+                    items = response.json()
+                except Exception as e:
+                    logger.error(f"Помилка пакетної перевірки токенів: {str(e)}")
+                    continue
+
+                for token, item in zip(chunk, items):
+                    if not item or item.get('code') != 200:
+                        continue
+                    try:
+                        results[token] = json.loads(item['body']).get('data', {})
+                    except (TypeError, ValueError):
+                        continue
+
+        return results
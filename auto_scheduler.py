@@ -0,0 +1,274 @@
+"""
+Автоматичний вибір часу публікації
+
+Для нового поста обирається найближчий вільний слот (день тижня + година)
+з високим середнім engagement на його сторінках. Статистика слотів береться
+з теплової карти engagement_heatmap, а між постами на одній сторінці
+витримується мінімальний інтервал.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Мінімальний інтервал між постами на одній сторінці (хв)
+AUTO_SCHEDULE_MIN_SPACING = int(os.getenv("AUTO_SCHEDULE_MIN_SPACING", "120"))
+
+# Частка слотів тижня, що вважаються "найкращими" (0.25 - 42 з 168)
+AUTO_SCHEDULE_TOP_SHARE = 0.25
+
+# Години за замовчуванням, поки по сторінках немає аналітики
+DEFAULT_POSTING_HOURS = (9, 12, 18)
+
+WEEK_SLOTS = 7 * 24
+
+
+class AutoScheduler:
+    """Підбір найближчих вільних слотів з високим engagement для постів"""
+
+    def __init__(self, database=None, min_spacing_minutes: int = AUTO_SCHEDULE_MIN_SPACING,
+                 horizon_days: int = 28, lead_minutes: int = 5):
+        """
+        Args:
+            database: екземпляр Database (за замовчуванням глобальний db)
+            min_spacing_minutes: мінімальний інтервал між постами на сторінці
+            horizon_days: на скільки днів уперед шукати "найкращі" слоти
+            lead_minutes: найменший запас часу до першого слота
+        """
+        self._database = database
+        self.min_spacing = timedelta(minutes=min_spacing_minutes)
+        self.horizon_days = horizon_days
+        self.lead_minutes = lead_minutes
+        # Планування та створення поста виконуються під блокуванням,
+        # щоб паралельні запити не зайняли один слот
+        self.lock = threading.Lock()
+
+    @property
+    def database(self):
+        if self._database is None:
+            from database import db
+            self._database = db
+        return self._database
+
+    def get_slot_scores(self, user_id: int, page_ids: List[str]) -> List[float]:
+        """
+        Оцінка кожного слоту тижня (індекс = день * 24 + година) за сторінками поста
+
+        Середній engagement_rate слоту згладжується до загального середнього,
+        щоб слот з однією вдалою публікацією не перемагав перевірені слоти.
+        """
+        from analytics_recommender import ENGAGEMENT_PRIOR_WEIGHT
+
+        counts = [0] * WEEK_SLOTS
+        sums = [0.0] * WEEK_SLOTS
+        for page_id in page_ids:
+            for cell in self.database.get_engagement_heatmap(user_id, page_id):
+                slot = cell['day_of_week'] * 24 + cell['hour_of_day']
+                counts[slot] += cell['posts_count']
+                sums[slot] += cell['engagement_sum']
+
+        total = sum(counts)
+        if not total:
+            return [1.0 if slot % 24 in DEFAULT_POSTING_HOURS else 0.0 for slot in range(WEEK_SLOTS)]
+
+        mean = sum(sums) / total
+        return [
+            (sums[slot] + ENGAGEMENT_PRIOR_WEIGHT * mean) / (counts[slot] + ENGAGEMENT_PRIOR_WEIGHT)
+            for slot in range(WEEK_SLOTS)
+        ]
+
+    def _get_busy_times(self, page_ids: List[str], since: datetime) -> List[datetime]:
+        """Час запланованих та нещодавно опублікованих постів на сторінках (відсортований)"""
+        if not page_ids:
+            return []
+
+        placeholders = ', '.join('?' for _ in page_ids)
+        conn = self.database.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT p.scheduled_time as busy_at
+            FROM posts p
+            JOIN publications pub ON pub.post_id = p.id
+            WHERE pub.page_id IN ({placeholders})
+            AND p.status = 'scheduled'
+            AND p.scheduled_time IS NOT NULL
+            AND datetime(p.scheduled_time) >= datetime(?)
+            UNION
+            SELECT pub.published_at
+            FROM publications pub
+            WHERE pub.page_id IN ({placeholders})
+            AND pub.status = 'published'
+            AND datetime(pub.published_at) >= datetime(?)
+        """, [*page_ids, since, *page_ids, since])
+        rows = cursor.fetchall()
+        conn.close()
+
+        busy = []
+        for row in rows:
+            try:
+                moment = datetime.fromisoformat(str(row['busy_at']))
+            except ValueError:
+                continue
+            # Час з часовим поясом (напр. з "Z" від клієнта) - в локальний, як і слоти
+            if moment.tzinfo:
+                moment = moment.astimezone().replace(tzinfo=None)
+            busy.append(moment)
+        busy.sort()
+        return busy
+
+    def _is_free(self, busy: List[datetime], moment: datetime) -> bool:
+        """Чи витримано мінімальний інтервал до сусідніх постів"""
+        index = bisect.bisect_left(busy, moment)
+        if index < len(busy) and busy[index] - moment < self.min_spacing:
+            return False
+        if index > 0 and moment - busy[index - 1] < self.min_spacing:
+            return False
+        return True
+
+    def plan(self, user_id: int, page_ids: List[str], count: int = 1,
+             not_before: Optional[datetime] = None) -> List[datetime]:
+        """
+        Підбирає час для count постів на сторінках page_ids
+
+        Спершу займаються найближчі вільні слоти з верхньої частки тижня
+        (AUTO_SCHEDULE_TOP_SHARE) у межах horizon_days; якщо їх не вистачає -
+        решта годин горизонту в порядку спадання оцінки, а далі - години після
+        горизонту. Кожен прохід перебирає години горизонту один раз з пошуком
+        сусідів бінарним пошуком, тож план для сотень постів займає мілісекунди.
+
+        Args:
+            user_id: власник сторінок
+            page_ids: сторінки поста (слот має бути вільним на кожній)
+            count: кількість постів
+            not_before: найраніший час (за замовчуванням зараз)
+
+        Returns:
+            List[datetime]: час публікації для кожного поста, за зростанням
+        """
+        start = (not_before or datetime.now()) + timedelta(minutes=self.lead_minutes)
+        # Перший слот - початок наступної години
+        first_slot = start.replace(minute=0, second=0, microsecond=0)
+        if first_slot < start:
+            first_slot += timedelta(hours=1)
+
+        scores = self.get_slot_scores(user_id, page_ids)
+        top_count = max(len(DEFAULT_POSTING_HOURS), int(WEEK_SLOTS * AUTO_SCHEDULE_TOP_SHARE))
+        threshold = sorted(scores, reverse=True)[top_count - 1]
+        is_top = [score >= threshold and score > 0 for score in scores]
+
+        busy = self._get_busy_times(page_ids, first_slot - self.min_spacing)
+        planned = []
+
+        def take(moment: datetime):
+            bisect.insort(busy, moment)
+            planned.append(moment)
+
+        horizon = [first_slot + timedelta(hours=offset) for offset in range(self.horizon_days * 24)]
+
+        # Прохід 1: найближчі вільні найкращі слоти
+        for moment in horizon:
+            if len(planned) >= count:
+                break
+            if is_top[moment.weekday() * 24 + moment.hour] and self._is_free(busy, moment):
+                take(moment)
+
+        # Прохід 2: решта годин горизонту - від кращих до гірших
+        if len(planned) < count:
+            horizon.sort(key=lambda moment: -scores[moment.weekday() * 24 + moment.hour])
+            for moment in horizon:
+                if len(planned) >= count:
+                    break
+                if self._is_free(busy, moment):
+                    take(moment)
+
+        # Прохід 3: горизонт заповнено - найближчі вільні години після нього
+        moment = first_slot + timedelta(days=self.horizon_days)
+        while len(planned) < count:
+            if self._is_free(busy, moment):
+                take(moment)
+            moment += timedelta(hours=1)
+
+        planned.sort()
+        return planned
+
+    def next_slot(self, user_id: int, page_ids: List[str],
+                  not_before: Optional[datetime] = None) -> datetime:
+        """Найближчий вільний слот з високим engagement для одного поста"""
+        return self.plan(user_id, page_ids, 1, not_before)[0]
+
+
+# Глобальний екземпляр
+auto_scheduler = AutoScheduler()
+
+
+def benchmark_auto_schedule(posts: int = 500, pages: int = 3) -> Dict:
+    """
+    Час планування масового імпорту: posts постів на pages сторінках
+    з тепловою картою, заповненою випадковою аналітикою
+
+    Returns:
+        Dict: час планування в мілісекундах та діапазон дат плану
+    """
+    import random
+    import tempfile
+    from database import Database
+
+    random.seed(42)
+    now = datetime.now()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database = Database(os.path.join(tmp_dir, "bench.sqlite"))
+        conn = database.get_connection()
+        page_ids = [f"bench_page_{i}" for i in range(pages)]
+
+        for post_id in range(1, 2001):
+            published_at = now - timedelta(minutes=random.randint(60, 90 * 24 * 60))
+            conn.execute("INSERT INTO posts (id, content, status, user_id) VALUES (?, 'bench', 'published', 1)",
+                         (post_id,))
+            conn.execute(
+                "INSERT INTO publications (id, post_id, page_id, page_name, status, published_at) "
+                "VALUES (?, ?, ?, 'Bench', 'published', ?)",
+                (post_id, post_id, random.choice(page_ids), published_at)
+            )
+            # Вечірні години в середньому залученіші
+            rate = random.random() * (0.2 if 17 <= published_at.hour <= 21 else 0.08)
+            conn.execute(
+                "INSERT INTO analytics (publication_id, impressions, engagement_rate, hour_of_day, day_of_week) "
+                "VALUES (?, 1000, ?, ?, ?)",
+                (post_id, rate, published_at.hour, published_at.weekday())
+            )
+        conn.commit()
+        conn.close()
+
+        scheduler = AutoScheduler(database)
+        start = time.perf_counter()
+        plan = scheduler.plan(1, page_ids, posts)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+    gaps = [later - earlier for earlier, later in zip(plan, plan[1:])]
+    result = {
+        'posts': len(plan),
+        'plan_ms': round(elapsed_ms, 1),
+        'first': plan[0].isoformat(),
+        'last': plan[-1].isoformat(),
+        'min_gap_minutes': int(min(gaps).total_seconds() // 60) if gaps else None
+    }
+
+    print(f"Заплановано постів:     {result['posts']}")
+    print(f"Час планування:         {result['plan_ms']} мс")
+    print(f"Період плану:           {result['first']} - {result['last']}")
+    print(f"Мінімальний інтервал:   {result['min_gap_minutes']} хв")
+
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark_auto_schedule(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,248 @@
+"""
+Фонові задачі для довгих операцій (оновлення аналітики, генерація рекомендацій)
+
+HTTP-запит лише ставить задачу в чергу і одразу отримує її ID. Прогрес
+доступний через опитування або Server-Sent Events, задачу можна скасувати.
+Однакові задачі (за ключем) не дублюються - повторний запуск повертає
+вже активну задачу. Задача, запущена користувачем, доступна лише йому
+(та користувачам, чий повторний запуск отримав цю задачу).
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Стани задачі
+JOB_PENDING = 'pending'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class Job:
+    """Фонова задача та її прогрес"""
+
+    def __init__(self, kind: str, key: str, user_id: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.user_id = user_id
+        self.user_ids = {user_id} if user_id is not None else set()
+        self.status = JOB_PENDING
+        self.progress = 0
+        self.total = 0
+        self.message = ''
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at = None
+        self.finished_monotonic = None
+        self.task: Optional[asyncio.Task] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def can_access(self, user_id: Optional[int]) -> bool:
+        """Задачі без користувача доступні всім, задачі користувача - лише йому"""
+        return self.user_id is None or user_id in self.user_ids
+
+    def update(self, progress: Optional[int] = None, total: Optional[int] = None,
+               message: Optional[str] = None):
+        """
+        Оновлює прогрес задачі та сповіщає підписників
+
+        Args:
+            progress: кількість оброблених елементів
+            total: загальна кількість елементів
+            message: опис поточного кроку
+        """
+        if progress is not None:
+            self.progress = progress
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        self._notify()
+
+    def _finish(self, status: str, result=None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = datetime.now().isoformat()
+        self.finished_monotonic = time.monotonic()
+        self._notify()
+
+    def _notify(self):
+        snapshot = self.to_dict()
+        for queue in self._subscribers:
+            queue.put_nowait(snapshot)
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'total': self.total,
+            'message': self.message,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """Запускає фонові задачі, дедуплікує їх та зберігає результати"""
+
+    def __init__(self, retention_seconds: int = 3600):
+        """
+        Args:
+            retention_seconds: скільки зберігати завершені задачі
+        """
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, Job] = {}
+        self.active_by_key: Dict[str, Job] = {}
+
+    def submit(self, kind: str, key: str, run: Callable[[Job], Awaitable],
+               user_id: Optional[int] = None) -> tuple:
+        """
+        Ставить задачу на виконання або повертає активну задачу з тим самим ключем
+
+        Args:
+            kind: тип задачі (для відображення)
+            key: ключ дедуплікації
+            run: корутина-функція, що приймає Job і повертає результат
+            user_id: ID користувача, що запустив задачу
+
+        Returns:
+            tuple: (Job, True якщо повернуто вже активну задачу)
+        """
+        self._prune()
+
+        active = self.active_by_key.get(key)
+        if active and not active.is_finished:
+            logger.info(f"Задача {kind} вже виконується ({active.id}), повторний запуск пропущено")
+            if user_id is not None:
+                active.user_ids.add(user_id)
+            return active, True
+
+        job = Job(kind, key, user_id)
+        self.jobs[job.id] = job
+        self.active_by_key[key] = job
+        job.task = asyncio.create_task(self._execute(job, run))
+
+        logger.info(f"Запущено фонову задачу {kind} ({job.id})")
+        return job, False
+
+    async def _execute(self, job: Job, run: Callable[[Job], Awaitable]):
+        job.status = JOB_RUNNING
+        job.update()
+
+        try:
+            result = await run(job)
+            job._finish(JOB_COMPLETED, result=result)
+            logger.info(f"Задача {job.kind} ({job.id}) завершена")
+        except asyncio.CancelledError:
+            job._finish(JOB_CANCELLED)
+            logger.info(f"Задача {job.kind} ({job.id}) скасована")
+        except Exception as e:
+            job._finish(JOB_FAILED, error=str(e))
+            logger.error(f"Помилка задачі {job.kind} ({job.id}): {str(e)}")
+        finally:
+            if self.active_by_key.get(job.key) is job:
+                del self.active_by_key[job.key]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Повертає задачу за ID"""
+        return self.jobs.get(job_id)
+
+    def list(self, active_only: bool = False, user_id: Optional[int] = None) -> List[Dict]:
+        """Повертає список задач, доступних користувачу (нові першими)"""
+        self._prune()
+        jobs = [
+            job for job in self.jobs.values()
+            if job.can_access(user_id) and not (active_only and job.is_finished)
+        ]
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Скасовує задачу
+
+        Returns:
+            bool: True якщо задачу скасовано, False якщо вона не знайдена або вже завершена
+        """
+        job = self.jobs.get(job_id)
+        if not job or job.is_finished or not job.task:
+            return False
+
+        job.task.cancel()
+
+        # Задача ще не стартувала - _execute не виконається, завершуємо тут
+        if job.status == JOB_PENDING:
+            job._finish(JOB_CANCELLED)
+            if self.active_by_key.get(job.key) is job:
+                del self.active_by_key[job.key]
+
+        return True
+
+    async def stream(self, job_id: str, heartbeat: float = 15.0):
+        """
+        Асинхронний генератор подій Server-Sent Events для задачі
+
+        Перша подія - поточний стан, далі кожна зміна прогресу;
+        потік закривається після завершення задачі.
+        """
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+
+        queue: asyncio.Queue = asyncio.Queue()
+        job._subscribers.append(queue)
+
+        try:
+            snapshot = job.to_dict()
+            yield self._format_event(snapshot)
+
+            while snapshot['status'] not in FINISHED_STATES:
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    # Коментар SSE, щоб проксі не закривали з'єднання
+                    yield ": keep-alive\n\n"
+                    continue
+
+                yield self._format_event(snapshot)
+        finally:
+            job._subscribers.remove(queue)
+
+    @staticmethod
+    def _format_event(snapshot: Dict) -> str:
+        """Форматує стан задачі як подію SSE"""
+        return f"data: {json.dumps(snapshot, ensure_ascii=False, default=str)}\n\n"
+
+    def _prune(self):
+        """Видаляє завершені задачі, старші за retention_seconds"""
+        now = time.monotonic()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.is_finished and now - job.finished_monotonic > self.retention_seconds
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+
+# Глобальний менеджер фонових задач
+job_manager = JobManager()
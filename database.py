@@ -4,35 +4,257 @@
 + Розширена аналітика для інтелектуального аналізу
 """
 
+import io
+import os
+import re
+import html
+import gzip
 import sqlite3
 import json
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Таблиці потокового експорту та умови відбору для інкрементального режиму
+# ({schema} - 'main' або 'archive')
+# :since - межа в UTC (колонки CURRENT_TIMESTAMP), :since_local - у локальному часі
+# (publications.published_at записується з datetime.now())
+EXPORT_TABLES = {
+    # updated_at підтримує тригер posts_touch_updated_at - правки та зміни статусу теж потрапляють в експорт
+    'posts': "datetime(created_at) >= datetime(:since) OR datetime(updated_at) >= datetime(:since)",
+    'publications': (
+        "datetime(published_at) >= datetime(:since_local) "
+        "OR post_id IN (SELECT id FROM {schema}.posts WHERE datetime(created_at) >= datetime(:since))"
+    ),
+    'analytics': "datetime(updated_at) >= datetime(:since)",
+    'templates': "datetime(created_at) >= datetime(:since)"
+}
+
+# Впорядкований список міграцій схеми: (версія, опис, метод Database).
+# Нові зміни схеми додаються лише в кінець з наступним номером версії.
+MIGRATIONS = [
+    (1, "Базова схема: пости, публікації, аналітика, шаблони, рекомендації, користувачі", '_migration_base_schema'),
+    (2, "Повнотекстовий пошук FTS5", '_init_search_index'),
+    (3, "Згенерований AI текст для шаблонів", '_migration_template_generated_content'),
+    (4, "Кеш відповідей LLM та відбиток вхідних даних рекомендацій", '_migration_llm_cache'),
+    (5, "Рекомендації в розрізі користувача та сторінки", '_migration_recommendation_scope'),
+    (6, "Метадані токенів сторінок: термін дії та позначка недійсності", '_migration_page_token_metadata'),
+    (7, "Теплова карта engagement по днях тижня та годинах", '_migration_engagement_heatmap'),
+    (8, "Відбиток вхідних даних запуску рекомендацій з водяним знаком аналітики", '_migration_recommendation_data_fingerprint'),
+    (9, "Індекс рекомендацій за статусом і часом створення", '_migration_recommendation_status_index'),
+    (10, "Версії даних користувачів для HTTP-кешування (ETag)", '_migration_data_versions'),
+    (11, "Індекс останньої рекомендації області без сортування", '_migration_recommendation_latest_index'),
+    (12, "Час останньої зміни поста для інкрементального експорту", '_migration_post_updated_at'),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Таблиці, що переносяться в архівну БД, та індекси архіву
+ARCHIVE_TABLES = ['posts', 'publications', 'analytics']
+ARCHIVE_INDEXES = {
+    'posts': 'user_id',
+    'publications': 'post_id',
+    'analytics': 'publication_id'
+}
+
+# Повнотекстові індекси: (FTS-таблиця, таблиця-джерело, індексовані колонки)
+SEARCH_INDEXES = [
+    ('posts_fts', 'posts', ['content', 'ai_prompt']),
+    ('templates_fts', 'templates', ['content'])
+]
+
+# Маркери збігів у snippet() - замінюються на <mark> після HTML-екранування
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+# Страхувальний термін життя кешу останніх рекомендацій (с): рекомендації,
+# збережені іншим процесом (CLI analytics_recommender), стануть видимими не пізніше
+RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+
 class Database:
     """Клас для роботи з базою даних"""
     
-    def __init__(self, db_file="marketing_db.sqlite"):
+    def __init__(self, db_file="marketing_db.sqlite", archive_file: Optional[str] = None):
+        """
+        Args:
+            db_file: основна ("гаряча") база даних
+            archive_file: архівна БД для старих постів (за замовчуванням <db_file>_archive.sqlite)
+        """
         self.db_file = db_file
+        self.archive_file = archive_file or f"{os.path.splitext(db_file)[0]}_archive.sqlite"
+        # Слухачі збереження рекомендацій: callback(recommendation_id, recommendations)
+        self.recommendation_listeners = []
+        # Слухачі змін сторінок/токенів Facebook користувача: callback(user_id)
+        self.page_listeners = []
+        # Кеш останньої рекомендації по областях: (user_id, page_id) -> (час завантаження, рекомендація або None).
+        # Лічильник поколінь не дає запиту, що почався до save_recommendation, записати застарілий результат
+        self._latest_recommendations = {}
+        self._recommendations_generation = 0
+        self._recommendations_lock = threading.Lock()
         self.init_database()
     
-    def get_connection(self):
-        """Отримує з'єднання з базою даних"""
+    def get_connection(self, with_archive: bool = False):
+        """
+        Отримує з'єднання з базою даних
+
+        Args:
+            with_archive: підключити архівну БД як схему archive
+        """
         conn = sqlite3.connect(self.db_file)
         conn.row_factory = sqlite3.Row
+        if with_archive:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_file,))
         return conn
+
+    def has_archive(self) -> bool:
+        """Чи існує архівна БД"""
+        return os.path.exists(self.archive_file)
+
+    def _fetch_with_archive(self, query: str, params: tuple):
+        """
+        Виконує запит по гарячій БД, а якщо нічого не знайдено - по архіву
+
+        Кожен пост живе або в гарячій БД, або в архіві, тому архів
+        підключається лише при промаху і не впливає на гарячий шлях.
+
+        Args:
+            query: SQL з плейсхолдером {schema} для імен таблиць
+            params: параметри запиту
+
+        Returns:
+            tuple: (рядки, True якщо рядки з архіву)
+        """
+        conn = self.get_connection()
+        rows = conn.execute(query.format(schema='main'), params).fetchall()
+        conn.close()
+
+        if rows or not self.has_archive():
+            return rows, False
+
+        conn = self.get_connection(with_archive=True)
+        try:
+            rows = conn.execute(query.format(schema='archive'), params).fetchall()
+        except sqlite3.OperationalError:
+            # Архів ще не містить таблиць
+            rows = []
+        finally:
+            conn.close()
+
+        return rows, bool(rows)
     
     def init_database(self):
-        """Ініціалізує структуру бази даних"""
+        """
+        Ініціалізує структуру бази даних
+
+        Версія схеми зберігається в таблиці schema_version. Якщо схема актуальна,
+        старт коштує один запит; інакше відсутні міграції з MIGRATIONS
+        виконуються по черзі в одній транзакції.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
 
-        # Выполнить миграции если нужно
-        self._run_migrations(cursor)
-        
+        try:
+            version, self.fts_enabled = self._read_schema_state(cursor)
+
+            if version < SCHEMA_VERSION:
+                cursor.execute("BEGIN IMMEDIATE")
+                # Інший процес міг виконати міграції, поки ми чекали на блокування
+                version, _ = self._read_schema_state(cursor)
+                self._run_migrations(cursor, version)
+                conn.commit()
+                self.fts_enabled = self._read_schema_state(cursor)[1]
+                logger.info(f"База даних ініціалізована (версія схеми {SCHEMA_VERSION})")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _read_schema_state(self, cursor):
+        """
+        Читає версію схеми та наявність пошукового індексу одним запитом
+
+        Returns:
+            tuple: (версія схеми, 0 якщо БД нова або створена до версіонування; чи доступний FTS5)
+        """
+        try:
+            cursor.execute("""
+                SELECT
+                    (SELECT MAX(version) FROM schema_version),
+                    EXISTS(SELECT 1 FROM sqlite_master WHERE type='table' AND name='posts_fts')
+            """)
+        except sqlite3.OperationalError:
+            return 0, False
+
+        version, fts_enabled = cursor.fetchone()
+        return version or 0, bool(fts_enabled)
+
+    def _run_migrations(self, cursor, current_version: int):
+        """
+        Виконує міграції, новіші за current_version (в транзакції викликача)
+
+        Args:
+            cursor: курсор з відкритою транзакцією
+            current_version: поточна версія схеми
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        for version, description, method in MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            logger.info(f"Виконується міграція {version}: {description}...")
+            getattr(self, method)(cursor)
+            cursor.execute(
+                "INSERT OR REPLACE INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+
+    def _add_missing_columns(self, cursor, table: str, columns: Dict[str, str]):
+        """Додає до таблиці колонки, яких у ній ще немає"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {column[1] for column in cursor.fetchall()}
+
+        for col_name, col_type in columns.items():
+            if col_name not in existing:
+                logger.info(f"Додаємо колонку {col_name} до таблиці {table}...")
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}")
+
+    def _migration_base_schema(self, cursor):
+        """
+        Міграція 1: базова схема
+
+        Ідемпотентна - доводить до актуального стану як нову БД, так і БД,
+        створену до появи schema_version (з частиною таблиць та колонок).
+        """
+        # Таблиця користувачів
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                facebook_id TEXT UNIQUE NOT NULL,
+                email TEXT,
+                full_name TEXT,
+                profile_picture TEXT,
+                facebook_app_id TEXT,
+                facebook_app_secret TEXT,
+                facebook_access_token TEXT,
+                facebook_token_expires_at TEXT,
+                role TEXT DEFAULT 'user',
+                is_active BOOLEAN DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_login TIMESTAMP
+            )
+        """)
+
         # Таблиця постів
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS posts (
@@ -51,13 +273,6 @@ class Database:
             )
         """)
         
-        # Перевірка чи існує колонка image_urls
-        cursor.execute("PRAGMA table_info(posts)")
-        columns = [column[1] for column in cursor.fetchall()]
-        if 'image_urls' not in columns:
-            logger.info("Додаємо колонку image_urls до таблиці posts...")
-            cursor.execute("ALTER TABLE posts ADD COLUMN image_urls TEXT")
-        
         # Таблиця публікацій (зв'язок пост - сторінка)
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS publications (
@@ -105,25 +320,6 @@ class Database:
             )
         """)
         
-        # Додавання нових колонок якщо їх немає
-        cursor.execute("PRAGMA table_info(analytics)")
-        analytics_columns = [column[1] for column in cursor.fetchall()]
-        
-        new_columns = {
-            'hour_of_day': 'INTEGER',
-            'day_of_week': 'INTEGER',
-            'engagement_rate': 'REAL DEFAULT 0.0',
-            'text_length': 'INTEGER DEFAULT 0',
-            'has_link': 'BOOLEAN DEFAULT 0',
-            'has_images': 'BOOLEAN DEFAULT 0',
-            'image_count': 'INTEGER DEFAULT 0'
-        }
-        
-        for col_name, col_type in new_columns.items():
-            if col_name not in analytics_columns:
-                logger.info(f"Додаємо колонку {col_name} до таблиці analytics...")
-                cursor.execute(f"ALTER TABLE analytics ADD COLUMN {col_name} {col_type}")
-        
         # Таблиця шаблонів постів
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS templates (
@@ -139,18 +335,6 @@ class Database:
                 FOREIGN KEY (recommendation_id) REFERENCES ai_recommendations(id) ON DELETE SET NULL
             )
         """)
-
-        # Перевірка і додавання нових колонок для шаблонів
-        cursor.execute("PRAGMA table_info(templates)")
-        template_columns = [column[1] for column in cursor.fetchall()]
-
-        if 'based_on_recommendations' not in template_columns:
-            logger.info("Додаємо колонку based_on_recommendations до таблиці templates...")
-            cursor.execute("ALTER TABLE templates ADD COLUMN based_on_recommendations BOOLEAN DEFAULT 0")
-
-        if 'recommendation_id' not in template_columns:
-            logger.info("Додаємо колонку recommendation_id до таблиці templates...")
-            cursor.execute("ALTER TABLE templates ADD COLUMN recommendation_id INTEGER")
         
         # Таблиця AI рекомендацій
         cursor.execute("""
@@ -167,138 +351,403 @@ class Database:
                 CHECK (analyzed_posts_count >= 0)
             )
         """)
-        
+
+        # Сторінки Facebook користувачів
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS user_facebook_pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                page_id TEXT NOT NULL,
+                page_name TEXT,
+                access_token TEXT NOT NULL,
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                UNIQUE(user_id, page_id)
+            )
+        """)
+
+        # Колонки, додані в старих версіях схеми
+        self._add_missing_columns(cursor, 'posts', {
+            'image_urls': 'TEXT',
+            'user_id': 'INTEGER'
+        })
+        self._add_missing_columns(cursor, 'publications', {
+            'user_id': 'INTEGER'
+        })
+        self._add_missing_columns(cursor, 'analytics', {
+            'hour_of_day': 'INTEGER',
+            'day_of_week': 'INTEGER',
+            'engagement_rate': 'REAL DEFAULT 0.0',
+            'text_length': 'INTEGER DEFAULT 0',
+            'has_link': 'BOOLEAN DEFAULT 0',
+            'has_images': 'BOOLEAN DEFAULT 0',
+            'image_count': 'INTEGER DEFAULT 0'
+        })
+        self._add_missing_columns(cursor, 'templates', {
+            'based_on_recommendations': 'BOOLEAN DEFAULT 0',
+            'recommendation_id': 'INTEGER'
+        })
+        self._add_missing_columns(cursor, 'users', {
+            'facebook_app_id': 'TEXT',
+            'facebook_app_secret': 'TEXT',
+            'facebook_access_token': 'TEXT',
+            'facebook_token_expires_at': 'TEXT'
+        })
+
         # Створення індексів для оптимізації запитів
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_facebook_id ON users(facebook_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_status ON posts(status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_scheduled_time ON posts(scheduled_time)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_publications_post_id ON publications(post_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_publications_status ON publications(status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_publications_user_id ON publications(user_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_publication_id ON analytics(publication_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_analytics_engagement_rate ON analytics(engagement_rate DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_recommendations_created_at ON ai_recommendations(created_at DESC)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_pages_user_id ON user_facebook_pages(user_id)")
+
+    def _migration_template_generated_content(self, cursor):
+        """Міграція 3: текст, згенерований AI для шаблону (чернетка поруч із промптом)"""
+        self._add_missing_columns(cursor, 'templates', {
+            'generated_content': 'TEXT'
+        })
+
+    def _migration_llm_cache(self, cursor):
+        """Міграція 4: кеш відповідей LLM та відбиток набору постів для рекомендацій"""
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_posts_status 
-            ON posts(status)
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                cache_key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                hits INTEGER DEFAULT 0
+            )
         """)
-        
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache(last_used_at)")
+
+        self._add_missing_columns(cursor, 'ai_recommendations', {
+            'input_fingerprint': 'TEXT'
+        })
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_posts_scheduled_time 
-            ON posts(scheduled_time)
+            CREATE INDEX IF NOT EXISTS idx_recommendations_fingerprint
+            ON ai_recommendations(input_fingerprint)
         """)
-        
+
+    def _migration_recommendation_scope(self, cursor):
+        """
+        Міграція 5: область рекомендації - користувач та сторінка
+
+        user_id IS NULL - загальна рекомендація по всіх постах (як раніше),
+        page_id IS NULL - рекомендація по всіх сторінках користувача.
+        """
+        self._add_missing_columns(cursor, 'ai_recommendations', {
+            'user_id': 'INTEGER',
+            'page_id': 'TEXT'
+        })
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_posts_created_at 
-            ON posts(created_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_recommendations_scope
+            ON ai_recommendations(user_id, page_id, created_at DESC)
         """)
-        
+
+    def _migration_page_token_metadata(self, cursor):
+        """Міграція 6: термін дії токена сторінки та час, коли Facebook визнав його недійсним"""
+        self._add_missing_columns(cursor, 'user_facebook_pages', {
+            'token_expires_at': 'TEXT',
+            'token_invalid_at': 'TEXT'
+        })
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_pages_page_id ON user_facebook_pages(page_id)")
+
+    def _migration_engagement_heatmap(self, cursor):
+        """
+        Міграція 7: теплова карта (користувач, сторінка, день тижня, година) ->
+        кількість публікацій, сума та сума квадратів engagement_rate
+
+        Таблицю підтримують тригери на analytics: кожен INSERT/UPDATE/DELETE
+        аналітики змінює лише свій слот, тож читання карти - до 168 рядків
+        за первинним ключем. user_id = 0 - пости без користувача.
+        """
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_publications_post_id 
-            ON publications(post_id)
+            CREATE TABLE IF NOT EXISTS engagement_heatmap (
+                user_id INTEGER NOT NULL DEFAULT 0,
+                page_id TEXT NOT NULL,
+                day_of_week INTEGER NOT NULL,
+                hour_of_day INTEGER NOT NULL,
+                posts_count INTEGER NOT NULL DEFAULT 0,
+                engagement_sum REAL NOT NULL DEFAULT 0,
+                engagement_sq_sum REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, page_id, day_of_week, hour_of_day)
+            ) WITHOUT ROWID
         """)
-        
+
+        # Година/день тижня старих записів - з часу публікації (0 = понеділок), до створення тригерів
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_publications_status 
-            ON publications(status)
+            UPDATE analytics SET
+                hour_of_day = (SELECT CAST(strftime('%H', pub.published_at) AS INTEGER)
+                               FROM publications pub WHERE pub.id = analytics.publication_id),
+                day_of_week = (SELECT (CAST(strftime('%w', pub.published_at) AS INTEGER) + 6) % 7
+                               FROM publications pub WHERE pub.id = analytics.publication_id)
+            WHERE hour_of_day IS NULL OR day_of_week IS NULL
         """)
-        
+
+        # Ключ слоту для рядка аналітики: власник поста та сторінка публікації
+        slot_owner = """
+            SELECT COALESCE(p.user_id, 0), pub.page_id FROM publications pub
+            LEFT JOIN posts p ON p.id = pub.post_id
+            WHERE pub.id = {row}.publication_id
+        """
+        add_row = f"""
+            INSERT INTO engagement_heatmap
+                (user_id, page_id, day_of_week, hour_of_day, posts_count, engagement_sum, engagement_sq_sum)
+            SELECT COALESCE(p.user_id, 0), pub.page_id, new.day_of_week, new.hour_of_day,
+                   1, new.engagement_rate, new.engagement_rate * new.engagement_rate
+            FROM publications pub
+            LEFT JOIN posts p ON p.id = pub.post_id
+            WHERE pub.id = new.publication_id
+            AND new.day_of_week IS NOT NULL AND new.hour_of_day IS NOT NULL
+            ON CONFLICT (user_id, page_id, day_of_week, hour_of_day) DO UPDATE SET
+                posts_count = posts_count + 1,
+                engagement_sum = engagement_sum + excluded.engagement_sum,
+                engagement_sq_sum = engagement_sq_sum + excluded.engagement_sq_sum;
+        """
+        remove_row = f"""
+            UPDATE engagement_heatmap SET
+                posts_count = posts_count - 1,
+                engagement_sum = engagement_sum - old.engagement_rate,
+                engagement_sq_sum = engagement_sq_sum - old.engagement_rate * old.engagement_rate
+            WHERE (user_id, page_id) = ({slot_owner.format(row='old')})
+            AND day_of_week = old.day_of_week AND hour_of_day = old.hour_of_day;
+        """
+
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS engagement_heatmap_ai AFTER INSERT ON analytics BEGIN
+                {add_row}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS engagement_heatmap_ad AFTER DELETE ON analytics BEGIN
+                {remove_row}
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS engagement_heatmap_au
+            AFTER UPDATE OF engagement_rate, day_of_week, hour_of_day ON analytics BEGIN
+                {remove_row}
+                {add_row}
+            END
+        """)
+
+        self.rebuild_engagement_heatmap(cursor)
+
+    def _migration_recommendation_data_fingerprint(self, cursor):
+        """
+        Міграція 8: відбиток запуску рекомендацій (параметри, область, водяний знак аналітики)
+
+        Якщо відбиток не змінився, новий запуск повертає збережену рекомендацію.
+        """
+        self._add_missing_columns(cursor, 'ai_recommendations', {
+            'data_fingerprint': 'TEXT'
+        })
+
+    def _migration_recommendation_status_index(self, cursor):
+        """Міграція 9: індекс (status, created_at) для вибірок рекомендацій за статусом"""
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_analytics_publication_id 
-            ON analytics(publication_id)
+            CREATE INDEX IF NOT EXISTS idx_recommendations_status_created
+            ON ai_recommendations(status, created_at DESC)
         """)
-        
+
+    def _migration_data_versions(self, cursor):
+        """
+        Міграція 10: лічильники змін даних (область, користувач) для ETag відповідей API
+
+        Тригери збільшують версію при кожному INSERT/UPDATE/DELETE у відповідних
+        таблицях, тож версії змінюються незалежно від того, хто пише в БД
+        (API, фонові задачі чи інший процес). user_id = 0 - дані без користувача.
+        """
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_analytics_engagement_rate 
-            ON analytics(engagement_rate DESC)
+            CREATE TABLE IF NOT EXISTS data_versions (
+                scope TEXT NOT NULL,
+                user_id INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP,
+                PRIMARY KEY (scope, user_id)
+            ) WITHOUT ROWID
         """)
-        
+
+        post_owner = "COALESCE((SELECT user_id FROM posts WHERE id = {row}.post_id), 0)"
+        analytics_owner = """COALESCE((
+            SELECT p.user_id FROM publications pub
+            JOIN posts p ON p.id = pub.post_id
+            WHERE pub.id = {row}.publication_id
+        ), 0)"""
+        # Таблиця -> (область версії, власник рядка, умова для UPDATE)
+        tracked = {
+            'posts': ('posts', "COALESCE({row}.user_id, 0)", None),
+            'publications': ('posts', post_owner, None),
+            # Збір аналітики переписує всі рядки - версія росте лише при зміні метрик
+            'analytics': ('analytics', analytics_owner, """
+                old.likes IS NOT new.likes OR old.comments IS NOT new.comments
+                OR old.shares IS NOT new.shares OR old.impressions IS NOT new.impressions
+                OR old.engagement_rate IS NOT new.engagement_rate
+                OR old.hour_of_day IS NOT new.hour_of_day OR old.day_of_week IS NOT new.day_of_week
+            """),
+            'templates': ('templates', "0", None),
+            'ai_recommendations': ('recommendations', "COALESCE({row}.user_id, 0)", None),
+        }
+
+        for table, (scope, owner, update_condition) in tracked.items():
+            for suffix, event, row in (('ai', 'INSERT', 'new'), ('au', 'UPDATE', 'new'), ('ad', 'DELETE', 'old')):
+                condition = f"WHEN {update_condition}" if event == 'UPDATE' and update_condition else ""
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS data_versions_{table}_{suffix}
+                    AFTER {event} ON {table} {condition} BEGIN
+                        INSERT INTO data_versions (scope, user_id, version, updated_at)
+                        VALUES ('{scope}', {owner.format(row=row)}, 1, CURRENT_TIMESTAMP)
+                        ON CONFLICT (scope, user_id) DO UPDATE SET
+                            version = version + 1,
+                            updated_at = excluded.updated_at;
+                    END
+                """)
+
+    def _migration_recommendation_latest_index(self, cursor):
+        """
+        Міграція 11: індекс (user_id, page_id, status, created_at, id) для останньої рекомендації області
+
+        Запит _get_cached_recommendation читає перший рядок індексу без
+        тимчасового B-дерева для ORDER BY; індекс (status, created_at)
+        з міграції 9 цей запит не використовував.
+        """
+        cursor.execute("DROP INDEX IF EXISTS idx_recommendations_status_created")
         cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_recommendations_created_at 
-            ON ai_recommendations(created_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_recommendations_latest
+            ON ai_recommendations(user_id, page_id, status, created_at DESC, id DESC)
         """)
-        
-        conn.commit()
-        conn.close()
 
-        logger.info("База даних ініціалізована з індексами")
+    def _migration_post_updated_at(self, cursor):
+        """
+        Міграція 12: posts.updated_at - час останньої зміни поста
 
-    def _run_migrations(self, cursor):
-        """Виконує міграції бази даних"""
-        # Міграція 1: Створення таблиці користувачів
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-        if cursor.fetchone() is None:
-            logger.info("Виконується міграція: додавання таблиці користувачів...")
+        Колонку оновлює тригер після кожного UPDATE (API, планувальник, будь-який
+        інший код), тож експорт з since бачить правки та зміни статусу
+        існуючих постів, а не лише нові.
+        """
+        self._add_missing_columns(cursor, 'posts', {
+            'updated_at': 'TIMESTAMP'
+        })
+        cursor.execute("UPDATE posts SET updated_at = created_at WHERE updated_at IS NULL")
 
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    facebook_id TEXT UNIQUE NOT NULL,
-                    email TEXT,
-                    full_name TEXT,
-                    profile_picture TEXT,
-                    facebook_app_id TEXT,
-                    facebook_app_secret TEXT,
-                    facebook_access_token TEXT,
-                    facebook_token_expires_at TEXT,
-                    role TEXT DEFAULT 'user',
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_login TIMESTAMP
-                )
-            """)
+        # WHEN: явно встановлений updated_at не перезаписується (і тригер не спрацьовує на власний UPDATE)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS posts_touch_updated_at
+            AFTER UPDATE ON posts WHEN new.updated_at IS old.updated_at BEGIN
+                UPDATE posts SET updated_at = CURRENT_TIMESTAMP WHERE id = new.id;
+            END
+        """)
 
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_facebook_id ON users(facebook_id)")
-            logger.info("Таблиця users створена")
-
-        # Міграція 2: Додавання user_id до posts та publications
-        cursor.execute("PRAGMA table_info(posts)")
-        posts_columns = [col[1] for col in cursor.fetchall()]
-        if 'user_id' not in posts_columns:
-            logger.info("Додавання поля user_id до таблиці posts...")
-            cursor.execute("ALTER TABLE posts ADD COLUMN user_id INTEGER")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts(user_id)")
-
-        cursor.execute("PRAGMA table_info(publications)")
-        pubs_columns = [col[1] for col in cursor.fetchall()]
-        if 'user_id' not in pubs_columns:
-            logger.info("Додавання поля user_id до таблиці publications...")
-            cursor.execute("ALTER TABLE publications ADD COLUMN user_id INTEGER")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_publications_user_id ON publications(user_id)")
-
-        # Міграція 3: Створення таблиці user_facebook_pages (ВИКОНУЄТЬСЯ ЗАВЖДИ)
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_facebook_pages'")
-        if cursor.fetchone() is None:
-            logger.info("Виконується міграція: додавання таблиці user_facebook_pages...")
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS user_facebook_pages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    page_id TEXT NOT NULL,
-                    page_name TEXT,
-                    access_token TEXT NOT NULL,
-                    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                    UNIQUE(user_id, page_id)
-                )
-            """)
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_pages_user_id ON user_facebook_pages(user_id)")
-            logger.info("Таблиця user_facebook_pages створена")
+    def get_data_version(self, scopes: List[str], user_id: Optional[int] = None) -> Dict:
+        """
+        Поточна версія даних для областей (posts, analytics, templates, recommendations)
 
-        # Міграція 4: Додавання полів facebook_app_id та facebook_app_secret до users
-        cursor.execute("PRAGMA table_info(users)")
-        users_columns = [col[1] for col in cursor.fetchall()]
+        Args:
+            scopes: області, від яких залежить відповідь
+            user_id: користувач (None - сума по всіх користувачах)
 
-        if 'facebook_app_id' not in users_columns:
-            logger.info("Додавання поля facebook_app_id до таблиці users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN facebook_app_id TEXT")
+        Returns:
+            Dict: version - рядок версії (змінюється після кожного запису),
+                updated_at - час останньої зміни (UTC) або None
+        """
+        placeholders = ', '.join('?' for _ in scopes)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT scope, TOTAL(version) as version, MAX(updated_at) as updated_at
+            FROM data_versions
+            WHERE scope IN ({placeholders}) AND (? IS NULL OR user_id = ?)
+            GROUP BY scope
+        """, [*scopes, user_id, user_id])
+        rows = {row['scope']: row for row in cursor.fetchall()}
+        conn.close()
 
-        if 'facebook_app_secret' not in users_columns:
-            logger.info("Додавання поля facebook_app_secret до таблиці users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN facebook_app_secret TEXT")
+        # Версії лише зростають, тож сума по користувачах теж змінюється при кожному записі
+        version = '.'.join(str(int(rows[scope]['version'])) if scope in rows else '0' for scope in scopes)
+        updated = [row['updated_at'] for row in rows.values() if row['updated_at']]
+        return {'version': version, 'updated_at': max(updated) if updated else None}
 
-        # Міграція 5: Додавання полів facebook_access_token та facebook_token_expires_at
-        cursor.execute("PRAGMA table_info(users)")
-        users_columns = [col[1] for col in cursor.fetchall()]
+    def rebuild_engagement_heatmap(self, cursor):
+        """Перераховує теплову карту з таблиці analytics (після масового імпорту чи ручних змін)"""
+        cursor.execute("DELETE FROM engagement_heatmap")
+        cursor.execute("""
+            INSERT INTO engagement_heatmap
+                (user_id, page_id, day_of_week, hour_of_day, posts_count, engagement_sum, engagement_sq_sum)
+            SELECT COALESCE(p.user_id, 0), pub.page_id, a.day_of_week, a.hour_of_day,
+                   COUNT(*), SUM(a.engagement_rate), SUM(a.engagement_rate * a.engagement_rate)
+            FROM analytics a
+            JOIN publications pub ON pub.id = a.publication_id
+            LEFT JOIN posts p ON p.id = pub.post_id
+            WHERE a.day_of_week IS NOT NULL AND a.hour_of_day IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+        """)
 
-        if 'facebook_access_token' not in users_columns:
-            logger.info("Додавання поля facebook_access_token до таблиці users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN facebook_access_token TEXT")
+    def _init_search_index(self, cursor):
+        """
+        Міграція 2: FTS5-індекси для постів і шаблонів та тригери синхронізації
 
-        if 'facebook_token_expires_at' not in users_columns:
-            logger.info("Додавання поля facebook_token_expires_at до таблиці users...")
-            cursor.execute("ALTER TABLE users ADD COLUMN facebook_token_expires_at TEXT")
+        Індекси використовують external content (дані не дублюються),
+        тригери підтримують їх в актуальному стані при INSERT/UPDATE/DELETE.
+        Якщо SQLite зібрано без FTS5 - пошук працює через LIKE.
+        """
+        try:
+            for fts_table, source, columns in SEARCH_INDEXES:
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (fts_table,))
+                is_new = cursor.fetchone() is None
+
+                column_list = ', '.join(columns)
+                new_values = ', '.join(f"new.{c}" for c in columns)
+                old_values = ', '.join(f"old.{c}" for c in columns)
+
+                cursor.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                        {column_list},
+                        content='{source}',
+                        content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2'
+                    )
+                """)
+
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source} BEGIN
+                        INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+                    END
+                """)
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source} BEGIN
+                        INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                    END
+                """)
+                cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {source} BEGIN
+                        INSERT INTO {fts_table}({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO {fts_table}(rowid, {column_list}) VALUES (new.id, {new_values});
+                    END
+                """)
+
+                if is_new:
+                    logger.info(f"Побудова пошукового індексу {fts_table}...")
+                    cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+
+            self.fts_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 недоступний, пошук працюватиме через LIKE: {str(e)}")
+            self.fts_enabled = False
+
+    def rebuild_search_index(self, cursor):
+        """Перебудовує пошукові індекси (після масового імпорту)"""
+        if not self.fts_enabled:
+            return
+        for fts_table, _, _ in SEARCH_INDEXES:
+            cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
 
     def calculate_engagement_rate(self, likes: int, comments: int, shares: int, impressions: int) -> float:
         """
@@ -323,12 +772,13 @@ class Database:
         
         return round(rate, 4)
     
-    def extract_post_metadata(self, post_id: int) -> Dict:
+    def extract_post_metadata(self, post_id: int, published_at: Optional[str] = None) -> Dict:
         """
         Витягує метадані поста для аналітики
         
         Args:
             post_id: ID поста
+            published_at: час публікації на сторінці (за замовчуванням posts.published_at)
             
         Returns:
             Dict: метадані поста
@@ -355,7 +805,7 @@ class Database:
         image_count = len(image_urls) if image_urls else 0
         
         # Час публікації
-        published_at = post.get('published_at')
+        published_at = published_at or post.get('published_at')
         hour_of_day = None
         day_of_week = None
         
@@ -380,7 +830,8 @@ class Database:
                    is_ai_generated: bool = False, ai_prompt: Optional[str] = None,
                    scheduled_time: Optional[datetime] = None,
                    image_urls: Optional[List[str]] = None,
-                   user_id: Optional[int] = None) -> int:
+                   user_id: Optional[int] = None,
+                   conn: Optional[sqlite3.Connection] = None) -> int:
         """
         Створює новий пост з валідацією
         
@@ -391,6 +842,7 @@ class Database:
             ai_prompt: Промпт для AI
             scheduled_time: Час планування
             image_urls: Список URLs зображень
+            conn: відкрите з'єднання зовнішньої транзакції (commit робить викликач)
             
         Returns:
             int: ID створеного поста
@@ -411,7 +863,9 @@ class Database:
         # Конвертуємо список URLs в JSON
         image_urls_json = json.dumps(image_urls) if image_urls else None
         
-        conn = self.get_connection()
+        own_connection = conn is None
+        if own_connection:
+            conn = self.get_connection()
         cursor = conn.cursor()
 
         cursor.execute("""
@@ -420,11 +874,45 @@ class Database:
         """, (content, link, image_urls_json, is_ai_generated, ai_prompt, scheduled_time, user_id))
         
         post_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        if own_connection:
+            conn.commit()
+            conn.close()
         
         logger.info(f"Створено пост ID: {post_id}")
         return post_id
+
+    def create_posts(self, posts: List[Dict], user_id: Optional[int] = None) -> List[int]:
+        """
+        Створює кілька постів в одній транзакції (через create_post)
+
+        Якщо хоча б один пост не проходить валідацію, жоден не зберігається.
+
+        Args:
+            posts: список словників з аргументами create_post (content, ai_prompt, ...)
+            user_id: власник постів
+
+        Returns:
+            List[int]: ID створених постів у порядку вхідного списку
+
+        Raises:
+            ValueError: Якщо дані хоча б одного поста невалідні
+        """
+        if not posts:
+            return []
+
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            post_ids = [self.create_post(**post, user_id=user_id, conn=conn) for post in posts]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"Створено {len(post_ids)} постів однією транзакцією")
+        return post_ids
     
     def add_publication(self, post_id: int, page_id: str, page_name: str, user_id: Optional[int] = None) -> int:
         """
@@ -498,22 +986,25 @@ class Database:
             conn.close()
     
     def get_post_by_id(self, post_id: int) -> Optional[Dict]:
-        """Отримує пост за ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM posts WHERE id = ?", (post_id,))
-        row = cursor.fetchone()
+        """Отримує пост за ID (з архіву, якщо пост вже заархівовано)"""
+        rows, archived = self._fetch_with_archive("SELECT * FROM {schema}.posts WHERE id = ?", (post_id,))
         
-        conn.close()
-        
-        if row:
-            post = dict(row)
+        if rows:
+            post = dict(rows[0])
             # Парсимо image_urls з JSON
             if post.get('image_urls'):
                 post['image_urls'] = json.loads(post['image_urls'])
+            if archived:
+                post['archived'] = True
             return post
         return None
+
+    def get_publications_by_post(self, post_id: int) -> List[Dict]:
+        """Отримує публікації поста (з архіву, якщо пост вже заархівовано)"""
+        rows, _ = self._fetch_with_archive(
+            "SELECT * FROM {schema}.publications WHERE post_id = ?", (post_id,)
+        )
+        return [dict(row) for row in rows]
     
     def get_all_posts(self, limit: int = 50, offset: int = 0, user_id: Optional[int] = None) -> List[Dict]:
         """Отримує всі пости з пагінацією та фільтром по користувачу"""
@@ -578,8 +1069,8 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Отримуємо post_id з publication
-        cursor.execute("SELECT post_id FROM publications WHERE id = ?", (publication_id,))
+        # Отримуємо post_id та час публікації з publication
+        cursor.execute("SELECT post_id, published_at FROM publications WHERE id = ?", (publication_id,))
         result = cursor.fetchone()
         
         if not result:
@@ -589,8 +1080,8 @@ class Database:
         
         post_id = result['post_id']
         
-        # Витягуємо метадані поста
-        metadata = self.extract_post_metadata(post_id)
+        # Витягуємо метадані поста (година/день тижня - за фактичним часом публікації)
+        metadata = self.extract_post_metadata(post_id, result['published_at'])
         
         # Розраховуємо engagement rate
         likes = analytics_data.get('likes', 0)
@@ -610,17 +1101,7 @@ class Database:
         reactions_json = json.dumps(analytics_data.get('reactions', {}))
         
         if existing:
-            # Оновлюємо існуючий запис
-            cursor.execute("""
-                UPDATE analytics 
-                SET likes = ?, comments = ?, shares = ?, 
-                    impressions = ?, engaged_users = ?, clicks = ?,
-                    reactions = ?, engagement_rate = ?,
-                    text_length = ?, has_link = ?, has_images = ?, image_count = ?,
-                    hour_of_day = ?, day_of_week = ?,
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE publication_id = ?
-            """, (
+            values = (
                 likes, comments, shares,
                 impressions,
                 analytics_data.get('engaged_users', 0),
@@ -632,9 +1113,26 @@ class Database:
                 metadata.get('has_images', False),
                 metadata.get('image_count', 0),
                 metadata.get('hour_of_day'),
-                metadata.get('day_of_week'),
-                publication_id
-            ))
+                metadata.get('day_of_week')
+            )
+            # Оновлюємо існуючий запис; updated_at змінюється лише якщо змінились дані -
+            # інакше кожен цикл збору зсував би водяний знак рекомендацій
+            cursor.execute("""
+                UPDATE analytics 
+                SET likes = ?, comments = ?, shares = ?, 
+                    impressions = ?, engaged_users = ?, clicks = ?,
+                    reactions = ?, engagement_rate = ?,
+                    text_length = ?, has_link = ?, has_images = ?, image_count = ?,
+                    hour_of_day = ?, day_of_week = ?,
+                    updated_at = CASE
+                        WHEN (likes, comments, shares, impressions, engaged_users, clicks,
+                              reactions, engagement_rate, text_length, has_link, has_images, image_count,
+                              hour_of_day, day_of_week)
+                             IS (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        THEN updated_at ELSE CURRENT_TIMESTAMP
+                    END
+                WHERE publication_id = ?
+            """, (*values, *values, publication_id))
         else:
             # Створюємо новий запис
             cursor.execute("""
@@ -665,25 +1163,56 @@ class Database:
         
         logger.info(f"Аналітика збережена для публікації ID: {publication_id} (ER: {engagement_rate})")
     
-    def get_analytics_by_post(self, post_id: int) -> List[Dict]:
-        """Отримує аналітику для всіх публікацій поста"""
+    def get_engagement_heatmap(self, user_id: Optional[int] = None, page_id: Optional[str] = None) -> List[Dict]:
+        """
+        Слоти теплової карти engagement (лише непорожні)
+
+        Args:
+            user_id: користувач (None - пости без користувача)
+            page_id: сторінка (None - сумарно по всіх сторінках користувача)
+
+        Returns:
+            List[Dict]: day_of_week, hour_of_day, posts_count, engagement_sum, engagement_sq_sum
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        cursor.execute("""
+
+        if page_id is None:
+            cursor.execute("""
+                SELECT day_of_week, hour_of_day,
+                       SUM(posts_count) as posts_count,
+                       SUM(engagement_sum) as engagement_sum,
+                       SUM(engagement_sq_sum) as engagement_sq_sum
+                FROM engagement_heatmap
+                WHERE user_id = ? AND posts_count > 0
+                GROUP BY day_of_week, hour_of_day
+            """, (user_id or 0,))
+        else:
+            cursor.execute("""
+                SELECT day_of_week, hour_of_day, posts_count, engagement_sum, engagement_sq_sum
+                FROM engagement_heatmap
+                WHERE user_id = ? AND page_id = ? AND posts_count > 0
+            """, (user_id or 0, page_id))
+
+        cells = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return cells
+
+    def get_analytics_by_post(self, post_id: int) -> List[Dict]:
+        """Отримує аналітику для всіх публікацій поста (з архіву, якщо пост заархівовано)"""
+        rows, _ = self._fetch_with_archive("""
             SELECT a.*, pub.page_name, pub.facebook_post_id
-            FROM analytics a
-            JOIN publications pub ON a.publication_id = pub.id
+            FROM {schema}.analytics a
+            JOIN {schema}.publications pub ON a.publication_id = pub.id
             WHERE pub.post_id = ?
         """, (post_id,))
         
         analytics = []
-        for row in cursor.fetchall():
+        for row in rows:
             item = dict(row)
             item['reactions'] = json.loads(item['reactions']) if item['reactions'] else {}
             analytics.append(item)
         
-        conn.close()
         return analytics
     
     def get_best_performing_posts(self, metric: str = 'likes', limit: int = 10) -> List[Dict]:
@@ -823,8 +1352,9 @@ class Database:
         }
     
     def create_template(self, name: str, content: str, is_ai_prompt: bool = False,
-                       based_on_recommendations: bool = False, recommendation_id: Optional[int] = None) -> int:
-        """Створює шаблон поста"""
+                       based_on_recommendations: bool = False, recommendation_id: Optional[int] = None,
+                       generated_content: Optional[str] = None) -> int:
+        """Створює шаблон поста (generated_content - згенерована AI чернетка для промпт-шаблону)"""
         if not name or len(name.strip()) == 0:
             raise ValueError("Назва шаблону не може бути пустою")
 
@@ -835,9 +1365,10 @@ class Database:
         cursor = conn.cursor()
 
         cursor.execute("""
-            INSERT INTO templates (name, content, is_ai_prompt, based_on_recommendations, recommendation_id)
-            VALUES (?, ?, ?, ?, ?)
-        """, (name, content, is_ai_prompt, based_on_recommendations, recommendation_id))
+            INSERT INTO templates (name, content, is_ai_prompt, based_on_recommendations, recommendation_id,
+                                   generated_content)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (name, content, is_ai_prompt, based_on_recommendations, recommendation_id, generated_content))
 
         template_id = cursor.lastrowid
         conn.commit()
@@ -874,11 +1405,32 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        # Завдяки CASCADE, достатньо видалити тільки пост
+        # Аналітику видаляємо явно (тригери оновлюють теплову карту), решту - CASCADE
+        cursor.execute("""
+            DELETE FROM analytics WHERE publication_id IN
+            (SELECT id FROM publications WHERE post_id = ?)
+        """, (post_id,))
         cursor.execute("DELETE FROM posts WHERE id = ?", (post_id,))
         
         conn.commit()
         conn.close()
+
+        # Пост міг бути заархівований - у архіві каскадів немає, видаляємо явно
+        if self.has_archive():
+            conn = self.get_connection(with_archive=True)
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    DELETE FROM archive.analytics WHERE publication_id IN
+                    (SELECT id FROM archive.publications WHERE post_id = ?)
+                """, (post_id,))
+                cursor.execute("DELETE FROM archive.publications WHERE post_id = ?", (post_id,))
+                cursor.execute("DELETE FROM archive.posts WHERE id = ?", (post_id,))
+                conn.commit()
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                conn.close()
         
         logger.info(f"Пост ID {post_id} видалено")
     
@@ -924,21 +1476,571 @@ class Database:
         data['templates'] = [dict(row) for row in cursor.fetchall()]
         
         conn.close()
+
+        # Заархівовані записи
+        if self.has_archive():
+            conn = self.get_connection(with_archive=True)
+            cursor = conn.cursor()
+            try:
+                for table in ARCHIVE_TABLES:
+                    cursor.execute(f"SELECT * FROM archive.{table}")
+                    for row in cursor.fetchall():
+                        item = dict(row)
+                        if table == 'posts' and item.get('image_urls'):
+                            item['image_urls'] = json.loads(item['image_urls'])
+                        data[table].append(item)
+            except sqlite3.OperationalError:
+                pass
+            finally:
+                conn.close()
         
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2, default=str)
         
         logger.info(f"Дані експортовано в {filename}")
         return filename
-    
-    def get_posts_by_date_range(self, start_date: datetime, end_date: datetime) -> List[Dict]:
+
+    def _open_export_file(self, filename: str, mode: str, compression: Optional[str] = None):
         """
-        Отримує пости за діапазоном дат
-        
+        Відкриває файл експорту в текстовому режимі з опціональним стисненням
+
         Args:
-            start_date: Початкова дата
-            end_date: Кінцева дата
-            
+            filename: шлях до файлу
+            mode: 'r' або 'w'
+            compression: None (за розширенням), 'none', 'gzip' або 'zstd'
+        """
+        if compression is None:
+            if filename.endswith('.gz'):
+                compression = 'gzip'
+            elif filename.endswith('.zst'):
+                compression = 'zstd'
+            else:
+                compression = 'none'
+
+        if compression == 'none':
+            return open(filename, mode, encoding='utf-8')
+
+        if compression == 'gzip':
+            return gzip.open(filename, mode + 't', encoding='utf-8')
+
+        if compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("Для стиснення zstd встановіть пакет zstandard")
+
+            if mode == 'w':
+                stream = zstandard.ZstdCompressor().stream_writer(open(filename, 'wb'))
+            else:
+                stream = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'))
+            return io.TextIOWrapper(stream, encoding='utf-8')
+
+        raise ValueError(f"Невідомий тип стиснення: {compression}")
+
+    def export_to_ndjson(self, filename: str = "backup.ndjson", compression: Optional[str] = None,
+                         since: Optional[datetime] = None, chunk_size: int = 1000,
+                         include_archive: bool = True) -> Dict:
+        """
+        Потоково експортує дані в NDJSON (таблиця за таблицею, з постійним споживанням пам'яті)
+
+        Перший рядок - заголовок, далі по одному рядку на запис:
+        {"table": "posts", "row": {...}}. Значення колонок зберігаються як є в БД,
+        тож файл придатний для відновлення через import_from_ndjson.
+
+        Args:
+            filename: шлях до файлу (.gz / .zst вмикають стиснення автоматично)
+            compression: 'none', 'gzip' або 'zstd' (None - за розширенням)
+            since: експортувати лише записи, створені/оновлені після цієї дати
+                (наївна дата чи рядок - локальний час, як datetime.now())
+            chunk_size: кількість рядків, що читаються з курсора за раз
+            include_archive: додати записи з архівної БД
+
+        Returns:
+            Dict: кількість експортованих рядків по таблицях
+        """
+        with_archive = include_archive and self.has_archive()
+        conn = self.get_connection(with_archive=with_archive)
+        cursor = conn.cursor()
+
+        schemas = ['main']
+        if with_archive:
+            cursor.execute("SELECT name FROM archive.sqlite_master WHERE type='table'")
+            if {row['name'] for row in cursor.fetchall()} >= set(ARCHIVE_TABLES):
+                # Архів, створений до нових колонок (напр. posts.updated_at), отримує їх для фільтра since
+                self._ensure_archive_schema(cursor)
+                conn.commit()
+                schemas.append('archive')
+
+        since_params = None
+        if since:
+            if not isinstance(since, datetime):
+                since = datetime.fromisoformat(str(since))
+            # created_at/updated_at заповнює CURRENT_TIMESTAMP (UTC) - межу переводимо з локального часу
+            since_params = {
+                'since': since.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                'since_local': since.astimezone().strftime('%Y-%m-%d %H:%M:%S')
+            }
+        counts = {}
+
+        try:
+            with self._open_export_file(filename, 'w', compression) as f:
+                header = {
+                    'type': 'header',
+                    'format': 'ndjson',
+                    'version': 1,
+                    'export_date': datetime.now().isoformat(),
+                    'since': since_params['since'] if since_params else None,
+                    'tables': list(EXPORT_TABLES)
+                }
+                f.write(json.dumps(header, ensure_ascii=False) + '\n')
+
+                for table, since_filter in EXPORT_TABLES.items():
+                    counts[table] = 0
+
+                    for schema in schemas:
+                        if schema == 'archive' and table not in ARCHIVE_TABLES:
+                            continue
+
+                        if since_params:
+                            cursor.execute(
+                                f"SELECT * FROM {schema}.{table} WHERE {since_filter.format(schema=schema)} ORDER BY id",
+                                since_params
+                            )
+                        else:
+                            cursor.execute(f"SELECT * FROM {schema}.{table} ORDER BY id")
+
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+
+                            f.writelines(
+                                json.dumps({'table': table, 'row': dict(row)}, ensure_ascii=False, default=str) + '\n'
+                                for row in rows
+                            )
+                            counts[table] += len(rows)
+        finally:
+            conn.close()
+
+        logger.info(f"Дані потоково експортовано в {filename}: {counts}")
+        return counts
+
+    def import_from_ndjson(self, filename: str, compression: Optional[str] = None,
+                           chunk_size: int = 1000) -> Dict:
+        """
+        Потоково відновлює дані з файлу, створеного export_to_ndjson
+
+        Записи вставляються через INSERT OR REPLACE пачками в одній транзакції,
+        тож інкрементальний експорт можна накладати поверх повного.
+
+        Args:
+            filename: шлях до файлу
+            compression: 'none', 'gzip' або 'zstd' (None - за розширенням)
+            chunk_size: розмір пачки для executemany
+
+        Returns:
+            Dict: кількість імпортованих рядків по таблицях
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        # Дозволені колонки кожної таблиці - імена з файлу потрапляють у SQL
+        table_columns = {}
+        for table in EXPORT_TABLES:
+            cursor.execute(f"PRAGMA table_info({table})")
+            table_columns[table] = {column[1] for column in cursor.fetchall()}
+
+        counts = {table: 0 for table in EXPORT_TABLES}
+        batch = []
+        batch_key = None
+
+        def flush():
+            if batch:
+                table, columns = batch_key
+                placeholders = ', '.join('?' for _ in columns)
+                cursor.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                    batch
+                )
+                counts[table] += len(batch)
+                batch.clear()
+
+        try:
+            with self._open_export_file(filename, 'r', compression) as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    record = json.loads(line)
+                    if record.get('type') == 'header':
+                        continue
+
+                    table = record.get('table')
+                    row = record.get('row') or {}
+                    if table not in table_columns:
+                        raise ValueError(f"Невідома таблиця в експорті: {table}")
+
+                    unknown = set(row) - table_columns[table]
+                    if unknown:
+                        raise ValueError(f"Невідомі колонки таблиці {table}: {', '.join(sorted(unknown))}")
+
+                    key = (table, tuple(row))
+                    if key != batch_key or len(batch) >= chunk_size:
+                        flush()
+                        batch_key = key
+                    batch.append(tuple(row.values()))
+
+                flush()
+
+            # INSERT OR REPLACE не викликає тригери видалення - індекс та теплову карту перебудовуємо повністю
+            self.rebuild_search_index(cursor)
+            self.rebuild_engagement_heatmap(cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"Дані імпортовано з {filename}: {counts}")
+        return counts
+
+    def get_cached_completion(self, cache_key: str, ttl_seconds: float) -> Optional[str]:
+        """
+        Повертає відповідь LLM з кешу (та оновлює час використання для LRU)
+
+        Args:
+            cache_key: ключ запиту
+            ttl_seconds: максимальний вік запису
+
+        Returns:
+            Optional[str]: відповідь або None, якщо запису немає чи він застарів
+        """
+        now = datetime.now().timestamp()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("SELECT response, created_at FROM llm_cache WHERE cache_key = ?", (cache_key,))
+            row = cursor.fetchone()
+
+            if not row:
+                return None
+
+            if now - row['created_at'] > ttl_seconds:
+                cursor.execute("DELETE FROM llm_cache WHERE cache_key = ?", (cache_key,))
+                conn.commit()
+                return None
+
+            cursor.execute("""
+                UPDATE llm_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?
+            """, (now, cache_key))
+            conn.commit()
+            return row['response']
+        finally:
+            conn.close()
+
+    def save_cached_completion(self, cache_key: str, model: str, response: str, max_entries: int = 1000):
+        """
+        Зберігає відповідь LLM у кеш, витісняючи найдавніше використані записи
+
+        Args:
+            cache_key: ключ запиту
+            model: модель (для статистики)
+            response: відповідь
+            max_entries: максимальна кількість записів у кеші
+        """
+        now = datetime.now().timestamp()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("""
+                INSERT OR REPLACE INTO llm_cache (cache_key, model, response, created_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+            """, (cache_key, model, response, now, now))
+
+            cursor.execute("SELECT COUNT(*) FROM llm_cache")
+            overflow = cursor.fetchone()[0] - max_entries
+            if overflow > 0:
+                cursor.execute("""
+                    DELETE FROM llm_cache WHERE cache_key IN
+                    (SELECT cache_key FROM llm_cache ORDER BY last_used_at ASC LIMIT ?)
+                """, (overflow,))
+
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_completion_cache_stats(self) -> Dict:
+        """Кількість записів у кеші LLM та сумарна кількість влучань"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT COUNT(*) as entries, COALESCE(SUM(hits), 0) as stored_hits FROM llm_cache")
+        stats = dict(cursor.fetchone())
+
+        conn.close()
+        return stats
+
+    def _ensure_archive_schema(self, cursor):
+        """
+        Створює таблиці в підключеній архівній БД та додає нові колонки
+
+        Порядок колонок повторює основну БД, тож записи переносяться 1:1.
+        """
+        for table in ARCHIVE_TABLES:
+            cursor.execute(f"PRAGMA main.table_info({table})")
+            main_columns = [(column[1], column[2]) for column in cursor.fetchall()]
+
+            cursor.execute(f"PRAGMA archive.table_info({table})")
+            archive_columns = {column[1] for column in cursor.fetchall()}
+
+            if not archive_columns:
+                column_defs = ', '.join(
+                    f"{name} INTEGER PRIMARY KEY" if name == 'id' else f"{name} {col_type}"
+                    for name, col_type in main_columns
+                )
+                cursor.execute(f"CREATE TABLE archive.{table} ({column_defs})")
+                index_column = ARCHIVE_INDEXES[table]
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS archive.idx_{table}_{index_column} ON {table}({index_column})"
+                )
+                logger.info(f"Створено архівну таблицю {table}")
+                continue
+
+            for name, col_type in main_columns:
+                if name not in archive_columns:
+                    logger.info(f"Додаємо колонку {name} до архівної таблиці {table}...")
+                    cursor.execute(f"ALTER TABLE archive.{table} ADD COLUMN {name} {col_type}")
+
+    def archive_old_data(self, older_than_days: int = 180, batch_size: int = 5000,
+                         vacuum: bool = False) -> Dict:
+        """
+        Переносить старі опубліковані пости разом з публікаціями та аналітикою в архівну БД
+
+        Пост архівується, якщо він опублікований (або завершився помилкою) і
+        остання його публікація старша за older_than_days. Кожна пачка
+        переноситься атомарно (INSERT в архів + DELETE з основної БД в одній транзакції).
+
+        Args:
+            older_than_days: вік у днях, після якого записи йдуть в архів
+            batch_size: кількість постів за одну транзакцію
+            vacuum: стиснути основну БД після перенесення
+
+        Returns:
+            Dict: кількість перенесених рядків по таблицях
+        """
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+        counts = {table: 0 for table in ARCHIVE_TABLES}
+
+        conn = self.get_connection(with_archive=True)
+        cursor = conn.cursor()
+
+        # Умови відбору рядків поточної пачки
+        batch_filters = {
+            'analytics': (
+                "publication_id IN (SELECT id FROM main.publications "
+                "WHERE post_id IN (SELECT id FROM temp.archive_batch))"
+            ),
+            'publications': "post_id IN (SELECT id FROM temp.archive_batch)",
+            'posts': "id IN (SELECT id FROM temp.archive_batch)"
+        }
+
+        try:
+            self._ensure_archive_schema(cursor)
+            conn.commit()
+
+            columns = {}
+            for table in ARCHIVE_TABLES:
+                cursor.execute(f"PRAGMA main.table_info({table})")
+                columns[table] = ', '.join(column[1] for column in cursor.fetchall())
+
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+
+            while True:
+                cursor.execute("""
+                    SELECT p.id FROM main.posts p
+                    WHERE p.status IN ('published', 'failed')
+                    AND datetime(COALESCE(
+                        (SELECT MAX(pub.published_at) FROM main.publications pub WHERE pub.post_id = p.id),
+                        p.published_at,
+                        p.created_at
+                    )) < datetime(?)
+                    LIMIT ?
+                """, (cutoff, batch_size))
+                post_ids = [(row['id'],) for row in cursor.fetchall()]
+
+                if not post_ids:
+                    break
+
+                cursor.execute("DELETE FROM temp.archive_batch")
+                cursor.executemany("INSERT INTO temp.archive_batch (id) VALUES (?)", post_ids)
+
+                # Аналітика першою - її фільтр посилається на публікації в main
+                for table in ('analytics', 'publications', 'posts'):
+                    cursor.execute(f"""
+                        INSERT OR REPLACE INTO archive.{table} ({columns[table]})
+                        SELECT {columns[table]} FROM main.{table} WHERE {batch_filters[table]}
+                    """)
+                    counts[table] += cursor.rowcount
+
+                for table in ('analytics', 'publications', 'posts'):
+                    cursor.execute(f"DELETE FROM main.{table} WHERE {batch_filters[table]}")
+
+                conn.commit()
+
+            cursor.execute("DROP TABLE IF EXISTS temp.archive_batch")
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        if vacuum and counts['posts']:
+            conn = self.get_connection()
+            conn.execute("VACUUM")
+            conn.close()
+
+        logger.info(f"Архівовано записи старші за {older_than_days} днів: {counts}")
+        return counts
+
+    def _build_search_query(self, query: str) -> Optional[str]:
+        """
+        Перетворює введений користувачем текст у безпечний FTS5-запит
+
+        Кожне слово береться в лапки (щоб спецсимволи не ламали синтаксис MATCH)
+        і шукається за префіксом.
+        """
+        terms = re.findall(r'\w+', query or '')
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"*' for term in terms[:16])
+
+    def _format_snippet(self, snippet: Optional[str]) -> Optional[str]:
+        """Екранує HTML у фрагменті та підсвічує збіги тегом <mark>"""
+        if not snippet:
+            return snippet
+        return html.escape(snippet).replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+    def search_posts(self, query: str, user_id: Optional[int] = None,
+                     limit: int = 20, offset: int = 0) -> List[Dict]:
+        """
+        Повнотекстовий пошук по тексту та AI-промптах постів
+
+        Args:
+            query: пошуковий запит
+            user_id: шукати тільки серед постів користувача
+            limit: кількість результатів
+            offset: зміщення для пагінації
+
+        Returns:
+            List[Dict]: пости, відсортовані за релевантністю, з полями snippet/prompt_snippet/rank
+        """
+        fts_query = self._build_search_query(query)
+        if not fts_query:
+            return []
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        user_filter = "AND p.user_id = ?" if user_id is not None else ""
+        params = [fts_query] + ([user_id] if user_id is not None else []) + [limit, offset]
+
+        if self.fts_enabled:
+            # bm25: збіг у тексті поста важливіший за збіг у промпті
+            cursor.execute(f"""
+                SELECT p.*,
+                       bm25(posts_fts, 1.0, 0.5) as rank,
+                       snippet(posts_fts, 0, '{SNIPPET_START}', '{SNIPPET_END}', '…', 24) as snippet,
+                       snippet(posts_fts, 1, '{SNIPPET_START}', '{SNIPPET_END}', '…', 12) as prompt_snippet
+                FROM posts_fts
+                JOIN posts p ON p.id = posts_fts.rowid
+                WHERE posts_fts MATCH ?
+                {user_filter}
+                ORDER BY rank
+                LIMIT ? OFFSET ?
+            """, params)
+        else:
+            like = f"%{query.strip()}%"
+            params = [like, like] + params[1:]
+            cursor.execute(f"""
+                SELECT p.*, 0 as rank, NULL as snippet, NULL as prompt_snippet
+                FROM posts p
+                WHERE (p.content LIKE ? OR p.ai_prompt LIKE ?)
+                {user_filter}
+                ORDER BY p.created_at DESC
+                LIMIT ? OFFSET ?
+            """, params)
+
+        posts = []
+        for row in cursor.fetchall():
+            post = dict(row)
+            if post.get('image_urls'):
+                post['image_urls'] = json.loads(post['image_urls'])
+            post['snippet'] = self._format_snippet(post['snippet'])
+            post['prompt_snippet'] = self._format_snippet(post['prompt_snippet'])
+            posts.append(post)
+
+        conn.close()
+        return posts
+
+    def search_templates(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Повнотекстовий пошук по шаблонах
+
+        Args:
+            query: пошуковий запит
+            limit: кількість результатів
+
+        Returns:
+            List[Dict]: шаблони, відсортовані за релевантністю
+        """
+        fts_query = self._build_search_query(query)
+        if not fts_query:
+            return []
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        if self.fts_enabled:
+            cursor.execute(f"""
+                SELECT t.*,
+                       bm25(templates_fts) as rank,
+                       snippet(templates_fts, 0, '{SNIPPET_START}', '{SNIPPET_END}', '…', 24) as snippet
+                FROM templates_fts
+                JOIN templates t ON t.id = templates_fts.rowid
+                WHERE templates_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            """, (fts_query, limit))
+        else:
+            cursor.execute("""
+                SELECT t.*, 0 as rank, NULL as snippet
+                FROM templates t
+                WHERE t.content LIKE ?
+                ORDER BY t.created_at DESC
+                LIMIT ?
+            """, (f"%{query.strip()}%", limit))
+
+        templates = []
+        for row in cursor.fetchall():
+            template = dict(row)
+            template['snippet'] = self._format_snippet(template['snippet'])
+            templates.append(template)
+
+        conn.close()
+        return templates
+    
+    def get_posts_by_date_range(self, start_date: datetime, end_date: datetime) -> List[Dict]:
+        """
+        Отримує пости за діапазоном дат
+        
+        Args:
+            start_date: Початкова дата
+            end_date: Кінцева дата
+            
         Returns:
             List[Dict]: Список постів
         """
@@ -964,7 +2066,10 @@ class Database:
     
     def save_recommendation(self, period_start: datetime, period_end: datetime,
                            analyzed_posts_count: int, recommendations: Dict,
-                           patterns: Dict, status: str = 'completed') -> int:
+                           patterns: Dict, status: str = 'completed',
+                           input_fingerprint: Optional[str] = None,
+                           user_id: Optional[int] = None, page_id: Optional[str] = None,
+                           data_fingerprint: Optional[str] = None) -> int:
         """
         Зберігає AI рекомендацію в базу даних
         
@@ -975,6 +2080,10 @@ class Database:
             recommendations: словник з рекомендаціями
             patterns: словник з виявленими патернами
             status: статус ('pending', 'completed', 'failed')
+            input_fingerprint: відбиток набору проаналізованих постів
+            user_id: користувач, для якого побудовано рекомендацію (None - загальна)
+            page_id: сторінка користувача (None - усі сторінки)
+            data_fingerprint: відбиток запуску з водяним знаком аналітики
         
         Returns:
             int: ID створеного запису
@@ -988,52 +2097,151 @@ class Database:
         cursor.execute("""
             INSERT INTO ai_recommendations 
             (period_start, period_end, analyzed_posts_count, 
-             recommendations_json, patterns_json, status)
-            VALUES (?, ?, ?, ?, ?, ?)
+             recommendations_json, patterns_json, status, input_fingerprint, user_id, page_id,
+             data_fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, (period_start, period_end, analyzed_posts_count,
-              recommendations_json, patterns_json, status))
+              recommendations_json, patterns_json, status, input_fingerprint, user_id, page_id,
+              data_fingerprint))
         
         recommendation_id = cursor.lastrowid
         conn.commit()
         conn.close()
+
+        self.invalidate_recommendation_cache(user_id, page_id)
         
         logger.info(f"Рекомендація збережена ID: {recommendation_id}")
+
+        if status == 'completed':
+            for listener in self.recommendation_listeners:
+                try:
+                    listener(recommendation_id, recommendations, user_id=user_id, page_id=page_id)
+                except Exception as e:
+                    logger.warning(f"Помилка обробника нової рекомендації: {str(e)}")
+
         return recommendation_id
+
+    def add_recommendation_listener(self, listener):
+        """
+        Реєструє обробник, що викликається після збереження нової рекомендації
+
+        Args:
+            listener: callback(recommendation_id, recommendations, user_id=..., page_id=...)
+        """
+        if listener not in self.recommendation_listeners:
+            self.recommendation_listeners.append(listener)
     
-    def get_latest_recommendation(self) -> Optional[Dict]:
+    def get_latest_recommendation(self, user_id: Optional[int] = None, page_id: Optional[str] = None,
+                                  fallback: bool = True) -> Optional[Dict]:
         """
-        Отримує останню актуальну рекомендацію
+        Отримує останню актуальну рекомендацію для області (користувач, сторінка)
+        
+        Args:
+            user_id: користувач (None - загальна рекомендація)
+            page_id: сторінка користувача (None - усі сторінки)
+            fallback: якщо для сторінки/користувача рекомендацій ще немає,
+                повернути рекомендацію ширшої області (користувач, потім загальна)
         
         Returns:
-            Optional[Dict]: рекомендація або None
+            Optional[Dict]: рекомендація або None (вкладені recommendations/patterns
+                спільні з кешем - їх не можна змінювати)
+        """
+        scopes = [(user_id, page_id)]
+        if fallback:
+            for scope in ((user_id, None), (None, None)):
+                if scope not in scopes:
+                    scopes.append(scope)
+
+        for scope in scopes:
+            rec = self._get_cached_recommendation(scope)
+            if rec:
+                # Поверхнева копія: кешований словник спільний для всіх викликів
+                return dict(rec)
+
+        return None
+
+    def _get_cached_recommendation(self, scope: tuple) -> Optional[Dict]:
+        """
+        Остання завершена рекомендація рівно для області scope (без fallback)
+
+        Результат (і його відсутність) кешується до наступного save_recommendation
+        для цієї області або до RECOMMENDATION_CACHE_TTL, тож повторні читання
+        не звертаються до SQLite і не розбирають JSON.
         """
+        with self._recommendations_lock:
+            cached = self._latest_recommendations.get(scope)
+            generation = self._recommendations_generation
+        if cached and time.monotonic() - cached[0] < RECOMMENDATION_CACHE_TTL:
+            return cached[1]
+
         conn = self.get_connection()
         cursor = conn.cursor()
-        
         cursor.execute("""
             SELECT * FROM ai_recommendations 
-            WHERE status = 'completed'
-            ORDER BY created_at DESC 
+            WHERE status = 'completed' AND user_id IS ? AND page_id IS ?
+            ORDER BY created_at DESC, id DESC
             LIMIT 1
-        """)
-        
+        """, scope)
         row = cursor.fetchone()
         conn.close()
-        
+
+        rec = None
+        if row:
+            rec = dict(row)
+            rec['recommendations'] = json.loads(rec['recommendations_json'])
+            rec['patterns'] = json.loads(rec['patterns_json']) if rec.get('patterns_json') else {}
+
+        with self._recommendations_lock:
+            if self._recommendations_generation == generation:
+                self._latest_recommendations[scope] = (time.monotonic(), rec)
+        return rec
+
+    def invalidate_recommendation_cache(self, user_id: Optional[int] = None, page_id: Optional[str] = None):
+        """Скидає кеш останньої рекомендації області (user_id, page_id)"""
+        with self._recommendations_lock:
+            self._recommendations_generation += 1
+            self._latest_recommendations.pop((user_id, page_id), None)
+    
+    def get_recommendation_by_fingerprint(self, input_fingerprint: str) -> Optional[Dict]:
+        """
+        Отримує останню рекомендацію, побудовану на тому ж наборі постів
+
+        Args:
+            input_fingerprint: відбиток набору проаналізованих постів
+
+        Returns:
+            Optional[Dict]: рекомендація або None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT * FROM ai_recommendations
+            WHERE status = 'completed' AND input_fingerprint = ?
+            ORDER BY created_at DESC, id DESC
+            LIMIT 1
+        """, (input_fingerprint,))
+
+        row = cursor.fetchone()
+        conn.close()
+
         if row:
             rec = dict(row)
             rec['recommendations'] = json.loads(rec['recommendations_json'])
             rec['patterns'] = json.loads(rec['patterns_json']) if rec.get('patterns_json') else {}
             return rec
-        
+
         return None
-    
-    def get_recommendations_history(self, limit: int = 10) -> List[Dict]:
+
+    def get_recommendations_history(self, limit: int = 10, user_id: Optional[int] = None,
+                                    page_id: Optional[str] = None) -> List[Dict]:
         """
-        Отримує історію рекомендацій
+        Отримує історію рекомендацій області (користувач, сторінка)
         
         Args:
             limit: кількість записів
+            user_id: користувач (None - загальні рекомендації)
+            page_id: сторінка користувача (None - усі сторінки)
         
         Returns:
             List[Dict]: список рекомендацій
@@ -1043,9 +2251,10 @@ class Database:
         
         cursor.execute("""
             SELECT * FROM ai_recommendations 
-            ORDER BY created_at DESC 
+            WHERE user_id IS ? AND page_id IS ?
+            ORDER BY created_at DESC, id DESC 
             LIMIT ?
-        """, (limit,))
+        """, (user_id, page_id, limit))
         
         recommendations = []
         for row in cursor.fetchall():
@@ -1058,12 +2267,17 @@ class Database:
         
         return recommendations
     
-    def check_recent_recommendation(self, days: int = 7) -> bool:
+    def check_recent_recommendation(self, days: int = 7, user_id: Optional[int] = None,
+                                    page_id: Optional[str] = None,
+                                    since: Optional[datetime] = None) -> bool:
         """
-        Перевіряє чи була рекомендація за останні N днів
+        Перевіряє чи була рекомендація за останні N днів (або після моменту since)
         
         Args:
             days: кількість днів для перевірки
+            user_id: користувач (None - загальна рекомендація)
+            page_id: сторінка користувача (None - усі сторінки)
+            since: локальний час, з якого рекомендація вважається свіжою (замість days)
         
         Returns:
             bool: True якщо є свіжа рекомендація
@@ -1071,12 +2285,15 @@ class Database:
         conn = self.get_connection()
         cursor = conn.cursor()
         
-        cutoff_date = datetime.now() - timedelta(days=days)
+        cutoff_date = since or datetime.now() - timedelta(days=days)
+        # created_at заповнює CURRENT_TIMESTAMP (UTC) - межу переводимо з локального часу
+        cutoff_date = cutoff_date.astimezone(timezone.utc).replace(tzinfo=None)
         
         cursor.execute("""
             SELECT COUNT(*) as count FROM ai_recommendations 
-            WHERE created_at >= ? AND status = 'completed'
-        """, (cutoff_date,))
+            WHERE datetime(created_at) >= datetime(?) AND status = 'completed'
+            AND user_id IS ? AND page_id IS ?
+        """, (cutoff_date.isoformat(' '), user_id, page_id))
         
         result = cursor.fetchone()
         conn.close()
@@ -1134,19 +2351,62 @@ class Database:
         conn.commit()
         conn.close()
 
-    def add_user_facebook_page(self, user_id: int, page_id: str, page_name: str, access_token: str):
+    def add_user_facebook_page(self, user_id: int, page_id: str, page_name: str, access_token: str,
+                               token_expires_at: Optional[str] = None):
         """Добавляет Facebook страницу пользователя"""
         conn = self.get_connection()
         cursor = conn.cursor()
 
         cursor.execute("""
-            INSERT OR REPLACE INTO user_facebook_pages (user_id, page_id, page_name, access_token)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, page_id, page_name, access_token))
+            INSERT OR REPLACE INTO user_facebook_pages (user_id, page_id, page_name, access_token, token_expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, page_id, page_name, access_token, token_expires_at))
+
+        conn.commit()
+        conn.close()
+
+        self._notify_page_listeners(user_id)
+
+    def replace_user_facebook_pages(self, user_id: int, pages: List[Dict]):
+        """
+        Замінює всі сторінки користувача одним записом (оновлення списку з Facebook)
+
+        Args:
+            user_id: ID користувача
+            pages: сторінки з Graph API ({'id', 'name', 'access_token'})
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM user_facebook_pages WHERE user_id = ?", (user_id,))
+            conn.executemany("""
+                INSERT OR REPLACE INTO user_facebook_pages (user_id, page_id, page_name, access_token)
+                VALUES (?, ?, ?, ?)
+            """, [(user_id, page['id'], page['name'], page['access_token']) for page in pages])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        self._notify_page_listeners(user_id)
+
+    def remove_user_facebook_page(self, user_id: int, page_id: str):
+        """Удаляет Facebook страницу пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            DELETE FROM user_facebook_pages
+            WHERE user_id = ? AND page_id = ?
+        """, (user_id, page_id))
 
         conn.commit()
         conn.close()
 
+        self._notify_page_listeners(user_id)
+
     def get_user_facebook_pages(self, user_id: int) -> List[Dict]:
         """Получает все Facebook страницы пользователя"""
         conn = self.get_connection()
@@ -1161,6 +2421,108 @@ class Database:
 
         return pages
 
+    def get_all_facebook_pages(self, user_id: Optional[int] = None) -> List[Dict]:
+        """
+        Сторінки всіх користувачів (або одного) разом з терміном дії токена власника
+
+        Returns:
+            List[Dict]: рядки user_facebook_pages + user_token_expires_at
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        query = """
+            SELECT ufp.*, u.facebook_token_expires_at AS user_token_expires_at
+            FROM user_facebook_pages ufp
+            LEFT JOIN users u ON u.id = ufp.user_id
+        """
+        if user_id is not None:
+            cursor.execute(query + " WHERE ufp.user_id = ?", (user_id,))
+        else:
+            cursor.execute(query)
+
+        pages = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        return pages
+
+    def update_facebook_page_token_status(self, user_id: int, page_id: str,
+                                          token_expires_at: Optional[str] = None,
+                                          invalid: bool = False):
+        """
+        Оновлює метадані токена сторінки
+
+        Args:
+            user_id: ID користувача
+            page_id: ID сторінки
+            token_expires_at: термін дії токена (ISO), None - безстроковий/невідомий
+            invalid: Facebook визнав токен недійсним (помилка 190)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            UPDATE user_facebook_pages
+            SET token_expires_at = ?,
+                token_invalid_at = ?
+            WHERE user_id = ? AND page_id = ?
+        """, (token_expires_at, datetime.now().isoformat() if invalid else None, user_id, page_id))
+
+        conn.commit()
+        conn.close()
+
+        self._notify_page_listeners(user_id)
+
+    def update_facebook_page_token_statuses(self, updates: List[Dict]):
+        """
+        Пакетно оновлює метадані токенів сторінок однією транзакцією
+
+        Args:
+            updates: [{'user_id', 'page_id', 'token_expires_at', 'invalid'}]
+        """
+        if not updates:
+            return
+
+        now = datetime.now().isoformat()
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("""
+                UPDATE user_facebook_pages
+                SET token_expires_at = ?,
+                    token_invalid_at = ?
+                WHERE user_id = ? AND page_id = ?
+            """, [
+                (u.get('token_expires_at'), now if u.get('invalid') else None, u['user_id'], u['page_id'])
+                for u in updates
+            ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        for user_id in {u['user_id'] for u in updates}:
+            self._notify_page_listeners(user_id)
+
+    def add_page_listener(self, listener):
+        """
+        Реєструє обробник змін сторінок або токенів Facebook користувача
+
+        Args:
+            listener: callback(user_id)
+        """
+        if listener not in self.page_listeners:
+            self.page_listeners.append(listener)
+
+    def _notify_page_listeners(self, user_id: int):
+        for listener in self.page_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.warning(f"Помилка обробника змін сторінок: {str(e)}")
+
     def update_facebook_app_credentials(self, user_id: int, app_id: str, app_secret: str):
         """Обновляет Facebook App credentials пользователя"""
         conn = self.get_connection()
@@ -1221,6 +2583,7 @@ class Database:
         conn.close()
 
         logger.info(f"✓ Facebook токен збережено для користувача {user_id}")
+        self._notify_page_listeners(user_id)
 
     def get_user_facebook_token(self, user_id: int) -> Optional[Dict]:
         """
@@ -1248,6 +2611,36 @@ class Database:
             }
         return None
 
+    def get_users_with_facebook_tokens(self, expiring_before: Optional[datetime] = None) -> List[Dict]:
+        """
+        Користувачі з підключеним Facebook
+
+        Args:
+            expiring_before: лише токени, що спливають раніше цієї дати (або без дати)
+
+        Returns:
+            List[Dict]: [{'user_id', 'token', 'expires_at'}]
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        query = """
+            SELECT id AS user_id, facebook_access_token AS token, facebook_token_expires_at AS expires_at
+            FROM users
+            WHERE facebook_access_token IS NOT NULL
+        """
+        if expiring_before is not None:
+            cursor.execute(query + """
+                AND (facebook_token_expires_at IS NULL OR facebook_token_expires_at < ?)
+            """, (expiring_before.isoformat(),))
+        else:
+            cursor.execute(query)
+
+        users = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        return users
+
     def clear_user_facebook_token(self, user_id: int):
         """Видаляє Facebook токен користувача"""
         conn = self.get_connection()
@@ -1263,6 +2656,61 @@ class Database:
         conn.close()
 
         logger.info(f"✓ Facebook токен видалено для користувача {user_id}")
+        self._notify_page_listeners(user_id)
+
+def benchmark_startup(iterations: int = 200) -> Dict:
+    """
+    Порівнює час старту на актуальній схемі: перевірка версії проти
+    повного ідемпотентного проходу міграцій (як до версіонування схеми)
+
+    Args:
+        iterations: кількість повторів кожного варіанту
+
+    Returns:
+        Dict: середній час в мілісекундах
+    """
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "bench.sqlite")
+
+        start = time.perf_counter()
+        database = Database(db_file)
+        fresh_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            Database(db_file)
+        versioned_ms = (time.perf_counter() - start) * 1000 / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            conn = database.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            database._run_migrations(cursor, 0)
+            conn.rollback()
+            conn.close()
+        full_pass_ms = (time.perf_counter() - start) * 1000 / iterations
+
+    result = {
+        'fresh_database_ms': round(fresh_ms, 3),
+        'versioned_startup_ms': round(versioned_ms, 3),
+        'full_migration_pass_ms': round(full_pass_ms, 3),
+        'speedup': round(full_pass_ms / versioned_ms, 1) if versioned_ms else None
+    }
+
+    print(f"Нова БД (всі міграції):           {result['fresh_database_ms']} мс")
+    print(f"Старт, схема актуальна:           {result['versioned_startup_ms']} мс")
+    print(f"Повний прохід перевірок міграцій: {result['full_migration_pass_ms']} мс")
+    print(f"Прискорення:                      x{result['speedup']}")
+
+    return result
+
+
+# Глобальний екземпляр бази даних (шляхи можна перевизначити через DATABASE_FILE / ARCHIVE_DATABASE_FILE)
+db = Database(os.getenv("DATABASE_FILE", "marketing_db.sqlite"), os.getenv("ARCHIVE_DATABASE_FILE"))
+
 
-# Глобальний екземпляр бази даних
-db = Database()
\ No newline at end of file
+if __name__ == "__main__":
+    benchmark_startup()
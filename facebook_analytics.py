@@ -5,6 +5,7 @@
 import requests
 import logging
 from typing import Optional, Dict
+from facebook_config import GRAPH_API_URL
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +24,7 @@ def get_post_analytics(post_id: str, page_token: str) -> dict:
         logger.info(f"Запит аналітики для поста {post_id}")
         
         # Основний запит з детальними метриками
-        url = f"https://graph.facebook.com/v18.0/{post_id}"
+        url = f"{GRAPH_API_URL}/{post_id}"
         params = {
             "fields": (
                 "likes.summary(true),"
@@ -126,7 +127,7 @@ def try_alternative_analytics_methods(post_id: str, page_token: str) -> dict:
         if len(parts) == 2:
             page_id = parts[0]
             
-            url = f"https://graph.facebook.com/v18.0/{page_id}/posts"
+            url = f"{GRAPH_API_URL}/{page_id}/posts"
             params = {
                 "fields": "id,likes.summary(true),comments.summary(true),shares,reactions.summary(true)",
                 "access_token": page_token,
@@ -162,7 +163,7 @@ def try_alternative_analytics_methods(post_id: str, page_token: str) -> dict:
                         }
         
         # Метод 2: Спрощений запит
-        url = f"https://graph.facebook.com/v18.0/{post_id}"
+        url = f"{GRAPH_API_URL}/{post_id}"
         params = {
             "fields": "likes.summary(true),comments.summary(true),shares",
             "access_token": page_token
@@ -199,7 +200,7 @@ def try_get_post_insights(post_id: str, page_token: str) -> dict:
     Спроба отримати детальні insights (потребує спеціальних дозволів)
     """
     try:
-        url = f"https://graph.facebook.com/v18.0/{post_id}/insights"
+        url = f"{GRAPH_API_URL}/{post_id}/insights"
         params = {
             "metric": "post_impressions,post_engaged_users,post_clicks,post_reactions_by_type_total",
             "access_token": page_token
@@ -265,7 +266,7 @@ def get_page_posts_analytics(page_id: str, page_token: str, limit: int = 25) ->
         dict: Список постів з аналітикою
     """
     try:
-        url = f"https://graph.facebook.com/v18.0/{page_id}/posts"
+        url = f"{GRAPH_API_URL}/{page_id}/posts"
         params = {
             "fields": (
                 "id,message,created_time,permalink_url,"
@@ -4,25 +4,49 @@
 
 import os
 import json
+import atexit
+import tempfile
+import threading
 import requests
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Dict, List
 
 logger = logging.getLogger(__name__)
 
 CONFIG_FILE = "facebook_credentials.json"
 
+# Затримка відкладеного запису конфігурації (с): зміни за цей час об'єднуються в один запис
+CONFIG_SAVE_DELAY = float(os.getenv("FACEBOOK_CONFIG_SAVE_DELAY", "0.5"))
+
+# Базова адреса Graph API (можна перевизначити, напр. на локальний симулятор)
+GRAPH_API_URL = os.getenv("FACEBOOK_GRAPH_URL", "https://graph.facebook.com/v18.0").rstrip('/')
+
 class FacebookConfig:
     """Клас для управління конфігурацією Facebook"""
     
-    def __init__(self):
+    def __init__(self, config_file: str = CONFIG_FILE, save_delay: float = CONFIG_SAVE_DELAY):
+        """
+        Args:
+            config_file: шлях до файлу конфігурації
+            save_delay: затримка відкладеного запису в секундах (0 - записувати одразу)
+        """
+        self.config_file = config_file
+        self.save_delay = save_delay
+        # Захищає self.config від одночасних змін та запис файлу
+        self.lock = threading.RLock()
+        self._dirty = False
+        self._timer = None
+        self.write_count = 0
         self.config = self.load_config()
+        # Незаписані зміни зберігаються при завершенні процесу
+        atexit.register(self.flush)
     
     def load_config(self):
         """Завантажує конфігурацію з файлу"""
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+        if os.path.exists(self.config_file):
+            with open(self.config_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         return {
             "app_id": "",
@@ -33,9 +57,67 @@ class FacebookConfig:
         }
     
     def save_config(self):
-        """Зберігає конфігурацію у файл"""
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
+        """
+        Планує збереження конфігурації у файл
+
+        Запис відкладається на save_delay секунд: усі зміни за цей час
+        (напр. оновлення сотень сторінок) зберігаються одним записом.
+        """
+        with self.lock:
+            self._dirty = True
+            if self.save_delay <= 0:
+                self._write()
+                return
+            if self._timer is None:
+                self._timer = threading.Timer(self.save_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Негайно записує незбережені зміни"""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                self._write()
+
+    def _write(self):
+        """Атомарний запис: тимчасовий файл, fsync, перейменування поверх старого"""
+        with self.lock:
+            data = json.dumps(self.config, indent=2, ensure_ascii=False)
+            directory = os.path.dirname(os.path.abspath(self.config_file))
+
+            fd, tmp_path = tempfile.mkstemp(
+                dir=directory, prefix=f".{os.path.basename(self.config_file)}.", suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.config_file)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            # Фіксуємо перейменування в каталозі (POSIX)
+            if hasattr(os, 'O_DIRECTORY'):
+                dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+
+            self._dirty = False
+            self.write_count += 1
+
+    def update(self, **fields):
+        """Змінює поля конфігурації під блокуванням та планує збереження"""
+        with self.lock:
+            self.config.update(fields)
+            self.save_config()
     
     def exchange_for_long_lived_token(self, short_token):
         """
@@ -55,7 +137,7 @@ class FacebookConfig:
         
         logger.info("Обмін на long-lived токен...")
         
-        url = "https://graph.facebook.com/v18.0/oauth/access_token"
+        url = f"{GRAPH_API_URL}/oauth/access_token"
         params = {
             "grant_type": "fb_exchange_token",
             "client_id": app_id,
@@ -97,26 +179,24 @@ class FacebookConfig:
             access_token: токен доступу
             auto_exchange: автоматично обміняти на long-lived
         """
-        self.config["app_id"] = app_id
-        self.config["app_secret"] = app_secret
+        with self.lock:
+            self.config["app_id"] = app_id
+            self.config["app_secret"] = app_secret
         
-        # Якщо потрібно - обмінюємо на long-lived
+        # Якщо потрібно - обмінюємо на long-lived (мережевий запит - поза блокуванням)
+        token_info = None
         if auto_exchange and app_id and app_secret:
             try:
                 token_info = self.exchange_for_long_lived_token(access_token)
-                self.config["access_token"] = token_info["token"]
-                self.config["token_expires_at"] = token_info["expires_at"]
                 logger.info("✓ Токен автоматично обміняно на long-lived")
             except Exception as e:
                 logger.warning(f"Не вдалося обміняти токен: {str(e)}")
                 logger.info("Зберігаємо короткостроковий токен")
-                self.config["access_token"] = access_token
-                self.config["token_expires_at"] = None
-        else:
-            self.config["access_token"] = access_token
-            self.config["token_expires_at"] = None
         
-        self.save_config()
+        if token_info:
+            self.update(access_token=token_info["token"], token_expires_at=token_info["expires_at"])
+        else:
+            self.update(access_token=access_token, token_expires_at=None)
     
     def is_token_expired(self):
         """Перевіряє чи токен застарів"""
@@ -184,16 +264,32 @@ class FacebookConfig:
             "access_token": page_access_token
         }
         
-        # Перевірка чи сторінка вже існує
-        existing = [p for p in self.config["pages"] if p["id"] == page_id]
-        if not existing:
-            self.config["pages"].append(page)
-            self.save_config()
+        with self.lock:
+            # Перевірка чи сторінка вже існує
+            existing = [p for p in self.config["pages"] if p["id"] == page_id]
+            if not existing:
+                self.config["pages"].append(page)
+                self.save_config()
     
     def remove_page(self, page_id):
         """Видаляє сторінку"""
-        self.config["pages"] = [p for p in self.config["pages"] if p["id"] != page_id]
-        self.save_config()
+        with self.lock:
+            self.config["pages"] = [p for p in self.config["pages"] if p["id"] != page_id]
+            self.save_config()
+
+    def replace_pages(self, pages: List[Dict]):
+        """
+        Замінює список сторінок одним записом
+
+        Args:
+            pages: сторінки з Graph API ({'id', 'name', 'access_token'})
+        """
+        with self.lock:
+            self.config["pages"] = [
+                {"id": page['id'], "name": page['name'], "access_token": page['access_token']}
+                for page in pages
+            ]
+            self.save_config()
     
     def get_pages(self):
         """Повертає список сторінок"""
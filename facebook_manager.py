@@ -7,13 +7,14 @@ import logging
 import os
 from typing import List, Dict, Optional
 from datetime import datetime
+from facebook_config import GRAPH_API_URL
 
 logger = logging.getLogger(__name__)
 
 class FacebookManager:
     """Клас для взаємодії з Facebook API"""
     
-    BASE_URL = "https://graph.facebook.com/v18.0"
+    BASE_URL = GRAPH_API_URL
     
     def __init__(self, access_token: str):
         self.access_token = access_token
@@ -77,7 +77,8 @@ const API = {
     },
     
     // AI генерація
-    generate: (prompt, minLength = 100, maxLength = 500, useRecommendations = true, lang = 'uk') =>
+    // fresh = true - не брати відповідь з кешу (новий варіант тексту)
+    generate: (prompt, minLength = 100, maxLength = 500, useRecommendations = true, lang = 'uk', fresh = false) =>
         API.request('/api/generate', {
             method: 'POST',
             body: JSON.stringify({
@@ -86,8 +87,71 @@ const API = {
                 max_length: maxLength,
                 use_recommendations: useRecommendations,
                 lang: lang,
+                fresh: fresh,
             }),
         }),
+
+    // Пакетна генерація чернеток: options = {prompts: [...]} або {topic, variants}
+    generateBatch: (options, minLength = 100, maxLength = 500, useRecommendations = true, lang = 'uk') =>
+        API.request('/api/generate/batch', {
+            method: 'POST',
+            body: JSON.stringify({
+                ...options,
+                min_length: minLength,
+                max_length: maxLength,
+                use_recommendations: useRecommendations,
+                lang: lang,
+            }),
+        }),
+
+    // Потокова AI генерація (SSE через fetch): onToken отримує кожну частину тексту,
+    // повертає повний текст
+    async generateStream(prompt, minLength = 100, maxLength = 500, useRecommendations = true, lang = 'uk', onToken = null, fresh = false) {
+        const token = this.getAuthToken();
+        const response = await fetch(this.baseURL + '/api/generate/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                ...(token ? { 'Authorization': `Bearer ${token}` } : {}),
+            },
+            body: JSON.stringify({
+                prompt,
+                min_length: minLength,
+                max_length: maxLength,
+                use_recommendations: useRecommendations,
+                lang: lang,
+                fresh: fresh,
+            }),
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error('Потокова генерація недоступна');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+
+            for (const event of events) {
+                if (!event.startsWith('data: ')) continue;
+                const data = JSON.parse(event.slice(6));
+
+                if (data.error) throw new Error(data.error);
+                if (data.token && onToken) onToken(data.token);
+                if (data.done) return data.text;
+            }
+        }
+
+        throw new Error('Генерацію перервано');
+    },
     
     // Сторінки
     pages: {
@@ -106,10 +170,14 @@ const API = {
         collect: () => 
             API.request('/api/analytics/collect', { method: 'POST' }),
         
-        // Оновити ВСІ пости (без обмеження по датам, до 100 постів)
+        // Оновити ВСІ пости (без обмеження по датам, до 100 постів) - фонова задача
         refreshAll: () => 
             API.request('/api/analytics/refresh-all', { method: 'POST' }),
         
+        // Оновити свіжі пости (за 7 днів) - фонова задача
+        collectRecent: () => 
+            API.request('/api/analytics/collect-recent', { method: 'POST' }),
+        
         // Загальна статистика
         getSummary: () => 
             API.request('/api/analytics/summary'),
@@ -119,8 +187,12 @@ const API = {
             API.request(`/api/analytics/post/${postId}`),
         
         // Оновити аналітику для конкретного поста
-        collectForPost: (postId) => 
+        collectForPost: (postId) =>
             API.request(`/api/analytics/collect/${postId}`, { method: 'POST' }),
+
+        // Теплова карта engagement: день тижня × година (pageId - опційно)
+        getHeatmap: (pageId = null) =>
+            API.request(`/api/analytics/heatmap${pageId ? `?page_id=${encodeURIComponent(pageId)}` : ''}`),
     },
     
     // Налаштування
@@ -149,6 +221,7 @@ const API = {
         getHistory: (limit = 10) =>
             API.request(`/api/recommendations/history?limit=${limit}`),
 
+        // Фонова задача - результат через API.jobs.wait(job_id)
         generate: (periodDays = 7, limit = 10) =>
             API.request(`/api/recommendations/generate?period_days=${periodDays}&limit=${limit}`, {
                 method: 'POST',
@@ -158,6 +231,69 @@ const API = {
             API.request(`/api/analytics/top-posts?days=${days}&limit=${limit}&metric=${metric}`),
     },
 
+    // Фонові задачі
+    jobs: {
+        get: (jobId) =>
+            API.request(`/api/jobs/${jobId}`),
+
+        cancel: (jobId) =>
+            API.request(`/api/jobs/${jobId}/cancel`, { method: 'POST' }),
+
+        // Чекає завершення задачі (SSE, або опитування якщо EventSource недоступний)
+        // і повертає її результат; onProgress отримує стан задачі при кожній зміні
+        wait(jobId, onProgress = null) {
+            const finished = ['completed', 'failed', 'cancelled'];
+
+            const settle = (job, resolve, reject) => {
+                if (job.status === 'completed') {
+                    resolve(job.result);
+                } else {
+                    reject(new Error(job.error || 'Задачу скасовано'));
+                }
+            };
+
+            if (typeof EventSource === 'undefined') {
+                return new Promise((resolve, reject) => {
+                    const poll = async () => {
+                        try {
+                            const { job } = await API.jobs.get(jobId);
+                            if (onProgress) onProgress(job);
+                            if (finished.includes(job.status)) {
+                                settle(job, resolve, reject);
+                            } else {
+                                setTimeout(poll, 1000);
+                            }
+                        } catch (error) {
+                            reject(error);
+                        }
+                    };
+                    poll();
+                });
+            }
+
+            return new Promise((resolve, reject) => {
+                // EventSource не надсилає заголовків - токен передаємо параметром
+                const token = API.getAuthToken();
+                const query = token ? `?token=${encodeURIComponent(token)}` : '';
+                const source = new EventSource(`${API.baseURL}/api/jobs/${jobId}/events${query}`);
+
+                source.onmessage = (event) => {
+                    const job = JSON.parse(event.data);
+                    if (onProgress) onProgress(job);
+                    if (finished.includes(job.status)) {
+                        source.close();
+                        settle(job, resolve, reject);
+                    }
+                };
+
+                source.onerror = () => {
+                    source.close();
+                    reject(new Error('Втрачено з\'єднання з сервером'));
+                };
+            });
+        },
+    },
+
     templates: {
         getAll: () =>
             API.request('/api/templates'),
@@ -202,6 +202,9 @@ async function updateCharCounter() {
     }
 }
 
+// Останній запит генерації (для запиту нового варіанту при повторі)
+let lastGenerationRequest = null;
+
 async function generateAIText() {
     const promptInput = document.getElementById('ai-prompt');
     const contentInput = document.getElementById('post-content');
@@ -227,11 +230,29 @@ async function generateAIText() {
         // Визначаємо мову для генерації
         const lang = i18n.getLang();
 
-        // Генеруємо з урахуванням рекомендацій (useRecommendations = true за замовчуванням)
-        const response = await API.generate(prompt, minLength, maxLength, true, lang);
+        // Генеруємо з урахуванням рекомендацій (useRecommendations = true за замовчуванням).
+        // Текст з'являється в полі по мірі генерації; якщо потік недоступний - звичайний запит
+        // Повторна генерація з тим самим промптом - просимо новий варіант замість кешованого
+        const requestKey = `${prompt}|${minLength}|${maxLength}|${lang}`;
+        const fresh = requestKey === lastGenerationRequest;
+        lastGenerationRequest = requestKey;
 
-        if (response.success && response.text) {
-            contentInput.value = response.text;
+        let text = '';
+        try {
+            contentInput.value = '';
+            text = await API.generateStream(prompt, minLength, maxLength, true, lang, (chunk) => {
+                Utils.hideLoading();
+                contentInput.value += chunk;
+                updateCharCount();
+            }, fresh);
+        } catch (streamError) {
+            console.warn('Streaming generation failed, falling back:', streamError);
+            const response = await API.generate(prompt, minLength, maxLength, true, lang, fresh);
+            text = response.success ? response.text : '';
+        }
+
+        if (text) {
+            contentInput.value = text;
             updateCharCount();
             // Оновлюємо також індикатор довжини якщо є
             if (typeof updateCharCounter === 'function') {
@@ -1029,7 +1050,12 @@ async function refreshAllAnalytics() {
     try {
         Utils.showLoading();
         
-        const response = await API.analytics.refreshAll();
+        const job = await API.analytics.refreshAll();
+        const response = await API.jobs.wait(job.job_id, (state) => {
+            if (state.total) {
+                console.log(`Оновлення аналітики: ${state.progress}/${state.total}`);
+            }
+        });
         
         if (response.success) {
             if (response.total === 0) {
@@ -1071,7 +1097,8 @@ async function generateNewRecommendations() {
         console.log(`- Всього постів: ${postsData.posts.length}`);
         console.log(`- Опубліковано: ${publishedPosts.length}`);
 
-        const response = await API.recommendations.generate(60, 10);
+        const job = await API.recommendations.generate(60, 10);
+        const response = await API.jobs.wait(job.job_id);
 
         console.log('📋 Відповідь API:', response);
 
@@ -931,6 +931,11 @@ const Pages = {
                                 <p style="color: var(--text-secondary); margin-bottom: 1rem;">
                                     ${Utils.truncate(template.content, 100)}
                                 </p>
+                                ${template.generated_content ? `
+                                    <p style="font-size: 0.875rem; margin-bottom: 1rem;">
+                                        <i class="bi bi-file-text"></i> ${Utils.truncate(template.generated_content, 150)}
+                                    </p>
+                                ` : ''}
                                 <div style="display: flex; gap: 0.5rem;">
                                     <button class="btn btn-sm btn-secondary" onclick="useTemplate(${template.id}, \`${template.content.replace(/`/g, '\\`').replace(/\$/g, '\\$')}\`, ${template.is_ai_prompt})">
                                         ${t('use')}
@@ -0,0 +1,684 @@
+"""
+Локальний симулятор Facebook Graph API для офлайн-тестування та бенчмарків
+
+Підтримує /feed, /photos, поля поста, /insights, batch, /me/accounts, обмін
+та перевірку (debug_token) токенів.
+Затримка, частка помилок та ліміт запитів налаштовуються через змінні оточення
+або через службовий endpoint POST /__sim/config.
+
+Запуск сервера:
+    python graph_simulator.py serve --port 8100
+    FACEBOOK_GRAPH_URL=http://127.0.0.1:8100/v18.0 python api_server.py
+
+Бенчмарк PostScheduler та AnalyticsCollector:
+    python graph_simulator.py bench --publications 2000
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+VERSION_PATTERN = re.compile(r"v\d+\.\d+")
+PAGE_ID_BASE = 100000000000000
+
+
+def _graph_error(message: str, code: int, error_type: str = "OAuthException",
+                 status: int = 400) -> Tuple[int, Dict]:
+    """Формує відповідь з помилкою у форматі Graph API"""
+    return status, {
+        "error": {
+            "message": message,
+            "type": error_type,
+            "code": code,
+            "fbtrace_id": uuid.uuid4().hex[:11]
+        }
+    }
+
+
+class GraphSimulator:
+    """Стан та логіка імітованого Graph API"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0.0,
+                 rate_limit: int = 0, rate_window: int = 3600, pages_count: int = 3,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency_ms: базова затримка кожної HTTP-відповіді в мс
+            jitter_ms: випадкова надбавка до затримки в мс
+            error_rate: частка запитів, що завершуються помилкою (0.0 - 1.0)
+            rate_limit: кількість викликів за вікно (0 - без обмежень)
+            rate_window: тривалість вікна ліміту в секундах
+            pages_count: кількість сторінок у відповіді /me/accounts
+            seed: зерно генератора випадкових чисел
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.pages_count = pages_count
+        self.random = random.Random(seed)
+        self.reset()
+
+    @classmethod
+    def from_env(cls) -> "GraphSimulator":
+        """Створює симулятор з налаштувань змінних оточення"""
+        seed = os.getenv("GRAPH_SIM_SEED")
+        return cls(
+            latency_ms=float(os.getenv("GRAPH_SIM_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("GRAPH_SIM_JITTER_MS", "0")),
+            error_rate=float(os.getenv("GRAPH_SIM_ERROR_RATE", "0")),
+            rate_limit=int(os.getenv("GRAPH_SIM_RATE_LIMIT", "0")),
+            rate_window=int(os.getenv("GRAPH_SIM_RATE_WINDOW", "3600")),
+            pages_count=int(os.getenv("GRAPH_SIM_PAGES", "3")),
+            seed=int(seed) if seed else None
+        )
+
+    def reset(self):
+        """Очищає створені об'єкти та лічильники"""
+        self.posts: Dict[str, Dict] = {}
+        self.photos: Dict[str, Dict] = {}
+        self.post_counter = 0
+        self.calls = deque()
+        self.stats = {
+            "requests": 0,
+            "errors": 0,
+            "throttled": 0,
+            "batches": 0,
+            "endpoints": {}
+        }
+
+    def configure(self, **settings):
+        """Змінює налаштування симулятора під час роботи"""
+        allowed = {'latency_ms', 'jitter_ms', 'error_rate', 'rate_limit', 'rate_window', 'pages_count'}
+        for key, value in settings.items():
+            if key in allowed:
+                setattr(self, key, value)
+
+    def get_settings(self) -> Dict:
+        """Повертає поточні налаштування"""
+        return {
+            "latency_ms": self.latency_ms,
+            "jitter_ms": self.jitter_ms,
+            "error_rate": self.error_rate,
+            "rate_limit": self.rate_limit,
+            "rate_window": self.rate_window,
+            "pages_count": self.pages_count
+        }
+
+    def get_pages(self) -> List[Dict]:
+        """Повертає сторінки імітованого користувача"""
+        pages = []
+        for i in range(1, self.pages_count + 1):
+            page_id = str(PAGE_ID_BASE + i)
+            pages.append({
+                "id": page_id,
+                "name": f"Simulated Page {i}",
+                "access_token": f"sim_page_token_{page_id}",
+                "category": "Community",
+                "tasks": ["ADVERTISE", "ANALYZE", "CREATE_CONTENT", "MODERATE", "MANAGE"]
+            })
+        return pages
+
+    async def delay(self):
+        """Імітує мережеву затримку"""
+        latency = self.latency_ms
+        if self.jitter_ms:
+            latency += self.random.uniform(0, self.jitter_ms)
+        if latency > 0:
+            await asyncio.sleep(latency / 1000)
+
+    # ==================== ЛІМІТИ ТА ПОМИЛКИ ====================
+
+    def _usage_percent(self) -> int:
+        """Обчислює використання ліміту у відсотках для заголовка X-App-Usage"""
+        if not self.rate_limit:
+            return 0
+        now = time.monotonic()
+        while self.calls and now - self.calls[0] > self.rate_window:
+            self.calls.popleft()
+        return min(100, int(len(self.calls) * 100 / self.rate_limit))
+
+    def _usage_headers(self) -> Dict[str, str]:
+        """Заголовки використання лімітів, як у Graph API"""
+        usage = self._usage_percent()
+        return {
+            "X-App-Usage": json.dumps({
+                "call_count": usage,
+                "total_cputime": usage // 2,
+                "total_time": usage // 2
+            })
+        }
+
+    def process(self, method: str, path: str, params: Dict) -> Tuple[int, Dict, Dict[str, str]]:
+        """
+        Обробляє один виклик Graph API з урахуванням лімітів та інжекції помилок
+
+        Returns:
+            Tuple: (HTTP статус, тіло відповіді, заголовки)
+        """
+        self.stats["requests"] += 1
+        endpoint = self._endpoint_name(method, path)
+        self.stats["endpoints"][endpoint] = self.stats["endpoints"].get(endpoint, 0) + 1
+
+        if self.rate_limit:
+            self._usage_percent()
+            if len(self.calls) >= self.rate_limit:
+                self.stats["throttled"] += 1
+                status, body = _graph_error("Application request limit reached", 4, "OAuthException", 400)
+                return status, body, self._usage_headers()
+            self.calls.append(time.monotonic())
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            status, body = _graph_error(
+                "An unexpected error has occurred. Please retry your request later.",
+                2, "OAuthException", 500
+            )
+            return status, body, self._usage_headers()
+
+        status, body = self.handle(method, path, params)
+        if status >= 400:
+            self.stats["errors"] += 1
+        return status, body, self._usage_headers()
+
+    @staticmethod
+    def _endpoint_name(method: str, path: str) -> str:
+        """Нормалізує шлях для статистики (без ID об'єктів)"""
+        segments = [s for s in path.strip('/').split('/') if s]
+        if segments and VERSION_PATTERN.fullmatch(segments[0]):
+            segments = segments[1:]
+        if not segments:
+            return f"{method} /"
+        if segments[0] in ('me', 'oauth', 'debug_token'):
+            return f"{method} /{'/'.join(segments)}"
+        return f"{method} /{{id}}" + ''.join(f"/{s}" for s in segments[1:])
+
+    # ==================== МАРШРУТИЗАЦІЯ ====================
+
+    def handle(self, method: str, path: str, params: Dict) -> Tuple[int, Dict]:
+        """Маршрутизує виклик до відповідного обробника"""
+        segments = [s for s in path.strip('/').split('/') if s]
+        if segments and VERSION_PATTERN.fullmatch(segments[0]):
+            segments = segments[1:]
+
+        if segments == ['oauth', 'access_token']:
+            return self._exchange_token(params)
+
+        token = params.get('access_token')
+        if not token:
+            return _graph_error("An access token is required to request this resource.", 104)
+        if token.startswith('expired'):
+            return _graph_error("Error validating access token: Session has expired.", 190)
+
+        if not segments:
+            if method == 'POST' and 'batch' in params:
+                return self._batch(params)
+            return _graph_error("Unsupported request", 100, "GraphMethodException")
+
+        if segments == ['me', 'accounts'] and method == 'GET':
+            return 200, {"data": self.get_pages(), "paging": {}}
+
+        if segments == ['debug_token'] and method == 'GET':
+            return self._debug_token(params)
+
+        if len(segments) == 2:
+            object_id, edge = segments
+            if edge == 'feed' and method == 'POST':
+                return self._create_post(object_id, params)
+            if edge == 'photos' and method == 'POST':
+                return self._upload_photo(object_id, params)
+            if edge == 'posts' and method == 'GET':
+                return self._list_page_posts(object_id, params)
+            if edge == 'insights' and method == 'GET':
+                return self._insights(object_id, params)
+
+        if len(segments) == 1:
+            object_id = segments[0]
+            if method == 'GET':
+                return self._get_object(object_id, params)
+            if method == 'DELETE':
+                return self._delete_object(object_id)
+
+        return _graph_error(
+            f"Unsupported {method.lower()} request. Please read the Graph API documentation",
+            100, "GraphMethodException"
+        )
+
+    def _batch(self, params: Dict) -> Tuple[int, List]:
+        """Обробляє batch-запит: кожен елемент виконується як окремий виклик"""
+        self.stats["batches"] += 1
+        try:
+            items = json.loads(params['batch'])
+        except (TypeError, ValueError):
+            return _graph_error("The parameter batch must be a JSON array", 100)
+
+        if len(items) > 50:
+            return _graph_error("Too many requests in batch message. Maximum batch size is 50", 1)
+
+        from urllib.parse import urlsplit, parse_qsl
+
+        responses = []
+        for item in items:
+            method = item.get('method', 'GET').upper()
+            parts = urlsplit(item.get('relative_url', ''))
+            item_params = dict(parse_qsl(parts.query))
+            if item.get('body'):
+                item_params.update(parse_qsl(item['body']))
+            item_params.setdefault('access_token', params.get('access_token'))
+
+            status, body, headers = self.process(method, parts.path, item_params)
+            responses.append({
+                "code": status,
+                "headers": [{"name": name, "value": value} for name, value in headers.items()],
+                "body": json.dumps(body)
+            })
+        return 200, responses
+
+    # ==================== ОБРОБНИКИ ====================
+
+    def _exchange_token(self, params: Dict) -> Tuple[int, Dict]:
+        """Імітує обмін коду або short-lived токена"""
+        if params.get('grant_type') == 'fb_exchange_token':
+            if not params.get('fb_exchange_token'):
+                return _graph_error("Missing fb_exchange_token parameter", 100)
+            return 200, {
+                "access_token": f"sim_long_{uuid.uuid4().hex}",
+                "token_type": "bearer",
+                "expires_in": 5184000
+            }
+        if params.get('code'):
+            return 200, {
+                "access_token": f"sim_short_{uuid.uuid4().hex}",
+                "token_type": "bearer",
+                "expires_in": 3600
+            }
+        return _graph_error("Missing authorization code", 100)
+
+    def _debug_token(self, params: Dict) -> Tuple[int, Dict]:
+        """
+        Імітує перевірку токена: токени сторінок безстрокові, користувацькі - 60 днів,
+        токени з префіксом expired/revoked недійсні
+        """
+        input_token = params.get('input_token')
+        if not input_token:
+            return _graph_error("The parameter input_token is required", 100)
+
+        now = int(time.time())
+        is_page = input_token.startswith('sim_page_token_')
+        is_valid = not input_token.startswith(('expired', 'revoked'))
+
+        data = {
+            "app_id": "sim_app",
+            "type": "PAGE" if is_page else "USER",
+            "application": "Graph Simulator",
+            "is_valid": is_valid,
+            "expires_at": 0 if is_page else now + 5184000,
+            "data_access_expires_at": now + 7776000,
+            "scopes": ["pages_manage_posts", "pages_read_engagement", "pages_show_list", "read_insights"]
+        }
+        if is_page:
+            data["profile_id"] = input_token[len('sim_page_token_'):]
+        if not is_valid:
+            data["expires_at"] = now - 3600
+            data["error"] = {
+                "code": 190,
+                "message": "Error validating access token: Session has expired."
+            }
+        return 200, {"data": data}
+
+    def _create_post(self, page_id: str, params: Dict) -> Tuple[int, Dict]:
+        """Створює пост на сторінці"""
+        self.post_counter += 1
+        post_id = f"{page_id}_{self.post_counter}"
+        media = [value for key, value in params.items() if key.startswith('attached_media')]
+
+        self.posts[post_id] = {
+            "id": post_id,
+            "page_id": page_id,
+            "message": params.get('message', ''),
+            "link": params.get('link'),
+            "attached_media": media,
+            "created_at": time.time(),
+            # Швидкість набору реакцій - щоб метрики росли з часом
+            "rates": {
+                "likes": self.random.uniform(0.5, 5.0),
+                "comments": self.random.uniform(0.05, 1.0),
+                "shares": self.random.uniform(0.01, 0.5),
+                "impressions": self.random.uniform(20, 200)
+            }
+        }
+        return 200, {"id": post_id}
+
+    def _upload_photo(self, page_id: str, params: Dict) -> Tuple[int, Dict]:
+        """Приймає неопубліковане фото"""
+        photo_id = str(PAGE_ID_BASE * 10 + len(self.photos) + 1)
+        self.photos[photo_id] = {"page_id": page_id, "published": params.get('published') != 'false'}
+        return 200, {"id": photo_id}
+
+    def _metrics(self, post: Dict) -> Dict[str, int]:
+        """Обчислює поточні метрики поста залежно від його віку"""
+        age_minutes = max(1.0, (time.time() - post['created_at']) / 60)
+        growth = age_minutes ** 0.5
+        return {name: int(rate * growth) for name, rate in post['rates'].items()}
+
+    def _post_fields(self, post: Dict, fields: str) -> Dict:
+        """Формує об'єкт поста з полями у форматі Graph API"""
+        metrics = self._metrics(post)
+        created = datetime.fromtimestamp(post['created_at'], tz=timezone.utc)
+
+        result = {
+            "id": post['id'],
+            "message": post['message'],
+            "created_time": created.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+            "permalink_url": f"https://www.facebook.com/{post['id']}",
+            "likes": {"data": [], "summary": {"total_count": metrics['likes']}},
+            "comments": {"data": [], "summary": {"total_count": metrics['comments']}},
+            "reactions": {"data": [], "summary": {"total_count": metrics['likes']}}
+        }
+        if metrics['shares']:
+            result["shares"] = {"count": metrics['shares']}
+        if 'insights' in fields:
+            result["insights"] = {"data": self._post_insights(post)}
+        return result
+
+    def _post_insights(self, post: Dict) -> List[Dict]:
+        """Insights поста"""
+        metrics = self._metrics(post)
+        values = {
+            "post_impressions": metrics['impressions'],
+            "post_impressions_unique": int(metrics['impressions'] * 0.7),
+            "post_engaged_users": metrics['likes'] + metrics['comments'] + metrics['shares'],
+            "post_clicks": int(metrics['impressions'] * 0.02),
+            "post_reactions_by_type_total": {"like": metrics['likes']}
+        }
+        return [
+            {"name": name, "period": "lifetime", "values": [{"value": value}], "id": f"{post['id']}/insights/{name}/lifetime"}
+            for name, value in values.items()
+        ]
+
+    def _get_object(self, object_id: str, params: Dict) -> Tuple[int, Dict]:
+        """Повертає пост або сторінку"""
+        post = self.posts.get(object_id)
+        if post:
+            return 200, self._post_fields(post, params.get('fields', ''))
+
+        page = next((p for p in self.get_pages() if p['id'] == object_id), None)
+        if page:
+            return 200, {"id": page['id'], "name": page['name'], "category": page['category']}
+
+        return _graph_error(
+            f"Unsupported get request. Object with ID '{object_id}' does not exist",
+            100, "GraphMethodException"
+        )
+
+    def _delete_object(self, object_id: str) -> Tuple[int, Dict]:
+        """Видаляє пост"""
+        if self.posts.pop(object_id, None) is None:
+            return _graph_error(
+                f"Unsupported delete request. Object with ID '{object_id}' does not exist",
+                100, "GraphMethodException"
+            )
+        return 200, {"success": True}
+
+    def _list_page_posts(self, page_id: str, params: Dict) -> Tuple[int, Dict]:
+        """Список постів сторінки (новіші першими)"""
+        limit = int(params.get('limit', 25))
+        fields = params.get('fields', '')
+        page_posts = [p for p in self.posts.values() if p['page_id'] == page_id]
+        page_posts.sort(key=lambda p: p['created_at'], reverse=True)
+        return 200, {"data": [self._post_fields(p, fields) for p in page_posts[:limit]], "paging": {}}
+
+    def _insights(self, object_id: str, params: Dict) -> Tuple[int, Dict]:
+        """Insights поста або сторінки"""
+        post = self.posts.get(object_id)
+        requested = [m for m in params.get('metric', '').split(',') if m]
+
+        if post:
+            data = self._post_insights(post)
+        else:
+            page_posts = [p for p in self.posts.values() if p['page_id'] == object_id]
+            totals = [self._metrics(p) for p in page_posts]
+            impressions = sum(m['impressions'] for m in totals)
+            engagements = sum(m['likes'] + m['comments'] + m['shares'] for m in totals)
+            values = {
+                "page_impressions": impressions,
+                "page_engaged_users": engagements,
+                "page_post_engagements": engagements,
+                "page_fans": 1000 + len(page_posts)
+            }
+            data = [
+                {"name": name, "period": "day", "values": [{"value": value}]}
+                for name, value in values.items()
+            ]
+
+        if requested:
+            data = [item for item in data if item['name'] in requested]
+        return 200, {"data": data}
+
+
+# ==================== HTTP СЕРВЕР ====================
+
+simulator = GraphSimulator.from_env()
+app = FastAPI(title="Graph API Simulator")
+
+
+@app.get("/__sim/stats")
+async def get_stats():
+    """Статистика звернень до симулятора"""
+    return {
+        "settings": simulator.get_settings(),
+        "stats": simulator.stats,
+        "posts": len(simulator.posts),
+        "photos": len(simulator.photos)
+    }
+
+
+@app.post("/__sim/config")
+async def update_config(request: Request):
+    """Змінює затримку, частку помилок та ліміти без перезапуску"""
+    simulator.configure(**(await request.json()))
+    return {"success": True, "settings": simulator.get_settings()}
+
+
+@app.post("/__sim/reset")
+async def reset_simulator():
+    """Очищає стан симулятора"""
+    simulator.reset()
+    return {"success": True}
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "DELETE"])
+async def graph_endpoint(path: str, request: Request):
+    """Єдина точка входу для всіх викликів Graph API"""
+    params = dict(request.query_params)
+    if request.method == "POST":
+        form = await request.form()
+        for key, value in form.items():
+            # Файли (source для /photos) не зберігаємо
+            if isinstance(value, str):
+                params[key] = value
+
+    await simulator.delay()
+    status, body, headers = simulator.process(request.method, path, params)
+    return JSONResponse(status_code=status, content=body, headers=headers)
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 8100):
+    """
+    Запускає симулятор у фоновому потоці
+
+    Returns:
+        uvicorn.Server: сервер (для зупинки встановіть should_exit = True)
+    """
+    import uvicorn
+
+    config = uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"Не вдалося запустити симулятор на {host}:{port}")
+        time.sleep(0.05)
+
+    return server
+
+
+# ==================== БЕНЧМАРК ====================
+
+def run_benchmark(publications: int = 2000, pages: int = 5, port: int = 8100,
+                  latency_ms: float = 20, error_rate: float = 0.0, rate_limit: int = 0) -> Dict:
+    """
+    Прогоняє PostScheduler та AnalyticsCollector проти локального симулятора
+
+    Args:
+        publications: кількість публікацій (пости × сторінки)
+        pages: кількість сторінок
+        port: порт симулятора
+        latency_ms: затримка відповіді симулятора
+        error_rate: частка помилкових відповідей
+        rate_limit: ліміт викликів на годину (0 - без обмежень)
+
+    Returns:
+        Dict: результати вимірювань
+    """
+    import io
+    import tempfile
+    from contextlib import redirect_stdout
+
+    workdir = tempfile.mkdtemp(prefix="graph_bench_")
+    base_url = f"http://127.0.0.1:{port}/v18.0"
+
+    # Модулі читають налаштування під час імпорту, тому задаємо їх заздалегідь
+    os.environ["FACEBOOK_GRAPH_URL"] = base_url
+    os.environ["DATABASE_FILE"] = os.path.join(workdir, "bench.sqlite")
+
+    simulator.configure(latency_ms=latency_ms, error_rate=error_rate,
+                        rate_limit=rate_limit, pages_count=pages)
+    server = start_in_thread(port=port)
+
+    from database import db
+    from facebook_config import fb_config
+    from scheduler import PostScheduler, AnalyticsCollector
+
+    # Сторінки лише в пам'яті, щоб не перезаписати facebook_credentials.json
+    sim_pages = simulator.get_pages()
+    fb_config.config["pages"] = [
+        {"id": p['id'], "name": p['name'], "access_token": p['access_token']} for p in sim_pages
+    ]
+
+    # Підготовка запланованих постів
+    posts_count = max(1, publications // pages)
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    for i in range(posts_count):
+        cursor.execute("""
+            INSERT INTO posts (content, link, status, scheduled_time)
+            VALUES (?, ?, 'scheduled', datetime('now', 'localtime', '-1 minute'))
+        """, (f"Benchmark post #{i} " + "lorem ipsum " * (i % 20), None if i % 3 else "https://example.com"))
+        post_id = cursor.lastrowid
+        cursor.executemany("""
+            INSERT INTO publications (post_id, page_id, page_name) VALUES (?, ?, ?)
+        """, [(post_id, p['id'], p['name']) for p in sim_pages])
+    conn.commit()
+    conn.close()
+
+    total = posts_count * pages
+    print(f"Бенчмарк: {posts_count} постів × {pages} сторінок = {total} публікацій "
+          f"(затримка {latency_ms} мс, помилки {error_rate:.0%})")
+
+    async def _run():
+        post_scheduler = PostScheduler(initial_analytics_delay=0)
+        collector = AnalyticsCollector(batch_size=total, request_delay=0)
+
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            await post_scheduler.check_and_publish_posts()
+        publish_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            await collector.collect_analytics()
+        collect_time = time.perf_counter() - started
+
+        return publish_time, collect_time
+
+    publish_time, collect_time = asyncio.run(_run())
+
+    conn = db.get_connection()
+    published = conn.execute("SELECT COUNT(*) FROM publications WHERE status = 'published'").fetchone()[0]
+    collected = conn.execute("SELECT COUNT(*) FROM analytics").fetchone()[0]
+    conn.close()
+
+    server.should_exit = True
+
+    results = {
+        "publications": total,
+        "published": published,
+        "analytics_rows": collected,
+        "publish_seconds": round(publish_time, 2),
+        "publish_per_second": round(total / publish_time, 1) if publish_time else None,
+        "collect_seconds": round(collect_time, 2),
+        "collect_per_second": round(published / collect_time, 1) if collect_time else None,
+        "graph_requests": simulator.stats["requests"],
+        "graph_errors": simulator.stats["errors"],
+        "graph_throttled": simulator.stats["throttled"]
+    }
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Симулятор Facebook Graph API")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="Запустити симулятор")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8100)
+
+    bench_parser = subparsers.add_parser("bench", help="Бенчмарк публікації та збору аналітики")
+    bench_parser.add_argument("--publications", type=int, default=2000)
+    bench_parser.add_argument("--pages", type=int, default=5)
+    bench_parser.add_argument("--port", type=int, default=8100)
+    bench_parser.add_argument("--latency-ms", type=float, default=20)
+    bench_parser.add_argument("--error-rate", type=float, default=0.0)
+    bench_parser.add_argument("--rate-limit", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if sys.platform == 'win32':
+        sys.stdout.reconfigure(encoding='utf-8')
+
+    if args.command == "serve":
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port)
+    else:
+        logging.basicConfig(level=logging.WARNING)
+        run_benchmark(
+            publications=args.publications,
+            pages=args.pages,
+            port=args.port,
+            latency_ms=args.latency_ms,
+            error_rate=args.error_rate,
+            rate_limit=args.rate_limit
+        )
@@ -0,0 +1,697 @@
+"""
+Клієнт LLM з обмеженням одночасних викликів, таймаутами, експоненційною
+затримкою та перемиканням між провайдерами
+
+Провайдери задаються впорядкованим списком (LLM_PROVIDERS). Для кожного
+ведеться статистика затримки та частки помилок; запит іде спочатку до
+найшвидшого справного провайдера, при помилці - до наступного.
+Провайдер "stub" працює локально і дозволяє міряти пропускну здатність офлайн:
+
+    python llm_client.py bench --requests 200 --concurrency 20 --latency-ms 50
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "Qwen/Qwen3-Coder-30B-A3B-Instruct"
+
+
+class LLMError(Exception):
+    """Жоден провайдер не зміг виконати запит"""
+    pass
+
+
+class LLMProvider:
+    """
+    Базовий провайдер: синхронний виклик моделі (виконується у фоновому потоці)
+
+    kwargs містить timeout - ліміт часу HTTP-запиту. Провайдер має його
+    дотримуватись: потік виклику неможливо перервати ззовні.
+    """
+
+    name = "base"
+
+    def complete(self, messages: List[Dict], **kwargs) -> str:
+        raise NotImplementedError
+
+    def stream(self, messages: List[Dict], **kwargs) -> Iterator[str]:
+        """Потокова відповідь частинами (за замовчуванням - вся відповідь одним шматком)"""
+        yield self.complete(messages, **kwargs)
+
+
+class G4FProvider(LLMProvider):
+    """Провайдер через g4f; клієнт створюється один раз і перевикористовується"""
+
+    def __init__(self, provider_name: str = "DeepInfra", model: str = DEFAULT_MODEL, timeout: float = 60.0):
+        self.provider_name = provider_name
+        self.model = model
+        self.timeout = timeout
+        self.name = f"g4f:{provider_name}"
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from g4f.client import Client
+                    import g4f.Provider
+
+                    provider = getattr(g4f.Provider, self.provider_name)
+                    self._client = Client(provider=provider)
+        return self._client
+
+    def complete(self, messages: List[Dict], **kwargs) -> str:
+        response = self._get_client().chat.completions.create(
+            model=kwargs.get('model') or self.model,
+            messages=messages,
+            web_search=False,
+            timeout=kwargs.get('timeout') or self.timeout
+        )
+        return response.choices[0].message.content
+
+    def stream(self, messages: List[Dict], **kwargs) -> Iterator[str]:
+        response = self._get_client().chat.completions.create(
+            model=kwargs.get('model') or self.model,
+            messages=messages,
+            web_search=False,
+            stream=True,
+            timeout=kwargs.get('timeout') or self.timeout
+        )
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class StubProvider(LLMProvider):
+    """Локальний провайдер-заглушка для офлайн-тестів і бенчмарків"""
+
+    def __init__(self, latency_ms: float = 50, error_rate: float = 0.0, name: str = "stub"):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.name = name
+
+    def complete(self, messages: List[Dict], **kwargs) -> str:
+        time.sleep(self.latency_ms / 1000)
+
+        if random.random() < self.error_rate:
+            raise RuntimeError(f"{self.name}: змодельована помилка провайдера")
+
+        return self._text(messages)
+
+    def stream(self, messages: List[Dict], **kwargs) -> Iterator[str]:
+        # Перший токен приходить після затримки провайдера, решта - рівномірно
+        time.sleep(self.latency_ms / 1000)
+
+        if random.random() < self.error_rate:
+            raise RuntimeError(f"{self.name}: змодельована помилка провайдера")
+
+        for word in self._text(messages).split(' '):
+            yield word + ' '
+            time.sleep(self.latency_ms / 10000)
+
+    @staticmethod
+    def _text(messages: List[Dict]) -> str:
+        prompt = messages[-1]['content'] if messages else ''
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:8]
+        return f"✨ {prompt[:200]}\n\nЗгенеровано локальним провайдером ({digest}).\n\n#тест"
+
+
+class CompletionCache:
+    """
+    Постійний кеш відповідей LLM (таблиця llm_cache) з TTL та LRU-витісненням
+
+    Ключ - SHA-256 від моделі, повідомлень (system + user prompt) та параметрів.
+    Помилки кешу не ламають генерацію - запит просто йде до провайдера.
+    """
+
+    def __init__(self, database, ttl_seconds: float = 7 * 86400, max_entries: int = 1000):
+        """
+        Args:
+            database: екземпляр Database
+            ttl_seconds: час життя запису
+            max_entries: максимальна кількість записів
+        """
+        self.database = database
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict], params: Dict) -> str:
+        payload = json.dumps([model, messages, params], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            response = self.database.get_cached_completion(key, self.ttl_seconds)
+        except Exception as e:
+            logger.warning(f"Помилка читання кешу LLM: {str(e)}")
+            response = None
+
+        if response is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return response
+
+    def set(self, key: str, model: str, response: str):
+        try:
+            self.database.save_cached_completion(key, model, response, self.max_entries)
+        except Exception as e:
+            logger.warning(f"Помилка запису в кеш LLM: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'ttl_seconds': self.ttl_seconds,
+            'max_entries': self.max_entries
+        }
+        try:
+            stats.update(self.database.get_completion_cache_stats())
+        except Exception as e:
+            logger.warning(f"Помилка читання статистики кешу LLM: {str(e)}")
+        return stats
+
+
+class ProviderStats:
+    """Ковзна статистика провайдера (EWMA затримки та частки помилок)"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self.latency = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, success: bool, latency: float):
+        self.requests += 1
+        self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (0.0 if success else 1.0)
+
+        if success:
+            self.consecutive_failures = 0
+            self.latency = latency if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * latency
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def to_dict(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'avg_latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'cooling_down': self.cooldown_until > time.monotonic()
+        }
+
+
+class LLMClient:
+    """Довгоживучий клієнт LLM з перемиканням між провайдерами"""
+
+    def __init__(self, providers: List[LLMProvider], max_workers: int = 4, timeout: float = 60.0,
+                 max_retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 16.0,
+                 failure_threshold: int = 3, cooldown: float = 60.0,
+                 cache: Optional[CompletionCache] = None, model: str = DEFAULT_MODEL,
+                 queue_timeout: Optional[float] = None):
+        """
+        Args:
+            providers: впорядкований список провайдерів (перший - основний)
+            max_workers: максимум одночасних запитів до провайдерів
+            timeout: ліміт часу на один виклик провайдера в секундах
+            max_retries: кількість проходів по списку провайдерів
+            backoff_base: початкова затримка між проходами (подвоюється)
+            backoff_max: максимальна затримка між проходами
+            failure_threshold: кількість помилок поспіль, після якої провайдер відпочиває
+            cooldown: тривалість відпочинку провайдера в секундах
+            cache: кеш відповідей (None - без кешу)
+            model: назва моделі для ключа кешу
+            queue_timeout: максимальне очікування вільного слота (за замовчуванням -
+                найдовший можливий запит: timeout × кількість провайдерів × проходи)
+        """
+        if not providers:
+            raise ValueError("Потрібен хоча б один провайдер LLM")
+
+        self.providers = providers
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.cache = cache
+        self.model = model
+        self.queue_timeout = queue_timeout
+        self.stats = {provider.name: ProviderStats() for provider in providers}
+        # Слоти одночасних запитів: виклик, що перевищив таймаут, звільняє слот одразу,
+        # тож завислий провайдер не вичерпує ліміт і не зупиняє інші запити
+        self._slots = threading.BoundedSemaphore(max_workers)
+
+    def ordered_providers(self) -> List[LLMProvider]:
+        """
+        Провайдери в порядку спроб: справні перед тими, що відпочивають,
+        далі за часткою помилок, затримкою та позицією в конфігурації
+        """
+        now = time.monotonic()
+
+        # Після відпочинку провайдер отримує нову спробу з чистою статистикою помилок
+        for stats in self.stats.values():
+            if stats.cooldown_until and stats.cooldown_until <= now:
+                stats.cooldown_until = 0.0
+                stats.consecutive_failures = 0
+                stats.error_rate = 0.0
+
+        def sort_key(item):
+            index, provider = item
+            stats = self.stats[provider.name]
+            score = (stats.latency or 0.0) * (1 + 4 * stats.error_rate)
+            return (stats.cooldown_until > now, round(stats.error_rate, 1), score, index)
+
+        return [provider for _, provider in sorted(enumerate(self.providers), key=sort_key)]
+
+    def _record(self, provider: LLMProvider, success: bool, latency: float):
+        stats = self.stats[provider.name]
+        stats.record(success, latency)
+
+        if not success and stats.consecutive_failures >= self.failure_threshold:
+            stats.cooldown_until = time.monotonic() + self.cooldown
+            logger.warning(f"Провайдер {provider.name} відпочиває {self.cooldown:.0f} с після "
+                           f"{stats.consecutive_failures} помилок поспіль")
+
+    def _retries(self, max_retries: Optional[int]) -> int:
+        """Кількість проходів по провайдерах (явний 0 - один прохід без повторів)"""
+        return self.max_retries if max_retries is None else max(max_retries, 1)
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _call(provider: LLMProvider, messages: List[Dict], kwargs: Dict, timeout: float):
+        """Виклик провайдера (у фоновому потоці); timeout передається його HTTP-клієнту"""
+        start = time.monotonic()
+        content = (provider.complete(messages, timeout=timeout, **kwargs) or '').strip()
+        if not content:
+            raise LLMError("Порожня відповідь")
+        return content, time.monotonic() - start
+
+    @staticmethod
+    def _spawn(fn: Callable, *args) -> concurrent.futures.Future:
+        """
+        Виконує fn в окремому фоновому потоці
+
+        Блокуючий виклик провайдера неможливо перервати, тому він не займає
+        спільний пул: після таймауту потік дочікує таймауту HTTP-клієнта у фоні,
+        а наступна спроба (перемикання на інший провайдер) стартує одразу.
+        """
+        future = concurrent.futures.Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="llm-call", daemon=True).start()
+        return future
+
+    def _queue_timeout(self, timeout: float, retries: int) -> float:
+        return self.queue_timeout or timeout * len(self.providers) * retries
+
+    async def _acquire_slot(self, wait: float):
+        """Чекає вільний слот не довше wait секунд (опитування - лише коли всі слоти зайняті)"""
+        deadline = time.monotonic() + wait
+        while not self._slots.acquire(blocking=False):
+            if time.monotonic() >= deadline:
+                raise LLMError(f"Усі {self.max_workers} слоти LLM зайняті довше {wait:g} с")
+            await asyncio.sleep(0.005)
+
+    def _acquire_slot_sync(self, wait: float):
+        if not self._slots.acquire(timeout=wait):
+            raise LLMError(f"Усі {self.max_workers} слоти LLM зайняті довше {wait:g} с")
+
+    def _cache_key(self, messages: List[Dict], kwargs: Dict) -> Optional[str]:
+        if not self.cache:
+            return None
+        return self.cache.make_key(kwargs.get('model') or self.model, messages, kwargs)
+
+    async def complete(self, messages: List[Dict], timeout: Optional[float] = None,
+                       max_retries: Optional[int] = None, use_cache: bool = True,
+                       cache_if: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """
+        Виконує запит до першого справного провайдера з перемиканням при помилках
+
+        Args:
+            messages: повідомлення у форматі chat completions
+            timeout: ліміт часу на виклик (за замовчуванням self.timeout)
+            max_retries: кількість проходів по провайдерах (за замовчуванням self.max_retries)
+            use_cache: брати відповідь з кешу (False - новий варіант, який замінить запис у кеші)
+            cache_if: перевірка відповіді (напр. чи розбирається JSON) - у кеш потрапляють
+                і з кешу повертаються лише відповіді, для яких вона істинна
+
+        Returns:
+            str: текст відповіді
+
+        Raises:
+            LLMError: якщо всі спроби невдалі
+        """
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key and use_cache:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if self._cacheable(cached, cache_if):
+                return cached
+
+        content = await self._complete_uncached(messages, timeout, max_retries, **kwargs)
+
+        if cache_key and self._cacheable(content, cache_if):
+            await asyncio.to_thread(self.cache.set, cache_key, kwargs.get('model') or self.model, content)
+        return content
+
+    @staticmethod
+    def _cacheable(content: Optional[str], cache_if: Optional[Callable[[str], bool]]) -> bool:
+        return content is not None and (cache_if is None or bool(cache_if(content)))
+
+    async def _complete_uncached(self, messages: List[Dict], timeout: Optional[float] = None,
+                                 max_retries: Optional[int] = None, **kwargs) -> str:
+        timeout = timeout or self.timeout
+        retries = self._retries(max_retries)
+        last_error = None
+
+        # Слот тримається весь запит разом з перемиканнями; очікування слота обмежене
+        await self._acquire_slot(self._queue_timeout(timeout, retries))
+        try:
+            for attempt in range(retries):
+                for provider in self.ordered_providers():
+                    start = time.monotonic()
+                    future = asyncio.wrap_future(self._spawn(self._call, provider, messages, kwargs, timeout))
+                    try:
+                        content, latency = await asyncio.wait_for(future, timeout=timeout)
+                        self._record(provider, True, latency)
+                        return content
+                    except asyncio.TimeoutError:
+                        last_error = f"{provider.name}: перевищено {timeout:g} с"
+                    except Exception as e:
+                        last_error = f"{provider.name}: {str(e)}"
+
+                    self._record(provider, False, time.monotonic() - start)
+                    logger.warning(f"Помилка LLM (спроба {attempt + 1}/{retries}) - {last_error}")
+
+                if attempt < retries - 1:
+                    await asyncio.sleep(self._backoff(attempt))
+
+            raise LLMError(last_error or "Не вдалося отримати відповідь")
+        finally:
+            self._slots.release()
+
+    def complete_sync(self, messages: List[Dict], timeout: Optional[float] = None,
+                      max_retries: Optional[int] = None, use_cache: bool = True,
+                      cache_if: Optional[Callable[[str], bool]] = None, **kwargs) -> str:
+        """Синхронна версія complete() для коду, що вже виконується в окремому потоці"""
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key and use_cache:
+            cached = self.cache.get(cache_key)
+            if self._cacheable(cached, cache_if):
+                return cached
+
+        content = self._complete_sync_uncached(messages, timeout, max_retries, **kwargs)
+
+        if cache_key and self._cacheable(content, cache_if):
+            self.cache.set(cache_key, kwargs.get('model') or self.model, content)
+        return content
+
+    def _complete_sync_uncached(self, messages: List[Dict], timeout: Optional[float] = None,
+                                max_retries: Optional[int] = None, **kwargs) -> str:
+        timeout = timeout or self.timeout
+        retries = self._retries(max_retries)
+        last_error = None
+
+        self._acquire_slot_sync(self._queue_timeout(timeout, retries))
+        try:
+            for attempt in range(retries):
+                for provider in self.ordered_providers():
+                    start = time.monotonic()
+                    future = self._spawn(self._call, provider, messages, kwargs, timeout)
+                    try:
+                        content, latency = future.result(timeout=timeout)
+                        self._record(provider, True, latency)
+                        return content
+                    except concurrent.futures.TimeoutError:
+                        last_error = f"{provider.name}: перевищено {timeout:g} с"
+                    except Exception as e:
+                        last_error = f"{provider.name}: {str(e)}"
+
+                    self._record(provider, False, time.monotonic() - start)
+                    logger.warning(f"Помилка LLM (спроба {attempt + 1}/{retries}) - {last_error}")
+
+                if attempt < retries - 1:
+                    time.sleep(self._backoff(attempt))
+
+            raise LLMError(last_error or "Не вдалося отримати відповідь")
+        finally:
+            self._slots.release()
+
+    async def stream(self, messages: List[Dict], timeout: Optional[float] = None,
+                     max_retries: Optional[int] = None, use_cache: bool = True,
+                     **kwargs) -> AsyncIterator[str]:
+        """
+        Потокова генерація: частини відповіді передаються по мірі надходження
+
+        Перемикання на інший провайдер можливе лише до першої частини -
+        після неї помилка передається викликачу. timeout діє на очікування
+        кожної наступної частини. Відповідь з кешу віддається одним шматком.
+
+        Raises:
+            LLMError: якщо жоден провайдер не почав відповідь
+        """
+        cache_key = self._cache_key(messages, kwargs)
+        if cache_key and use_cache:
+            cached = await asyncio.to_thread(self.cache.get, cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        async for chunk in self._stream_uncached(messages, timeout, max_retries, **kwargs):
+            parts.append(chunk)
+            yield chunk
+
+        content = ''.join(parts).strip()
+        if cache_key and content:
+            await asyncio.to_thread(self.cache.set, cache_key, kwargs.get('model') or self.model, content)
+
+    async def _stream_uncached(self, messages: List[Dict], timeout: Optional[float] = None,
+                               max_retries: Optional[int] = None, **kwargs) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        timeout = timeout or self.timeout
+        retries = self._retries(max_retries)
+        last_error = None
+
+        await self._acquire_slot(self._queue_timeout(timeout, retries))
+        try:
+            for attempt in range(retries):
+                for provider in self.ordered_providers():
+                    queue: asyncio.Queue = asyncio.Queue()
+                    cancelled = threading.Event()
+                    done = object()
+
+                    def produce(provider=provider, queue=queue, cancelled=cancelled):
+                        try:
+                            for chunk in provider.stream(messages, timeout=timeout, **kwargs):
+                                if cancelled.is_set():
+                                    break
+                                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                            loop.call_soon_threadsafe(queue.put_nowait, done)
+                        except Exception as e:
+                            loop.call_soon_threadsafe(queue.put_nowait, e)
+
+                    start = time.monotonic()
+                    self._spawn(produce)
+                    started = False
+
+                    try:
+                        while True:
+                            item = await asyncio.wait_for(queue.get(), timeout=timeout)
+                            if item is done:
+                                if not started:
+                                    raise LLMError("Порожня відповідь")
+                                return
+                            if isinstance(item, Exception):
+                                raise item
+
+                            if not started:
+                                started = True
+                                self._record(provider, True, time.monotonic() - start)
+                            yield item
+                    except asyncio.TimeoutError:
+                        last_error = f"{provider.name}: перевищено {timeout:g} с"
+                    except Exception as e:
+                        last_error = f"{provider.name}: {str(e)}"
+                    finally:
+                        # Зупиняємо потік-виробник, якщо споживач перестав читати
+                        cancelled.set()
+
+                    if started:
+                        raise LLMError(last_error)
+
+                    self._record(provider, False, time.monotonic() - start)
+                    logger.warning(f"Помилка LLM (спроба {attempt + 1}/{retries}) - {last_error}")
+
+                if attempt < retries - 1:
+                    await asyncio.sleep(self._backoff(attempt))
+
+            raise LLMError(last_error or "Не вдалося отримати відповідь")
+        finally:
+            self._slots.release()
+
+    def get_stats(self) -> Dict:
+        """Статистика провайдерів"""
+        return {provider.name: self.stats[provider.name].to_dict() for provider in self.providers}
+
+    def get_cache_stats(self) -> Optional[Dict]:
+        """Статистика кешу відповідей (None, якщо кеш вимкнено)"""
+        return self.cache.get_stats() if self.cache else None
+
+
+def create_provider(spec: str, model: str = DEFAULT_MODEL) -> LLMProvider:
+    """
+    Створює провайдера за специфікацією
+
+    Args:
+        spec: "g4f:<Provider>" або "stub[:latency_ms[:error_rate]]"
+    """
+    kind, _, args = spec.strip().partition(':')
+
+    if kind == 'stub':
+        parts = args.split(':') if args else []
+        latency_ms = float(parts[0]) if parts and parts[0] else 50
+        error_rate = float(parts[1]) if len(parts) > 1 else 0.0
+        return StubProvider(latency_ms=latency_ms, error_rate=error_rate, name=spec.strip())
+
+    if kind == 'g4f':
+        return G4FProvider(provider_name=args or "DeepInfra", model=model)
+
+    raise ValueError(f"Невідомий провайдер LLM: {spec}")
+
+
+def create_client_from_env() -> LLMClient:
+    """
+    Створює клієнт з налаштувань оточення (LLM_PROVIDERS, LLM_MODEL, LLM_TIMEOUT,
+    LLM_MAX_WORKERS, LLM_CACHE, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
+    """
+    model = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+    specs = [spec for spec in os.getenv("LLM_PROVIDERS", "g4f:DeepInfra").split(',') if spec.strip()]
+
+    cache = None
+    if os.getenv("LLM_CACHE", "1") != "0":
+        from database import db
+
+        cache = CompletionCache(
+            db,
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL", str(7 * 86400))),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+        )
+
+    return LLMClient(
+        providers=[create_provider(spec, model) for spec in specs],
+        max_workers=int(os.getenv("LLM_MAX_WORKERS", "4")),
+        timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+        cache=cache,
+        model=model
+    )
+
+
+async def run_benchmark(requests: int = 200, concurrency: int = 20, latency_ms: float = 50,
+                        error_rate: float = 0.0, max_workers: int = 8) -> Dict:
+    """
+    Вимірює пропускну здатність клієнта на локальних провайдерах
+
+    Основний провайдер має задану частку помилок, резервний - справний,
+    тож видно і пропускну здатність, і перемикання.
+    """
+    client = LLMClient(
+        providers=[
+            StubProvider(latency_ms=latency_ms, error_rate=error_rate, name="stub-primary"),
+            StubProvider(latency_ms=latency_ms * 2, name="stub-fallback")
+        ],
+        max_workers=max_workers,
+        timeout=max(1.0, latency_ms / 100),
+        backoff_base=0.05
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(i: int):
+        nonlocal failures
+        async with semaphore:
+            try:
+                await client.complete([{"role": "user", "content": f"Тестовий пост {i}"}])
+            except LLMError:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'requests': requests,
+        'failed': failures,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(requests / elapsed, 1),
+        'providers': client.get_stats()
+    }
+
+    print(f"Запитів: {requests}, помилок: {failures}")
+    print(f"Час: {result['elapsed_s']} с, пропускна здатність: {result['throughput_rps']} запитів/с")
+    for name, stats in result['providers'].items():
+        print(f"  {name}: {stats}")
+
+    return result
+
+
+# Глобальний клієнт LLM
+llm_client = create_client_from_env()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.ERROR)
+
+    parser = argparse.ArgumentParser(description="Клієнт LLM")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bench = subparsers.add_parser("bench", help="Бенчмарк пропускної здатності на локальних провайдерах")
+    bench.add_argument("--requests", type=int, default=200)
+    bench.add_argument("--concurrency", type=int, default=20)
+    bench.add_argument("--latency-ms", type=float, default=50)
+    bench.add_argument("--error-rate", type=float, default=0.0)
+    bench.add_argument("--workers", type=int, default=8)
+
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        asyncio.run(run_benchmark(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            latency_ms=args.latency_ms,
+            error_rate=args.error_rate,
+            max_workers=args.workers
+        ))
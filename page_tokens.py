@@ -0,0 +1,242 @@
+"""
+Реєстр токенів сторінок Facebook
+
+Єдине джерело токенів для планувальників та API: таблиця user_facebook_pages
+(плюс сторінки з facebook_credentials.json для режиму одного користувача),
+завантажена в пам'ять з пошуком за page_id за O(1). Реєстр перезавантажується
+при додаванні, видаленні та оновленні сторінок або токенів, а прострочені чи
+відкликані Facebook токени відсіюються ще до запиту в Graph API.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Код помилки Graph API "недійсний або прострочений токен"
+INVALID_TOKEN_ERROR_CODE = 190
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def is_invalid_token_error(error: Optional[str]) -> bool:
+    """Чи є помилка FacebookManager відмовою через недійсний токен (код 190)"""
+    return bool(error) and f"(код: {INVALID_TOKEN_ERROR_CODE})" in error
+
+
+class PageTokenRegistry:
+    """Токени сторінок у пам'яті: page_id -> {user_id -> запис}"""
+
+    def __init__(self, database=None, expiry_margin: int = 300):
+        """
+        Args:
+            database: екземпляр Database (за замовчуванням глобальний db)
+            expiry_margin: за скільки секунд до закінчення терміну токен вважається простроченим
+        """
+        self._database = database
+        self.expiry_margin = expiry_margin
+        self._lock = threading.RLock()
+        self._by_page: Dict[str, Dict[Optional[int], Dict]] = {}
+        self._by_user: Dict[int, Dict[str, Dict]] = {}
+        self._loaded = False
+        self._stale_users: Set[int] = set()
+
+    @property
+    def database(self):
+        if self._database is None:
+            from database import db
+            self._database = db
+        return self._database
+
+    @staticmethod
+    def _make_entry(row: Dict) -> Dict:
+        return {
+            'user_id': row.get('user_id'),
+            'page_id': row['page_id'],
+            'page_name': row.get('page_name'),
+            'access_token': row['access_token'],
+            'expires_at': _parse_time(row.get('token_expires_at')),
+            'invalid_at': row.get('token_invalid_at'),
+            'user_token_expires_at': _parse_time(row.get('user_token_expires_at'))
+        }
+
+    def _add_entry(self, entry: Dict):
+        self._by_page.setdefault(entry['page_id'], {})[entry['user_id']] = entry
+        if entry['user_id'] is not None:
+            self._by_user.setdefault(entry['user_id'], {})[entry['page_id']] = entry
+
+    def _load_all(self):
+        """Повне завантаження з БД (та сторінок з facebook_credentials.json)"""
+        rows = self.database.get_all_facebook_pages()
+
+        self._by_page = {}
+        self._by_user = {}
+        for row in rows:
+            self._add_entry(self._make_entry(row))
+
+        # Сторінки з конфігурації одного користувача (без user_id) - з нижчим пріоритетом
+        from facebook_config import fb_config
+        for page in fb_config.get_pages():
+            if None not in self._by_page.get(page['id'], {}):
+                self._add_entry(self._make_entry({
+                    'page_id': page['id'],
+                    'page_name': page.get('name'),
+                    'access_token': page['access_token']
+                }))
+
+        self._loaded = True
+        self._stale_users.clear()
+        logger.info(f"Реєстр токенів: завантажено {len(rows)} сторінок користувачів")
+
+    def _reload_user(self, user_id: int):
+        """Перезавантажує сторінки одного користувача"""
+        for page_id in self._by_user.pop(user_id, {}):
+            owners = self._by_page.get(page_id, {})
+            owners.pop(user_id, None)
+            if not owners:
+                self._by_page.pop(page_id, None)
+
+        for row in self.database.get_all_facebook_pages(user_id):
+            self._add_entry(self._make_entry(row))
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if not self._loaded:
+                self._load_all()
+                return
+            while self._stale_users:
+                self._reload_user(self._stale_users.pop())
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """
+        Позначає дані застарілими - перезавантаження при наступному зверненні
+
+        Args:
+            user_id: лише сторінки користувача (None - весь реєстр)
+        """
+        with self._lock:
+            if user_id is None:
+                self._loaded = False
+            else:
+                self._stale_users.add(user_id)
+
+    def get_entry(self, page_id: str, user_id: Optional[int] = None) -> Optional[Dict]:
+        """
+        Запис реєстру для сторінки
+
+        Args:
+            page_id: ID сторінки
+            user_id: власник (None - будь-який користувач, дійсний токен має пріоритет)
+        """
+        self._ensure_fresh()
+
+        owners = self._by_page.get(page_id)
+        if not owners:
+            return None
+
+        if user_id is not None:
+            return owners.get(user_id) or owners.get(None)
+
+        for entry in owners.values():
+            if self._check_entry(entry) is None:
+                return entry
+        return next(iter(owners.values()))
+
+    def _check_entry(self, entry: Dict) -> Optional[str]:
+        """Причина, з якої токен не можна використати, або None"""
+        if entry['invalid_at']:
+            return f"Токен сторінки {entry['page_id']} відкликано Facebook ({entry['invalid_at']}), оновіть сторінки"
+
+        expires_at = entry['expires_at']
+        if expires_at and expires_at <= datetime.now() + timedelta(seconds=self.expiry_margin):
+            return f"Токен сторінки {entry['page_id']} прострочено ({expires_at.isoformat()}), оновіть сторінки"
+
+        return None
+
+    def resolve(self, page_id: str, user_id: Optional[int] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Токен сторінки або причина, чому його немає
+
+        Returns:
+            Tuple: (токен, None) або (None, опис помилки)
+        """
+        entry = self.get_entry(page_id, user_id)
+        if not entry:
+            return None, f"Не знайдено токен для сторінки {page_id}"
+
+        error = self._check_entry(entry)
+        if error:
+            return None, error
+
+        return entry['access_token'], None
+
+    def get_token(self, page_id: str, user_id: Optional[int] = None) -> Optional[str]:
+        """Дійсний токен сторінки або None"""
+        token, error = self.resolve(page_id, user_id)
+        if error:
+            logger.warning(error)
+        return token
+
+    def get_user_tokens(self, user_id: int) -> Dict[str, str]:
+        """Дійсні токени всіх сторінок користувача: {page_id: token}"""
+        self._ensure_fresh()
+        return {
+            page_id: entry['access_token']
+            for page_id, entry in self._by_user.get(user_id, {}).items()
+            if self._check_entry(entry) is None
+        }
+
+    def get_entries(self) -> List[Dict]:
+        """Усі записи користувачів (для фонової перевірки токенів)"""
+        self._ensure_fresh()
+        return [dict(entry) for pages in self._by_user.values() for entry in pages.values()]
+
+    def mark_invalid(self, page_id: str, user_id: Optional[int]):
+        """Позначає токен недійсним після відмови Graph API (код 190)"""
+        entry = self.get_entry(page_id, user_id)
+        if not entry:
+            return
+
+        logger.warning(f"Токен сторінки {page_id} визнано недійсним")
+        if entry['user_id'] is None:
+            # Сторінка з facebook_credentials.json - позначаємо лише в пам'яті
+            entry['invalid_at'] = datetime.now().isoformat()
+            return
+
+        expires_at = entry['expires_at'].isoformat() if entry['expires_at'] else None
+        self.database.update_facebook_page_token_status(
+            entry['user_id'], page_id, token_expires_at=expires_at, invalid=True
+        )
+
+    def get_stats(self) -> Dict:
+        """Кількість сторінок та непридатних токенів"""
+        self._ensure_fresh()
+        entries = [entry for owners in self._by_page.values() for entry in owners.values()]
+        unusable = [entry for entry in entries if self._check_entry(entry)]
+        return {
+            'pages': len(self._by_page),
+            'users': len(self._by_user),
+            'tokens': len(entries),
+            'unusable_tokens': len(unusable)
+        }
+
+
+# Глобальний реєстр токенів сторінок
+page_token_registry = PageTokenRegistry()
+
+
+def _register_page_listener():
+    from database import db
+    db.add_page_listener(page_token_registry.invalidate)
+
+
+_register_page_listener()
@@ -0,0 +1,165 @@
+"""
+HTTP-кешування відповідей дашборду
+
+Відповіді read-heavy ендпоінтів отримують ETag та Last-Modified з версій
+даних (таблиця data_versions, яку підтримують тригери БД). Якщо клієнт
+надсилає If-None-Match з поточним ETag - повертається 304 без запитів до
+даних; інакше результат береться з короткоживучого кешу в процесі за
+ключем (ендпоінт, користувач, параметри, версія) або будується заново.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, List, Optional
+
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Час життя зібраної відповіді в кеші (с) та максимум записів
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = 500
+
+
+class ResponseCache:
+    """LRU-кеш серіалізованих JSON-відповідей з обмеженим часом життя"""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: tuple, body: bytes):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def make_etag(endpoint: str, user_id: Optional[int], params: Dict, version: str) -> str:
+    """
+    Слабкий ETag відповіді
+
+    Користувач входить у хеш, щоб кеш браузера, спільний для кількох
+    акаунтів, не отримав 304 на чужу відповідь з тією ж версією.
+    """
+    key = json.dumps([endpoint, user_id, params, version], sort_keys=True, default=str)
+    return f'W/"{hashlib.sha1(key.encode()).hexdigest()[:24]}"'
+
+
+def parse_updated_at(updated_at: Optional[str]) -> Optional[datetime]:
+    """CURRENT_TIMESTAMP SQLite -> datetime в UTC"""
+    if not updated_at:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(updated_at))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+def is_not_modified(etag: str, last_modified: Optional[str],
+                    if_none_match: Optional[str], if_modified_since: Optional[str]) -> bool:
+    """Умовний запит: If-None-Match має пріоритет над If-Modified-Since (RFC 9110)"""
+    if if_none_match:
+        # Слабке порівняння: W/"x" та "x" вважаються однаковими
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in candidates or etag.removeprefix('W/') in candidates
+
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+async def cached_json_response(endpoint: str, params: Dict, scopes: List[str], user_id: Optional[int],
+                               build: Callable[[], Dict], if_none_match: Optional[str] = None,
+                               if_modified_since: Optional[str] = None,
+                               window_start: Optional[datetime] = None) -> Response:
+    """
+    JSON-відповідь з ETag/Last-Modified, 304 та кешем результату
+
+    Args:
+        endpoint: назва ендпоінта (частина ключа кешу)
+        params: параметри запиту, що впливають на відповідь
+        scopes: області data_versions, від яких залежать дані
+        user_id: користувач (None - дані всіх користувачів)
+        build: синхронна функція, що будує відповідь (виконується в потоці)
+        if_none_match: заголовок If-None-Match запиту
+        if_modified_since: заголовок If-Modified-Since запиту
+        window_start: локальний початок поточного вікна для даних, що залежать від часу
+            (напр. ковзний період топ-постів) - Last-Modified не раніший за нього
+
+    Returns:
+        Response: 304 без тіла або 200 з JSON
+    """
+    from database import db
+
+    # Момент читання версії з точністю CURRENT_TIMESTAMP (1 с) - до самого читання
+    read_second = datetime.now(timezone.utc).replace(microsecond=0)
+    data_version = await asyncio.to_thread(db.get_data_version, scopes, user_id)
+    etag = make_etag(endpoint, user_id, params, data_version['version'])
+
+    modified = parse_updated_at(data_version['updated_at'])
+    if window_start:
+        window_start = window_start.astimezone(timezone.utc)
+        modified = max(modified, window_start) if modified else window_start
+    # Last-Modified - лише коли остання зміна в уже завершеній секунді: запис у ту ж секунду
+    # після відповіді не змінив би дату, і клієнт з If-Modified-Since пропустив би його
+    last_modified = None
+    if modified and modified < read_second:
+        last_modified = format_datetime(modified, usegmt=True)
+
+    # no-cache: браузер зберігає відповідь, але щоразу перевіряє її умовним запитом
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if last_modified:
+        headers["Last-Modified"] = last_modified
+
+    if is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+
+    key = (endpoint, user_id, json.dumps(params, sort_keys=True, default=str), data_version['version'])
+    body = response_cache.get(key)
+    if body is None:
+        result = await asyncio.to_thread(build)
+        body = json.dumps(result, ensure_ascii=False, default=str).encode('utf-8')
+        response_cache.set(key, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Глобальний екземпляр кешу відповідей
+response_cache = ResponseCache()
@@ -5,45 +5,36 @@
 
 import asyncio
 import logging
+import os
 import json
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Optional
 from database import db
 from facebook_manager import FacebookManager
 from facebook_config import fb_config
 from facebook_analytics import get_post_analytics
+from page_tokens import page_token_registry, is_invalid_token_error
+from timer_service import CronSchedule, IntervalSchedule
 
 logger = logging.getLogger(__name__)
 
 class PostScheduler:
     """Клас для автоматичної публікації запланованих постів"""
     
-    def __init__(self, check_interval: int = 60):
+    def __init__(self, check_interval: int = 60, initial_analytics_delay: float = 5):
         """
         Args:
             check_interval: інтервал перевірки в секундах (за замовчуванням 60)
+            initial_analytics_delay: пауза перед збором початкової аналітики в секундах
         """
         self.check_interval = check_interval
-        self.is_running = False
+        self.initial_analytics_delay = initial_analytics_delay
         self.fb_manager = FacebookManager(fb_config.config.get('access_token', ''))
     
-    async def start(self):
-        """Запускає планувальник"""
-        self.is_running = True
-        logger.info("Планувальник постів запущено")
-        
-        while self.is_running:
-            try:
-                await self.check_and_publish_posts()
-            except Exception as e:
-                logger.error(f"Помилка в планувальнику: {str(e)}")
-            
-            await asyncio.sleep(self.check_interval)
-    
-    def stop(self):
-        """Зупиняє планувальник"""
-        self.is_running = False
-        logger.info("Планувальник постів зупинено")
+    def register(self, timer):
+        """Реєструє перевірку запланованих постів у спільному таймері"""
+        timer.register('posts', IntervalSchedule(self.check_interval), self.check_and_publish_posts,
+                       run_immediately=True)
     
     async def check_and_publish_posts(self):
         """Перевіряє та публікує заплановані пости"""
@@ -93,10 +84,9 @@ class PostScheduler:
         print(f"    → Публікація поста ID {post_id} на сторінці {post_data['page_name']}")
         logger.info(f"Публікація поста ID {post_id} на сторінці {post_data['page_name']}")
         
-        page_token = fb_config.get_page_token(page_id)
+        page_token, error_msg = page_token_registry.resolve(page_id, post_data.get('user_id'))
         
         if not page_token:
-            error_msg = f"Не знайдено токен для сторінки {page_id}"
             print(f"    ✗ {error_msg}")
             logger.error(error_msg)
             db.update_publication_status(
@@ -173,9 +163,10 @@ class PostScheduler:
                 facebook_post_id=result['post_id']
             )
             
-            # ✨ НОВЕ: Збираємо початкову аналітику через 5 секунд
-            print(f"    → Очікування 5 сек перед збором початкової аналітики...")
-            await asyncio.sleep(5)
+            # ✨ НОВЕ: Збираємо початкову аналітику після невеликої паузи
+            if self.initial_analytics_delay:
+                print(f"    → Очікування {self.initial_analytics_delay} сек перед збором початкової аналітики...")
+                await asyncio.sleep(self.initial_analytics_delay)
             
             try:
                 analytics = await asyncio.to_thread(
@@ -209,6 +200,8 @@ class PostScheduler:
         else:
             error_msg = result.get('error', 'Unknown error')
             print(f"    ✗ Помилка публікації: {error_msg}")
+            if is_invalid_token_error(error_msg):
+                page_token_registry.mark_invalid(page_id, post_data.get('user_id'))
             db.update_publication_status(
                 publication_id,
                 'failed',
@@ -220,32 +213,23 @@ class PostScheduler:
 class AnalyticsCollector:
     """Клас для регулярного збору аналітики опублікованих постів"""
     
-    def __init__(self, check_interval: int = 1800):  # За замовчуванням 30 хвилин
+    def __init__(self, check_interval: int = 1800,  # За замовчуванням 30 хвилин
+                 batch_size: int = 50, request_delay: float = 0.5):
         """
         Args:
             check_interval: інтервал збору аналітики в секундах (за замовчуванням 1800 = 30 хв)
+            batch_size: максимальна кількість публікацій за один прохід
+            request_delay: затримка між запитами до Graph API в секундах
         """
         self.check_interval = check_interval
-        self.is_running = False
+        self.batch_size = batch_size
+        self.request_delay = request_delay
         self.fb_manager = FacebookManager(fb_config.config.get('access_token', ''))
     
-    async def start(self):
-        """Запускає збирач аналітики"""
-        self.is_running = True
-        logger.info(f"Збирач аналітики запущено (інтервал: {self.check_interval//60} хв)")
-        
-        while self.is_running:
-            try:
-                await self.collect_analytics()
-            except Exception as e:
-                logger.error(f"Помилка в збирачі аналітики: {str(e)}")
-            
-            await asyncio.sleep(self.check_interval)
-    
-    def stop(self):
-        """Зупиняє збирач аналітики"""
-        self.is_running = False
-        logger.info("Збирач аналітики зупинено")
+    def register(self, timer):
+        """Реєструє збір аналітики у спільному таймері"""
+        timer.register('analytics', IntervalSchedule(self.check_interval), self.collect_analytics,
+                       run_immediately=True)
     
     async def collect_analytics(self):
         """Збирає аналітику для всіх опублікованих постів за останні 30 днів"""
@@ -257,22 +241,22 @@ class AnalyticsCollector:
         
         # Отримуємо публікації за останні 30 днів, сортуємо за датою оновлення аналітики
         cursor.execute("""
-            SELECT pub.id, pub.facebook_post_id, pub.page_id,
-                   p.published_at, a.updated_at as analytics_updated_at
+            SELECT pub.id, pub.facebook_post_id, pub.page_id, pub.user_id,
+                   pub.published_at, a.updated_at as analytics_updated_at
             FROM publications pub
             JOIN posts p ON pub.post_id = p.id
             LEFT JOIN analytics a ON pub.id = a.publication_id
             WHERE pub.status = 'published' 
             AND pub.facebook_post_id IS NOT NULL
-            AND p.published_at > datetime('now', '-30 days')
+            AND pub.published_at > datetime('now', '-30 days')
             ORDER BY 
                 CASE 
                     WHEN a.updated_at IS NULL THEN 0
                     ELSE 1
                 END,
                 a.updated_at ASC
-            LIMIT 50
-        """)
+            LIMIT ?
+        """, (self.batch_size,))
         
         publications = [dict(row) for row in cursor.fetchall()]
         conn.close()
@@ -301,7 +285,8 @@ class AnalyticsCollector:
                     error_count += 1
                 
                 # Невелика затримка між запитами
-                await asyncio.sleep(0.5)
+                if self.request_delay:
+                    await asyncio.sleep(self.request_delay)
                 
             except Exception as e:
                 logger.error(f"Помилка збору аналітики для публікації {pub['id']}: {str(e)}")
@@ -317,10 +302,9 @@ class AnalyticsCollector:
         Returns:
             bool: True якщо успішно
         """
-        page_token = fb_config.get_page_token(publication['page_id'])
+        page_token = page_token_registry.get_token(publication['page_id'], publication.get('user_id'))
         
         if not page_token:
-            logger.warning(f"Не знайдено токен для сторінки {publication['page_id']}")
             return False
         
         try:
@@ -350,48 +334,33 @@ class AnalyticsCollector:
 class RecommendationsScheduler:
     """Клас для автоматичної генерації AI-рекомендацій"""
     
-    def __init__(self, check_interval: int = 86400):  # За замовчуванням 24 години
+    def __init__(self, cron: str = "0 9 * * 1"):  # За замовчуванням понеділок о 9:00
         """
         Args:
-            check_interval: інтервал перевірки в секундах (за замовчуванням 86400 = 24 год)
+            cron: розклад генерації (cron-вираз: хвилина година день місяць день_тижня)
         """
-        self.check_interval = check_interval
-        self.is_running = False
-        # Налаштування: який день тижня та година для запуску (понеділок о 9:00)
-        self.target_day = 0  # 0 = понеділок
-        self.target_hour = 9
+        self.schedule = CronSchedule(cron)
     
-    async def start(self):
-        """Запускає планувальник рекомендацій"""
-        self.is_running = True
-        logger.info(f"Планувальник рекомендацій запущено (перевірка кожні {self.check_interval//3600} год)")
-        logger.info(f"Цільовий час: понеділок о {self.target_hour}:00")
-        
-        while self.is_running:
-            try:
-                await self.check_and_generate()
-            except Exception as e:
-                logger.error(f"Помилка в планувальнику рекомендацій: {str(e)}")
-            
-            await asyncio.sleep(self.check_interval)
-    
-    def stop(self):
-        """Зупиняє планувальник"""
-        self.is_running = False
-        logger.info("Планувальник рекомендацій зупинено")
+    def register(self, timer):
+        """
+        Реєструє генерацію рекомендацій у спільному таймері
+
+        Перша перевірка - одразу після старту: якщо сервер був вимкнений
+        у цільовий час, пропущений запуск наздоганяється (свіжа рекомендація
+        не перегенеровується).
+        """
+        timer.register('recommendations', self.schedule, self.check_and_generate, run_immediately=True)
     
     async def check_and_generate(self):
         """Перевіряє чи потрібно генерувати рекомендації"""
         now = datetime.now()
         
-        # Перевіряємо чи сьогодні цільовий день і година
-        if now.weekday() != self.target_day or now.hour != self.target_hour:
-            return
-        
         print(f"\n[{now.strftime('%H:%M:%S')}] Перевірка необхідності генерації рекомендацій...")
         
-        # Перевіряємо чи була рекомендація за останні 7 днів
-        has_recent = db.check_recent_recommendation(days=7)
+        # Свіжа - збережена після останнього запуску за розкладом (не "за 7 днів":
+        # минулотижневий запуск завершився на кілька секунд пізніше за цільовий час)
+        last_due = self.schedule.previous_at_or_before(now)
+        has_recent = await asyncio.to_thread(db.check_recent_recommendation, since=last_due)
         
         if has_recent:
             print("  → Свіжа рекомендація вже існує, пропускаємо")
@@ -410,13 +379,15 @@ class RecommendationsScheduler:
             from analytics_recommender import recommender
             
             # Виконуємо повний аналіз за останні 7 днів, топ-10 постів, з AI
-            result = recommender.get_full_analysis(
+            result = await recommender.get_full_analysis_async(
                 period_days=7,
                 limit=10,
                 use_ai=True
             )
             
-            if result['success']:
+            if result.get('reused'):
+                print(f"  → Аналітика не змінилася, актуальна рекомендація #{result['recommendation_id']}")
+            elif result['success']:
                 print(f"  ✓ Рекомендації успішно згенеровано!")
                 print(f"  → Проаналізовано {result['analyzed_count']} постів")
                 
@@ -427,15 +398,225 @@ class RecommendationsScheduler:
             else:
                 print(f"  ✗ {result['message']}")
                 logger.warning(f"Не вдалося згенерувати рекомендації: {result['message']}")
+
+            # Рекомендації для кожного користувача та його сторінок
+            scoped = await recommender.generate_scoped_recommendations_async(
+                period_days=7,
+                limit=10,
+                use_ai=True
+            )
+            print(f"  → Рекомендації по користувачах/сторінках: {scoped['completed']} з {scoped['scopes_count']} "
+                  f"(без змін: {scoped['reused']})")
                 
         except Exception as e:
             print(f"  ✗ Помилка генерації: {str(e)}")
             logger.error(f"Помилка генерації рекомендацій: {str(e)}")
 
 
+class ArchiveJob:
+    """Клас для періодичного перенесення старих постів та аналітики в архівну БД"""
+
+    def __init__(self, older_than_days: int = 180, check_interval: int = 86400):
+        """
+        Args:
+            older_than_days: вік у днях, після якого пости переносяться в архів (0 - вимкнено)
+            check_interval: інтервал запуску в секундах (за замовчуванням 86400 = 24 год)
+        """
+        self.older_than_days = older_than_days
+        self.check_interval = check_interval
+
+    def register(self, timer):
+        """Реєструє архівацію у спільному таймері"""
+        timer.register('archive', IntervalSchedule(self.check_interval), self.run_once, run_immediately=True)
+
+    async def run_once(self):
+        """Переносить в архів пости, старші за older_than_days"""
+        # SQLite блокує - виконуємо в окремому потоці
+        counts = await asyncio.to_thread(db.archive_old_data, older_than_days=self.older_than_days)
+        if counts['posts']:
+            print(f"[{datetime.now().strftime('%H:%M:%S')}] Архівовано постів: {counts['posts']}")
+
+
+class TokenRefreshService:
+    """
+    Клас для завчасного оновлення та перевірки токенів Facebook
+
+    Long-lived токени користувачів, що скоро спливають, повторно обмінюються,
+    а токени сторінок перезапитуються. Усі токени пакетно перевіряються через
+    debug_token, тож недійсні відсіюються реєстром ще до публікації.
+    """
+
+    def __init__(self, check_interval: int = 21600, refresh_ahead_days: int = 7, batch_size: int = 50):
+        """
+        Args:
+            check_interval: інтервал перевірки в секундах (за замовчуванням 21600 = 6 год)
+            refresh_ahead_days: за скільки днів до закінчення оновлювати токен користувача
+            batch_size: кількість токенів в одному batch-запиті debug_token (максимум 50)
+        """
+        self.check_interval = check_interval
+        self.refresh_ahead_days = refresh_ahead_days
+        self.batch_size = batch_size
+        self.last_run: Optional[Dict] = None
+
+    def register(self, timer):
+        """Реєструє оновлення токенів у спільному таймері"""
+        timer.register('tokens', IntervalSchedule(self.check_interval), self.run_once, run_immediately=True)
+
+    async def run_once(self) -> Dict:
+        """
+        Один прохід: оновлення токенів, що спливають, та пакетна перевірка решти
+
+        Returns:
+            Dict: підсумок проходу (також доступний як last_run)
+        """
+        summary = {
+            'started_at': datetime.now().isoformat(),
+            'users_refreshed': 0,
+            'pages_refetched': 0,
+            'tokens_checked': 0,
+            'tokens_invalid': 0,
+            'users_need_reauth': 0,
+            'errors': 0
+        }
+
+        refreshed_users = await self._refresh_user_tokens(summary)
+        await self._validate_tokens(summary, refreshed_users)
+        await self._refresh_config_token(summary)
+
+        summary['finished_at'] = datetime.now().isoformat()
+        self.last_run = summary
+        logger.info(f"Перевірку токенів завершено: {summary}")
+        return summary
+
+    async def _refetch_pages(self, user_id: int, user_token: str, summary: Dict) -> bool:
+        """Перезапитує сторінки (та їх токени) користувача"""
+        from auth_facebook import FacebookOAuth
+
+        pages = await FacebookOAuth.get_user_pages(user_token)
+        if not pages:
+            return False
+
+        await asyncio.to_thread(db.replace_user_facebook_pages, user_id, pages)
+        summary['pages_refetched'] += len(pages)
+        return True
+
+    async def _refresh_user_tokens(self, summary: Dict) -> set:
+        """Повторно обмінює long-lived токени користувачів, що скоро спливають"""
+        from auth_facebook import FacebookOAuth
+
+        if not FacebookOAuth.get_app_access_token():
+            return set()
+
+        expiring_before = datetime.now() + timedelta(days=self.refresh_ahead_days)
+        users = await asyncio.to_thread(db.get_users_with_facebook_tokens, expiring_before)
+
+        refreshed = set()
+        for user in users:
+            try:
+                token_data = await FacebookOAuth.exchange_for_long_lived_token(user['token'])
+                await asyncio.to_thread(
+                    db.update_user_facebook_token, user['user_id'], token_data['token'], token_data['expires_in']
+                )
+                await self._refetch_pages(user['user_id'], token_data['token'], summary)
+                refreshed.add(user['user_id'])
+                summary['users_refreshed'] += 1
+                logger.info(f"✓ Токен користувача {user['user_id']} оновлено завчасно")
+            except Exception as e:
+                summary['errors'] += 1
+                logger.warning(f"Не вдалося оновити токен користувача {user['user_id']}: {str(e)}")
+
+        return refreshed
+
+    async def _validate_tokens(self, summary: Dict, refreshed_users: set):
+        """Пакетно перевіряє токени користувачів та сторінок через debug_token"""
+        from auth_facebook import FacebookOAuth
+
+        if not FacebookOAuth.get_app_access_token():
+            return
+
+        users = await asyncio.to_thread(db.get_users_with_facebook_tokens)
+        entries = await asyncio.to_thread(page_token_registry.get_entries)
+
+        tokens = list({user['token'] for user in users} | {entry['access_token'] for entry in entries})
+        if not tokens:
+            return
+
+        results = await FacebookOAuth.debug_tokens(tokens, batch_size=self.batch_size)
+        summary['tokens_checked'] = len(results)
+
+        valid_user_tokens = {}
+        for user in users:
+            info = results.get(user['token'])
+            if info is None or info.get('is_valid'):
+                valid_user_tokens[user['user_id']] = user['token']
+            else:
+                summary['users_need_reauth'] += 1
+                logger.warning(f"Токен користувача {user['user_id']} недійсний - потрібна повторна авторизація")
+
+        updates = []
+        users_to_refetch = set()
+        for entry in entries:
+            info = results.get(entry['access_token'])
+            if info is None:
+                continue
+
+            expires_at = info.get('expires_at') or 0
+            token_expires_at = datetime.fromtimestamp(expires_at).isoformat() if expires_at else None
+            invalid = not info.get('is_valid')
+
+            if invalid:
+                summary['tokens_invalid'] += 1
+                users_to_refetch.add(entry['user_id'])
+
+            known_expires_at = entry['expires_at'].isoformat() if entry['expires_at'] else None
+            if invalid != bool(entry['invalid_at']) or token_expires_at != known_expires_at:
+                updates.append({
+                    'user_id': entry['user_id'],
+                    'page_id': entry['page_id'],
+                    'token_expires_at': token_expires_at,
+                    'invalid': invalid
+                })
+
+        await asyncio.to_thread(db.update_facebook_page_token_statuses, updates)
+
+        # Недійсні токени сторінок - перезапитуємо сторінки дійсним токеном користувача
+        for user_id in users_to_refetch - refreshed_users:
+            user_token = valid_user_tokens.get(user_id)
+            if not user_token:
+                continue
+            try:
+                await self._refetch_pages(user_id, user_token, summary)
+            except Exception as e:
+                summary['errors'] += 1
+                logger.warning(f"Не вдалося оновити сторінки користувача {user_id}: {str(e)}")
+
+    async def _refresh_config_token(self, summary: Dict):
+        """Оновлює токен з facebook_credentials.json (режим одного користувача)"""
+        if fb_config.is_token_expired() != "warning":
+            return
+
+        try:
+            token_info = await asyncio.to_thread(
+                fb_config.exchange_for_long_lived_token, fb_config.config['access_token']
+            )
+            fb_config.update(access_token=token_info['token'], token_expires_at=token_info['expires_at'])
+            summary['users_refreshed'] += 1
+            logger.info("✓ Токен з конфігурації оновлено завчасно")
+        except Exception as e:
+            summary['errors'] += 1
+            logger.warning(f"Не вдалося оновити токен з конфігурації: {str(e)}")
+
+
 # Глобальні екземпляри
 post_scheduler = PostScheduler()
 # Збирач аналітики з інтервалом 30 хвилин
 analytics_collector = AnalyticsCollector(check_interval=1800)
-# Генератор рекомендацій - перевірка кожні 24 години
-recommendations_scheduler = RecommendationsScheduler(check_interval=86400)
\ No newline at end of file
+# Генератор рекомендацій - за cron-розкладом (за замовчуванням понеділок о 9:00)
+recommendations_scheduler = RecommendationsScheduler(cron=os.getenv("RECOMMENDATIONS_CRON", "0 9 * * 1"))
+# Архівація старих постів - вмикається через ARCHIVE_AFTER_DAYS (0 - вимкнено)
+archive_job = ArchiveJob(older_than_days=int(os.getenv("ARCHIVE_AFTER_DAYS", "0")))
+# Завчасне оновлення та перевірка токенів Facebook - кожні 6 годин
+token_refresh_service = TokenRefreshService(
+    check_interval=int(os.getenv("TOKEN_REFRESH_INTERVAL", "21600")),
+    refresh_ahead_days=int(os.getenv("TOKEN_REFRESH_AHEAD_DAYS", "7"))
+)
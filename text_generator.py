@@ -6,27 +6,134 @@
 import asyncio
 import logging
 import json
-from typing import List, Dict
-from g4f.client import Client
-from g4f.Provider import DeepInfra
+import time
+from typing import AsyncIterator, List, Dict, Optional
+from llm_client import llm_client, LLMError
 
 logger = logging.getLogger(__name__)
 
-async def generate_post_text(prompt: str, min_length: int = 50, max_length: int = 500,
-                            max_retries: int = 3, use_recommendations: bool = True, lang: str = None) -> str:
+# Поля ai_insights для system prompt: (ключ, підпис en, підпис uk, максимум елементів списку)
+RECOMMENDATION_PROMPT_FIELDS = [
+    ('content_style', "Style", "Стиль", None),
+    ('tone', "Tone", "Тон", None),
+    ('effective_topics', "Effective topics", "Ефективні теми", 3),
+    ('key_phrases', "Key phrases", "Ключові фрази", 5),
+    ('structure_tips', "Structure", "Структура", None),
+    ('emoji_usage', "Emoji", "Емоджі", None),
+    ('call_to_action', "Call to action", "Заклики до дії", None),
+]
+
+
+def render_recommendation_context(rec: Dict, lang: str = 'uk') -> str:
     """
-    Генерує текст поста на основі промпту з урахуванням рекомендацій
+    Формує частину system prompt з рекомендацій
+
+    Args:
+        rec: рекомендації (recommendations_json)
+        lang: мова ('en' або 'uk')
+
+    Returns:
+        str: текст для додавання до system prompt
+    """
+    is_english = (lang == 'en')
+
+    if is_english:
+        context = "\n\n📊 Recommendations based on analysis of most successful posts:"
+    else:
+        context = "\n\n📊 Рекомендації на основі аналізу найуспішніших постів:"
+
+    insights = rec.get('ai_insights') or {}
+    for key, label_en, label_uk, max_items in RECOMMENDATION_PROMPT_FIELDS:
+        value = insights.get(key)
+        if not value:
+            continue
+        if max_items:
+            value = ', '.join(value[:max_items])
+        context += f"\n• {label_en if is_english else label_uk}: {value}"
+
+    # Довжина тексту з рекомендацій
+    if rec.get('text_length'):
+        label = "Optimal length" if is_english else "Оптимальна довжина"
+        chars = "characters" if is_english else "символів"
+        context += f"\n• {label}: {rec['text_length']['min']}-{rec['text_length']['max']} {chars}"
+
+    return context
+
+
+class RecommendationContextCache:
+    """
+    Готовий контекст рекомендацій для system prompt, по ID рекомендації та мові
+
+    Контекст будується одразу при збереженні нової рекомендації (через
+    слухача Database.save_recommendation). Кожне звернення звіряє ID з
+    db.get_latest_recommendation() (кешованим у Database) і перебудовує
+    контекст, лише коли ID змінився - тож відновлення з резервної копії чи
+    запис з іншого процесу теж підхоплюються.
+    """
+
+    def __init__(self):
+        self.latest_id = None
+        self.latest = None
+        self.contexts: Dict[tuple, str] = {}
+
+    def on_recommendation_saved(self, recommendation_id: int, recommendations: Dict,
+                                user_id: Optional[int] = None, page_id: Optional[str] = None):
+        """Слухач збереження рекомендації - одразу будує контекст для обох мов"""
+        # Генерація тексту використовує загальну рекомендацію
+        if user_id is not None or page_id is not None:
+            return
+
+        contexts = {
+            (recommendation_id, lang): render_recommendation_context(recommendations, lang)
+            for lang in ('uk', 'en')
+        }
+        self.latest_id = recommendation_id
+        self.latest = recommendations
+        self.contexts = contexts
+
+    def get(self, lang: str) -> str:
+        """Повертає контекст останньої рекомендації ('' якщо рекомендацій немає)"""
+        from database import db
+
+        recommendation = db.get_latest_recommendation()
+        if not recommendation or not recommendation.get('recommendations'):
+            return ''
+
+        if recommendation['id'] != self.latest_id:
+            self.on_recommendation_saved(recommendation['id'], recommendation['recommendations'])
+
+        key = (self.latest_id, lang)
+        if key not in self.contexts:
+            self.contexts[key] = render_recommendation_context(self.latest, lang)
+        return self.contexts[key]
+
+
+# Кеш контексту рекомендацій; оновлюється при кожному збереженні рекомендації
+recommendation_contexts = RecommendationContextCache()
+
+
+def _register_recommendation_listener():
+    from database import db
+    db.add_recommendation_listener(recommendation_contexts.on_recommendation_saved)
+
+
+_register_recommendation_listener()
+
+
+def _build_generation_messages(prompt: str, min_length: int, max_length: int,
+                               use_recommendations: bool, lang: str = None) -> List[Dict]:
+    """
+    Формує повідомлення для генерації поста (system prompt з рекомендаціями + промпт)
 
     Args:
         prompt: тема або промпт для генерації
         min_length: мінімальна довжина тексту
         max_length: максимальна довжина тексту
-        max_retries: кількість спроб
         use_recommendations: використовувати рекомендації AI
         lang: мова ('en' або 'uk'), якщо None - визначається автоматично
 
     Returns:
-        str: згенерований текст
+        List[Dict]: повідомлення у форматі chat completions
     """
 
     # Визначаємо мову
@@ -46,150 +153,123 @@ async def generate_post_text(prompt: str, min_length: int = 50, max_length: int
     else:
         system_content = f"Ти - генератор текстів для постів у Facebook українською мовою. Пиши змістовні пости довжиною від {min_length} до {max_length} символів."
 
-    # Якщо ввімкнено рекомендації, завантажуємо та додаємо їх
+    # Якщо ввімкнено рекомендації, додаємо готовий контекст останньої рекомендації
     if use_recommendations:
         try:
-            from database import db
-            recommendation = db.get_latest_recommendation()
-
-            if recommendation and recommendation.get('recommendations'):
-                rec = recommendation['recommendations']
-
-                # Додаємо інформацію з рекомендацій до system prompt
-                if is_english:
-                    system_content += "\n\n📊 Recommendations based on analysis of most successful posts:"
-                else:
-                    system_content += "\n\n📊 Рекомендації на основі аналізу найуспішніших постів:"
-
-                # Стиль контенту
-                if rec.get('ai_insights') and rec['ai_insights'].get('content_style'):
-                    label = "Style" if is_english else "Стиль"
-                    system_content += f"\n• {label}: {rec['ai_insights']['content_style']}"
-
-                # Тон
-                if rec.get('ai_insights') and rec['ai_insights'].get('tone'):
-                    label = "Tone" if is_english else "Тон"
-                    system_content += f"\n• {label}: {rec['ai_insights']['tone']}"
-
-                # Ефективні теми
-                if rec.get('ai_insights') and rec['ai_insights'].get('effective_topics'):
-                    topics = ', '.join(rec['ai_insights']['effective_topics'][:3])
-                    label = "Effective topics" if is_english else "Ефективні теми"
-                    system_content += f"\n• {label}: {topics}"
-
-                # Ключові фрази
-                if rec.get('ai_insights') and rec['ai_insights'].get('key_phrases'):
-                    phrases = ', '.join(rec['ai_insights']['key_phrases'][:5])
-                    label = "Key phrases" if is_english else "Ключові фрази"
-                    system_content += f"\n• {label}: {phrases}"
-
-                # Структура
-                if rec.get('ai_insights') and rec['ai_insights'].get('structure_tips'):
-                    label = "Structure" if is_english else "Структура"
-                    system_content += f"\n• {label}: {rec['ai_insights']['structure_tips']}"
-
-                # Емоджі
-                if rec.get('ai_insights') and rec['ai_insights'].get('emoji_usage'):
-                    label = "Emoji" if is_english else "Емоджі"
-                    system_content += f"\n• {label}: {rec['ai_insights']['emoji_usage']}"
-
-                # Заклики до дії
-                if rec.get('ai_insights') and rec['ai_insights'].get('call_to_action'):
-                    label = "Call to action" if is_english else "Заклики до дії"
-                    system_content += f"\n• {label}: {rec['ai_insights']['call_to_action']}"
-
-                # Довжина тексту з рекомендацій
-                if rec.get('text_length'):
-                    rec_min = rec['text_length']['min']
-                    rec_max = rec['text_length']['max']
-                    label = "Optimal length" if is_english else "Оптимальна довжина"
-                    chars = "characters" if is_english else "символів"
-                    system_content += f"\n• {label}: {rec_min}-{rec_max} {chars}"
-
+            context = recommendation_contexts.get('en' if is_english else 'uk')
+            if context:
+                system_content += context
                 logger.info("✓ Рекомендації додано до промпту для генерації")
-
         except Exception as e:
             logger.warning(f"Не вдалося завантажити рекомендації: {str(e)}")
             # Продовжуємо без рекомендацій
-    
-    for attempt in range(max_retries):
-        try:
-            logger.info(f"Спроба генерації {attempt + 1}/{max_retries}")
-            
-            client = Client(provider=DeepInfra)
-            response = await asyncio.to_thread(
-                client.chat.completions.create,
-                model="Qwen/Qwen3-Coder-30B-A3B-Instruct",
-                messages=[
-                    {"role": "system", "content": system_content},
-                    {"role": "user", "content": prompt}
-                ],
-                web_search=False
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            if not content:
-                logger.warning("Отримано порожню відповідь")
-                if attempt < max_retries - 1:
-                    await asyncio.sleep(2)
-                    continue
-                return "[Помилка: порожня відповідь]"
-            
-            logger.info(f"✓ Згенеровано текст довжиною {len(content)} символів")
-            return content
-            
-        except Exception as e:
-            logger.error(f"Помилка в спробі {attempt + 1}: {str(e)}")
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2)
-            else:
-                return f"[Помилка генерації: {str(e)}]"
-    
-    return "[Не вдалося згенерувати текст]"
 
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def generate_post_text(prompt: str, min_length: int = 50, max_length: int = 500,
+                            max_retries: int = 3, use_recommendations: bool = True, lang: str = None,
+                            fresh: bool = False, raise_errors: bool = False) -> str:
+    """
+    Генерує текст поста на основі промпту з урахуванням рекомендацій
+
+    Args:
+        prompt: тема або промпт для генерації
+        min_length: мінімальна довжина тексту
+        max_length: максимальна довжина тексту
+        max_retries: кількість спроб
+        use_recommendations: використовувати рекомендації AI
+        lang: мова ('en' або 'uk'), якщо None - визначається автоматично
+        fresh: не брати відповідь з кешу (новий варіант тексту)
+        raise_errors: передавати помилку викликачу замість тексту "[Помилка генерації: ...]"
+
+    Returns:
+        str: згенерований текст
+
+    Raises:
+        LLMError: якщо raise_errors і генерацію не вдалося виконати
+    """
+    messages = _build_generation_messages(prompt, min_length, max_length, use_recommendations, lang)
 
-def analyze_successful_posts_sync(top_posts: List[Dict], lang: str = 'uk') -> Dict:
-    """Синхронна версія аналізу постів"""
     try:
-        from g4f.client import Client
-        from g4f.Provider import DeepInfra
+        content = await llm_client.complete(messages, max_retries=max_retries, use_cache=not fresh)
+    except LLMError as e:
+        logger.error(f"Помилка генерації: {str(e)}")
+        if raise_errors:
+            raise
+        return f"[Помилка генерації: {str(e)}]"
 
-        if not top_posts or len(top_posts) < 3:
-            error_msg = 'Need at least 3 posts' if lang == 'en' else 'Потрібно мінімум 3 пости'
-            return {'success': False, 'error': error_msg}
+    logger.info(f"✓ Згенеровано текст довжиною {len(content)} символів")
+    return content
 
-        logger.info(f"AI-аналіз {len(top_posts)} постів...")
 
-        # Detect language from post content
-        if lang == 'auto':
-            sample_text = ' '.join([p.get('content', '')[:100] for p in top_posts[:3]])
-            en_indicators = ['the', 'and', 'for', 'with', 'our', 'your', 'this', 'that', 'are', 'was', 'were', 'have', 'has', 'been']
-            lang = 'en' if any(f' {word} ' in f' {sample_text.lower()} ' for word in en_indicators) else 'uk'
+async def stream_post_text(prompt: str, min_length: int = 50, max_length: int = 500,
+                           use_recommendations: bool = True, lang: str = None,
+                           fresh: bool = False) -> AsyncIterator[str]:
+    """
+    Потокова генерація тексту поста - частини тексту повертаються по мірі генерації
 
-        posts_data = []
-        for i, post in enumerate(top_posts[:10], 1):
-            if lang == 'en':
-                posts_data.append({
-                    'number': i,
-                    'text': post.get('content', '')[:200],
-                    'length': post.get('text_length', 0),
-                    'engagement_rate': round(post.get('avg_engagement_rate', 0), 4),
-                    'likes': post.get('total_likes', 0),
-                    'comments': post.get('total_comments', 0)
-                })
-            else:
-                posts_data.append({
-                    'номер': i,
-                    'текст': post.get('content', '')[:200],
-                    'довжина': post.get('text_length', 0),
-                    'engagement_rate': round(post.get('avg_engagement_rate', 0), 4),
-                    'лайки': post.get('total_likes', 0),
-                    'коментарі': post.get('total_comments', 0)
-                })
+    Параметри як у generate_post_text. Час до першого токена та загальний
+    час генерації пишуться в лог.
+
+    Raises:
+        LLMError: якщо генерацію не вдалося виконати
+    """
+    messages = _build_generation_messages(prompt, min_length, max_length, use_recommendations, lang)
+
+    start = time.perf_counter()
+    first_token_at = None
+    length = 0
 
+    async for chunk in llm_client.stream(messages, use_cache=not fresh):
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            logger.info(f"Час до першого токена: {(first_token_at - start) * 1000:.0f} мс")
+        length += len(chunk)
+        yield chunk
+
+    logger.info(f"✓ Згенеровано текст довжиною {length} символів за {(time.perf_counter() - start) * 1000:.0f} мс")
+
+
+def _build_analysis_messages(top_posts: List[Dict], lang: str) -> tuple:
+    """
+    Формує повідомлення для AI-аналізу топ-постів
+
+    Returns:
+        tuple: (messages, кількість постів у промпті)
+    """
+    # Detect language from post content
+    if lang == 'auto':
+        sample_text = ' '.join([p.get('content', '')[:100] for p in top_posts[:3]])
+        en_indicators = ['the', 'and', 'for', 'with', 'our', 'your', 'this', 'that', 'are', 'was', 'were', 'have', 'has', 'been']
+        lang = 'en' if any(f' {word} ' in f' {sample_text.lower()} ' for word in en_indicators) else 'uk'
+
+    posts_data = []
+    for i, post in enumerate(top_posts[:10], 1):
         if lang == 'en':
-            prompt = f"""Analyze {len(posts_data)} most successful posts:
+            posts_data.append({
+                'number': i,
+                'text': post.get('content', '')[:200],
+                'length': post.get('text_length', 0),
+                'engagement_rate': round(post.get('avg_engagement_rate', 0), 4),
+                'likes': post.get('total_likes', 0),
+                'comments': post.get('total_comments', 0)
+            })
+        else:
+            posts_data.append({
+                'номер': i,
+                'текст': post.get('content', '')[:200],
+                'довжина': post.get('text_length', 0),
+                'engagement_rate': round(post.get('avg_engagement_rate', 0), 4),
+                'лайки': post.get('total_likes', 0),
+                'коментарі': post.get('total_comments', 0)
+            })
+
+    if lang == 'en':
+        prompt = f"""Analyze {len(posts_data)} most successful posts:
 
 {json.dumps(posts_data, ensure_ascii=False, indent=2)}
 
@@ -203,9 +283,9 @@ Respond ONLY with JSON:
   "emoji_usage": "how to use",
   "call_to_action": "recommendations"
 }}"""
-            system_msg = "You are a content analysis expert. Respond ONLY with JSON."
-        else:
-            prompt = f"""Проаналізуй {len(posts_data)} найуспішніших постів:
+        system_msg = "You are a content analysis expert. Respond ONLY with JSON."
+    else:
+        prompt = f"""Проаналізуй {len(posts_data)} найуспішніших постів:
 
 {json.dumps(posts_data, ensure_ascii=False, indent=2)}
 
@@ -219,27 +299,75 @@ Respond ONLY with JSON:
   "emoji_usage": "як",
   "call_to_action": "чи потрібні"
 }}"""
-            system_msg = "Ти експерт з аналізу контенту. Відповідай ТІЛЬКИ JSON."
-
-        client = Client(provider=DeepInfra)
-        response = client.chat.completions.create(
-            model="Qwen/Qwen3-Coder-30B-A3B-Instruct",
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": prompt}
-            ],
-            web_search=False
-        )
+        system_msg = "Ти експерт з аналізу контенту. Відповідай ТІЛЬКИ JSON."
+
+    messages = [
+        {"role": "system", "content": system_msg},
+        {"role": "user", "content": prompt}
+    ]
+    return messages, len(posts_data)
+
+
+def analyze_successful_posts_sync(top_posts: List[Dict], lang: str = 'uk') -> Dict:
+    """Синхронна версія аналізу постів"""
+    try:
+        if not top_posts or len(top_posts) < 3:
+            error_msg = 'Need at least 3 posts' if lang == 'en' else 'Потрібно мінімум 3 пости'
+            return {'success': False, 'error': error_msg}
+
+        logger.info(f"AI-аналіз {len(top_posts)} постів...")
+
+        messages, posts_count = _build_analysis_messages(top_posts, lang)
+        ai_response = llm_client.complete_sync(messages, cache_if=_parse_ai_response)
+        ai_analysis = _parse_ai_response(ai_response)
+
+        if ai_analysis:
+            logger.info("✓ AI-аналіз завершено")
+            return {'success': True, 'analysis': ai_analysis, 'analyzed_posts_count': posts_count}
+        else:
+            return {'success': False, 'error': 'Помилка парсингу'}
+
+    except Exception as e:
+        logger.error(f"Помилка AI-аналізу: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
+async def analyze_top_posts(top_posts: List[Dict], lang: str = 'uk',
+                            timeout: Optional[float] = None) -> Dict:
+    """
+    Асинхронна версія analyze_successful_posts_sync - не блокує event loop
 
-        ai_response = response.choices[0].message.content.strip()
+    Args:
+        top_posts: список топ-постів з метриками
+        lang: мова аналізу ('en', 'uk' або 'auto')
+        timeout: загальний ліміт часу на AI-аналіз у секундах (None - без ліміту)
+
+    Returns:
+        Dict: {'success': bool, 'analysis': {...}} або {'success': False, 'error': ...}
+    """
+    try:
+        if not top_posts or len(top_posts) < 3:
+            error_msg = 'Need at least 3 posts' if lang == 'en' else 'Потрібно мінімум 3 пости'
+            return {'success': False, 'error': error_msg}
+
+        logger.info(f"AI-аналіз {len(top_posts)} постів...")
+
+        messages, posts_count = _build_analysis_messages(top_posts, lang)
+        # Нерозібрана відповідь не кешується, тож наступний запуск запитає AI знову
+        ai_response = await asyncio.wait_for(
+            llm_client.complete(messages, cache_if=_parse_ai_response), timeout=timeout
+        )
         ai_analysis = _parse_ai_response(ai_response)
 
         if ai_analysis:
             logger.info("✓ AI-аналіз завершено")
-            return {'success': True, 'analysis': ai_analysis, 'analyzed_posts_count': len(posts_data)}
+            return {'success': True, 'analysis': ai_analysis, 'analyzed_posts_count': posts_count}
         else:
             return {'success': False, 'error': 'Помилка парсингу'}
 
+    except asyncio.TimeoutError:
+        logger.warning(f"AI-аналіз перевищив {timeout} с")
+        return {'success': False, 'error': f'Перевищено час AI-аналізу ({timeout} с)'}
     except Exception as e:
         logger.error(f"Помилка AI-аналізу: {str(e)}")
         return {'success': False, 'error': str(e)}
@@ -310,24 +438,16 @@ async def analyze_successful_posts(top_posts: List[Dict]) -> Dict:
 Відповідай ЛИШЕ JSON, без markdown, без пояснень!"""
 
         # Викликаємо AI
-        client = Client(provider=DeepInfra)
-        response = await asyncio.to_thread(
-            client.chat.completions.create,
-            model="Qwen/Qwen3-Coder-30B-A3B-Instruct",
-            messages=[
-                {
-                    "role": "system", 
-                    "content": "Ти - експерт з аналізу контенту соціальних мереж. Аналізуй пости та давай структуровані рекомендації у форматі JSON. Відповідай ТІЛЬКИ валідним JSON без додаткового тексту."
-                },
-                {
-                    "role": "user", 
-                    "content": prompt
-                }
-            ],
-            web_search=False
-        )
-        
-        ai_response = response.choices[0].message.content.strip()
+        ai_response = await llm_client.complete([
+            {
+                "role": "system", 
+                "content": "Ти - експерт з аналізу контенту соціальних мереж. Аналізуй пости та давай структуровані рекомендації у форматі JSON. Відповідай ТІЛЬКИ валідним JSON без додаткового тексту."
+            },
+            {
+                "role": "user", 
+                "content": prompt
+            }
+        ], cache_if=_parse_ai_response)
         logger.info(f"Отримано відповідь від AI: {ai_response[:200]}...")
         
         # Парсимо JSON відповідь
@@ -0,0 +1,255 @@
+"""
+Спільний таймер фонових задач
+
+Замість окремих циклів з фіксованим sleep кожна задача реєструє розклад
+(інтервал або cron-вираз). Таймер тримає купу (heap) за часом наступного
+запуску і спить рівно до найближчого, тож задача з розкладом "понеділок 9:00"
+не пропускає своє вікно, а стан усіх задач доступний для адмін-ендпоінта.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Найдовший безперервний сон таймера (с): після нього час наступного запуску
+# звіряється з годинником знову (переведення годинника, сон ноутбука)
+MAX_SLEEP = 300
+
+
+class IntervalSchedule:
+    """Запуск кожні N секунд"""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def next_after(self, moment: datetime) -> datetime:
+        return moment + timedelta(seconds=self.seconds)
+
+    def describe(self) -> str:
+        return f"every {int(self.seconds)}s"
+
+
+class CronSchedule:
+    """
+    Cron-вираз з п'яти полів: хвилина, година, день місяця, місяць, день тижня
+
+    Підтримуються *, числа, діапазони (1-5), списки (1,15) та кроки (*/15, 8-18/2).
+    День тижня: 0 або 7 - неділя, 1 - понеділок. Як і в cron, якщо обмежені
+    і день місяця, і день тижня, достатньо збігу будь-якого з них.
+    """
+
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron-вираз має містити 5 полів: {expression!r}")
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.FIELD_RANGES)
+        )
+        # 7 -> 0 (неділя) та перехід до нумерації datetime.weekday() (0 - понеділок)
+        self.weekdays = {(day % 7 - 1) % 7 for day in weekdays}
+        self.days_restricted = fields[2] != '*'
+        self.weekdays_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(','):
+            value_range, _, step = part.partition('/')
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(value) for value in value_range.split('-', 1))
+            else:
+                start = end = int(value_range)
+                if step:
+                    end = high
+
+            if not (low <= start <= end <= high):
+                raise ValueError(f"Значення поза межами {low}-{high}: {part!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        day_match = day.day in self.days
+        weekday_match = day.weekday() in self.weekdays
+        if self.days_restricted and self.weekdays_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_after(self, moment: datetime) -> datetime:
+        """Найближчий момент розкладу, строго пізніший за moment"""
+        start = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+
+        # Перебір днів (не більше 5 років), у підходящому дні - годин і хвилин
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+
+        raise ValueError(f"Cron-вираз ніколи не спрацьовує: {self.expression!r}")
+
+    def previous_at_or_before(self, moment: datetime) -> datetime:
+        """Останній момент розкладу, не пізніший за moment (для перевірки пропущених запусків)"""
+        end = moment.replace(second=0, microsecond=0)
+        day = end.replace(hour=0, minute=0)
+
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in sorted(self.hours, reverse=True):
+                    for minute in sorted(self.minutes, reverse=True):
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate <= end:
+                            return candidate
+            day -= timedelta(days=1)
+
+        raise ValueError(f"Cron-вираз ніколи не спрацьовує: {self.expression!r}")
+
+    def describe(self) -> str:
+        return f"cron {self.expression}"
+
+
+class TimerJob:
+    """Зареєстрована задача таймера та її стан"""
+
+    def __init__(self, name: str, schedule, callback: Callable[[], Awaitable], next_run: datetime):
+        self.name = name
+        self.schedule = schedule
+        self.callback = callback
+        self.next_run = next_run
+        self.last_run: Optional[datetime] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'schedule': self.schedule.describe(),
+            'next_run': self.next_run.isoformat(),
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'last_duration': round(self.last_duration, 3) if self.last_duration is not None else None,
+            'last_error': self.last_error,
+            'runs': self.runs,
+            'running': self.running
+        }
+
+
+class TimerService:
+    """Один цикл asyncio для всіх періодичних задач: heap (час запуску, задача)"""
+
+    def __init__(self):
+        self.jobs: Dict[str, TimerJob] = {}
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self.is_running = False
+
+    def register(self, name: str, schedule, callback: Callable[[], Awaitable],
+                 run_immediately: bool = False) -> TimerJob:
+        """
+        Реєструє задачу (повторна реєстрація з тим самим ім'ям замінює розклад)
+
+        Args:
+            name: унікальна назва задачі
+            schedule: IntervalSchedule або CronSchedule
+            callback: корутинна функція без аргументів
+            run_immediately: перший запуск одразу після старту таймера
+        """
+        now = datetime.now()
+        job = TimerJob(name, schedule, callback, now if run_immediately else schedule.next_after(now))
+        self.jobs[name] = job
+        self._push(job)
+        logger.info(f"Таймер: {name} ({schedule.describe()}), наступний запуск {job.next_run:%Y-%m-%d %H:%M:%S}")
+        return job
+
+    def _push(self, job: TimerJob):
+        heapq.heappush(self._heap, (job.next_run, next(self._counter), job))
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def _run_job(self, job: TimerJob):
+        started = time.perf_counter()
+        job.last_run = datetime.now()
+        try:
+            await job.callback()
+            job.last_error = None
+        except Exception as e:
+            job.last_error = str(e)
+            logger.error(f"Помилка задачі таймера {job.name}: {str(e)}")
+        finally:
+            job.last_duration = time.perf_counter() - started
+            job.runs += 1
+
+    def _fire(self, job: TimerJob, now: datetime):
+        if job.running:
+            logger.warning(f"Задача {job.name} ще виконується - запуск о {job.next_run:%H:%M:%S} пропущено")
+        else:
+            job.task = asyncio.create_task(self._run_job(job))
+
+        job.next_run = job.schedule.next_after(now)
+        self._push(job)
+
+    async def start(self):
+        """Запускає таймер: спить до найближчого запуску, запускає задачу у фоні"""
+        self.is_running = True
+        self._wakeup = asyncio.Event()
+        logger.info(f"Таймер фонових задач запущено ({len(self.jobs)} задач)")
+
+        while self.is_running:
+            now = datetime.now()
+
+            # Прострочені задачі - запуск; застарілі записи heap (після перереєстрації) - відкидаємо
+            while self._heap and self._heap[0][0] <= now:
+                next_run, _, job = heapq.heappop(self._heap)
+                if self.jobs.get(job.name) is job and job.next_run == next_run:
+                    self._fire(job, now)
+
+            delay = MAX_SLEEP
+            if self._heap:
+                delay = min(delay, max((self._heap[0][0] - datetime.now()).total_seconds(), 0))
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        """Зупиняє таймер та задачі, що виконуються"""
+        self.is_running = False
+        for job in self.jobs.values():
+            if job.running:
+                job.task.cancel()
+        if self._wakeup:
+            self._wakeup.set()
+        logger.info("Таймер фонових задач зупинено")
+
+    def get_jobs(self) -> List[Dict]:
+        """Стан задач, впорядкований за часом наступного запуску"""
+        return [job.to_dict() for job in sorted(self.jobs.values(), key=lambda job: job.next_run)]
+
+
+# Глобальний таймер фонових задач
+timer_service = TimerService()